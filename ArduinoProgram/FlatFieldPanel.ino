@@ -1,8 +1,12 @@
 /*
  * Arduino_Firmware_Digital_LED.ino
  * Based on code Copyright (C) 2022 - Present, Julien Lecomte
- * Modifications for simple On/Off LED control using digitalWrite,
- * limited close angle (min 20 degrees), specified pins (Servo:6, LED:9).
+ * Modifications for PWM LED brightness control (v1.7; on/off with digitalWrite
+ * before), limited close angle (min 20 degrees), specified pins (Servo:6, LED:3).
+ * Moves run as a millis()-driven state machine with a trapezoidal speed
+ * profile, so serial commands (including STOP) are served during a move.
+ * COMMAND:BINARY:1 switches to short CRC-8 checked frames (see protocol.py);
+ * any ASCII command switches back.
  * Licensed under the MIT License.
  */
 
@@ -10,11 +14,18 @@
 
 // --- Configuration ---
 #define SERVO_PIN 6      // Servo pin
-#define LED_PIN 9        // LED pin (using digitalWrite, no PWM conflict)
+#define LED_PIN 3        // LED pin, PWM on Timer2. Not 9 or 10: the Servo library takes Timer1 and disables PWM there
+#define MAX_BRIGHTNESS 255 // PWM duty of a fully lit LED; also the level after a reset
 #define MIN_ANGLE 20     // Minimum allowed angle (Closed Position)
 #define MAX_ANGLE 180    // Maximum allowed angle (Open Position)
 #define BAUD_RATE 57600
-#define MOVEMENT_DELAY 20 // Milliseconds delay between servo steps
+#define MAX_SPEED 100.0   // Cruise speed of a move, degrees per second
+#define ACCELERATION 250.0 // Degrees per second squared at the start and end of a move (0 = constant MAX_SPEED)
+#define MOTION_INTERVAL 10 // Milliseconds between servo updates while moving
+#define TELEMETRY_EVERY 1 // While telemetry is on, send a sample every N degrees of a move
+#define LINE_BUFFER_SIZE 64 // Longest command line kept; extra characters are dropped
+#define FIRMWARE_MAJOR 1 // Version sent in a binary INFO reply; keep in step with RESULT_INFO
+#define FIRMWARE_MINOR 7
 
 // --- Communication Protocol (Commands, Results, Errors remain the same) ---
 constexpr auto DEVICE_GUID = "b45ba2c9-f554-4b4e-a43c-10605ca3b84d";
@@ -25,34 +36,103 @@ constexpr auto COMMAND_GETSTATE = "COMMAND:GETSTATE";
 constexpr auto COMMAND_OPEN = "COMMAND:OPEN";
 constexpr auto COMMAND_CLOSE = "COMMAND:CLOSE";
 constexpr auto COMMAND_SETPOS_PREFIX = "COMMAND:SETPOS:";
-constexpr auto COMMAND_SETLED_PREFIX = "COMMAND:SETLED:"; // Expects 0=Off, non-zero=On
+constexpr auto COMMAND_SETLED_PREFIX = "COMMAND:SETLED:"; // Expects 0=Off, non-zero=On, then optionally :<brightness 0-255>
 constexpr auto COMMAND_GETSTATUS = "COMMAND:GETSTATUS";
+constexpr auto COMMAND_TELEMETRY_PREFIX = "COMMAND:TELEMETRY:"; // 0=Off (default), non-zero=On
+constexpr auto COMMAND_STOP = "COMMAND:STOP"; // Stops a move where it is
+constexpr auto COMMAND_ABORT = "COMMAND:ABORT"; // Same as COMMAND_STOP
+constexpr auto COMMAND_BINARY_PREFIX = "COMMAND:BINARY:"; // 1 = binary frames, 0 = ASCII (default)
 
 constexpr auto RESULT_PING = "RESULT:PING:OK:";
-constexpr auto RESULT_INFO = "RESULT:DarkSkyGeek's Telescope Cover Firmware v1.5-DigitalLED"; // Updated version
+constexpr auto RESULT_INFO = "RESULT:DarkSkyGeek's Telescope Cover Firmware v1.7-PWMLED"; // Updated version
 constexpr auto RESULT_STATE_UNKNOWN = "RESULT:STATE:UNKNOWN";
 constexpr auto RESULT_STATE_OPEN = "RESULT:STATE:OPEN";
 constexpr auto RESULT_STATE_CLOSED = "RESULT:STATE:CLOSED";
 constexpr auto RESULT_STATE_MOVING = "RESULT:STATE:MOVING";
-constexpr auto RESULT_STATUS_PREFIX = "RESULT:STATUS:"; // Reports <angle>:<0 or 1>
+constexpr auto RESULT_STATUS_PREFIX = "RESULT:STATUS:"; // Reports <angle>:<0 or 1>:<brightness>
 constexpr auto RESULT_OK = "RESULT:OK";
+constexpr auto RESULT_MOVE_START = "RESULT:MOVE:START:"; // <from>:<to>:<planned milliseconds>, after MOVING
+constexpr auto RESULT_MOVE_DONE = "RESULT:MOVE:DONE:"; // <angle>; the move's status line follows
+constexpr auto RESULT_MOVE_STOPPED = "RESULT:MOVE:STOPPED:"; // <angle>; stopped by STOP or a new move, status follows
+constexpr auto RESULT_BINARY_PREFIX = "RESULT:BINARY:"; // <0 or 1>, always sent in ASCII
+constexpr auto TELEMETRY_PREFIX = "T:"; // T:<millis>:<angle>:<0 or 1>, only during moves with telemetry on
 
 constexpr auto ERROR_INVALID_COMMAND = "ERROR:INVALID_COMMAND";
 constexpr auto ERROR_INVALID_ARGUMENT = "ERROR:INVALID_ARGUMENT";
 constexpr auto ERROR_OUT_OF_RANGE = "ERROR:OUT_OF_RANGE";
+constexpr auto ERROR_BAD_FRAME = "ERROR:BAD_FRAME";
+
+// --- Binary frames (little-endian, CRC-8 polynomial 0x07 over everything between sync and CRC) ---
+// Command: sync, command byte, int16 argument, CRC. Reply: sync, type, int16 a, int16 b, uint32 c, CRC.
+#define FRAME_SYNC 0xA5 // Never part of ASCII, so it marks the start of a frame
+#define FRAME_COMMAND_SIZE 5
+#define FRAME_REPLY_SIZE 11
+#define GUID_PREFIX 0xB45BA2C9UL // First 32 bits of DEVICE_GUID, sent in a PING reply
+
+// Command bytes; M, L and T take the argument
+#define FRAME_PING 'P'
+#define FRAME_INFO 'I'
+#define FRAME_GETSTATE 'E'
+#define FRAME_GETSTATUS 'S'
+#define FRAME_OPEN 'O'
+#define FRAME_CLOSE 'C'
+#define FRAME_STOP 'H'
+#define FRAME_SETPOS 'M'
+#define FRAME_SETLED 'L'
+#define FRAME_TELEMETRY 'T'
+#define FRAME_SETLED_LEVEL 'B' // Argument = on << 8 | brightness
+
+// Reply types
+#define REPLY_PING 'P'        // c = GUID_PREFIX
+#define REPLY_INFO 'I'        // a.b = version
+#define REPLY_STATE 'E'       // a = STATE_*
+#define REPLY_STATUS 'S'      // a = angle, b = LED requested, c = FRAME_LEVEL_PRESENT | brightness
+#define REPLY_OK 'K'
+#define REPLY_ERROR 'X'       // a = FRAME_ERROR_*; b, c = requested, actual for OUT_OF_RANGE
+#define REPLY_SAMPLE 'T'      // a = angle, b = LED requested, c = millis
+#define REPLY_MOVE_START 'G'  // a = from, b = to, c = planned milliseconds
+#define REPLY_MOVE_END 'D'    // a = angle, b = 1 if stopped
+
+#define FRAME_LEVEL_PRESENT 0x100 // Tells the host the status carries a brightness (v1.7)
+
+#define STATE_OPEN 1
+#define STATE_CLOSED 2
+#define STATE_MOVING 3
+
+#define FRAME_ERROR_INVALID_COMMAND 1 // b = the unknown command byte
+#define FRAME_ERROR_INVALID_ARGUMENT 2
+#define FRAME_ERROR_OUT_OF_RANGE 3
+#define FRAME_ERROR_BAD_FRAME 4
 
 // --- Global Variables ---
 Servo servo;
 int currentAngle = MIN_ANGLE;
 int targetAngle = MIN_ANGLE;
 bool isLedOnRequested = false; // Tracks if the user wants the LED on (when allowed)
+uint8_t ledLevel = MAX_BRIGHTNESS; // PWM duty used whenever the LED is lit
 bool isMoving = false;
+bool isTelemetryOn = false; // Off after every reset, so plain hosts never see samples
+String inputLine; // Command characters received so far
+bool binaryMode = false; // Replies go out as frames; set by COMMAND:BINARY:1 or any valid frame
+uint8_t frame[FRAME_COMMAND_SIZE]; // Command frame received so far
+uint8_t frameLength = 0;
+
+// --- Motion state (valid while isMoving) ---
+int moveStartAngle = MIN_ANGLE;
+unsigned long moveStartMs = 0;
+unsigned long lastMotionMs = 0;
+unsigned long moveDurationMs = 0;
+float moveDistance = 0; // Degrees
+float accelTime = 0; // Seconds spent accelerating (and again decelerating)
+float cruiseTime = 0; // Seconds at peakSpeed
+float peakSpeed = 0; // Degrees per second
 
 // --- Setup ---
 void setup() {
     Serial.begin(BAUD_RATE);
     while (!Serial) { ; }
     Serial.flush();
+    inputLine.reserve(LINE_BUFFER_SIZE);
 
     // Initialize LED pin as output
     pinMode(LED_PIN, OUTPUT);
@@ -67,47 +147,113 @@ void setup() {
 }
 
 // --- Main Loop ---
+// Never blocks: serial input is collected as it arrives and a move advances by the clock
 void loop() {
-    if (Serial.available() > 0) {
-        String command = Serial.readStringUntil('\n');
-        command.trim();
+    readSerial();
+    if (isMoving) updateMotion();
+}
+
+void readSerial() {
+    while (Serial.available() > 0) {
+        uint8_t c = Serial.read();
+        if (frameLength > 0 || c == FRAME_SYNC) {
+            if (frameLength == 0) inputLine = ""; // A partial line before a frame is noise
+            frame[frameLength++] = c;
+            if (frameLength == FRAME_COMMAND_SIZE) {
+                frameLength = 0;
+                handleFrame();
+            }
+        } else if (c == '\n') {
+            inputLine.trim();
+            if (inputLine.length() > 0) binaryMode = false; // Any ASCII command switches the replies back
+            handleCommand(inputLine);
+            inputLine = "";
+        } else if (inputLine.length() < LINE_BUFFER_SIZE) {
+            inputLine += (char)c;
+        }
+    }
+}
 
-        if (command == COMMAND_PING) handlePing();
-        else if (command == COMMAND_INFO) sendFirmwareInfo();
-        else if (command == COMMAND_GETSTATE) sendAscomState();
-        else if (command == COMMAND_GETSTATUS) sendStatus();
-        else if (command == COMMAND_OPEN) moveToPosition(MAX_ANGLE);
-        else if (command == COMMAND_CLOSE) moveToPosition(MIN_ANGLE);
-        else if (command.startsWith(COMMAND_SETPOS_PREFIX)) handleSetPosition(command);
-        else if (command.startsWith(COMMAND_SETLED_PREFIX)) handleSetLed(command);
-        else if (command.length() > 0) handleInvalidCommand(command);
+void handleCommand(String command) {
+    if (command == COMMAND_PING) handlePing();
+    else if (command == COMMAND_INFO) sendFirmwareInfo();
+    else if (command == COMMAND_GETSTATE) sendAscomState();
+    else if (command == COMMAND_GETSTATUS) sendStatus();
+    else if (command == COMMAND_OPEN) moveToPosition(MAX_ANGLE);
+    else if (command == COMMAND_CLOSE) moveToPosition(MIN_ANGLE);
+    else if (command == COMMAND_STOP || command == COMMAND_ABORT) handleStop();
+    else if (command.startsWith(COMMAND_SETPOS_PREFIX)) handleSetPosition(command);
+    else if (command.startsWith(COMMAND_SETLED_PREFIX)) handleSetLed(command);
+    else if (command.startsWith(COMMAND_TELEMETRY_PREFIX)) handleSetTelemetry(command);
+    else if (command.startsWith(COMMAND_BINARY_PREFIX)) handleSetBinary(command);
+    else if (command.length() > 0) handleInvalidCommand(command);
+}
+
+// Same commands as handleCommand(), from a complete binary frame
+void handleFrame() {
+    if (crc8(frame + 1, FRAME_COMMAND_SIZE - 2) != frame[FRAME_COMMAND_SIZE - 1]) {
+        // Answered in the current mode: line noise starting with 0xA5 must not switch an ASCII session
+        if (binaryMode) sendFrame(REPLY_ERROR, FRAME_ERROR_BAD_FRAME, 0, 0);
+        else Serial.println(ERROR_BAD_FRAME);
+        return;
+    }
+    binaryMode = true;
+    int arg = (int16_t)(frame[2] | (frame[3] << 8));
+    switch (frame[1]) {
+        case FRAME_PING: handlePing(); break;
+        case FRAME_INFO: sendFirmwareInfo(); break;
+        case FRAME_GETSTATE: sendAscomState(); break;
+        case FRAME_GETSTATUS: sendStatus(); break;
+        case FRAME_OPEN: moveToPosition(MAX_ANGLE); break;
+        case FRAME_CLOSE: moveToPosition(MIN_ANGLE); break;
+        case FRAME_STOP: handleStop(); break;
+        case FRAME_SETPOS: moveToPosition(arg); break;
+        case FRAME_SETLED: requestLed(arg, ledLevel); break;
+        case FRAME_SETLED_LEVEL: requestLed(arg >> 8, arg & 0xFF); break;
+        case FRAME_TELEMETRY: setTelemetry(arg); break;
+        default: sendFrame(REPLY_ERROR, FRAME_ERROR_INVALID_COMMAND, frame[1], 0);
     }
 }
 
 // --- Command Handlers ---
 void handlePing() {
+    if (binaryMode) { sendFrame(REPLY_PING, 0, 0, GUID_PREFIX); return; }
     Serial.print(RESULT_PING);
     Serial.println(DEVICE_GUID);
 }
 
 void sendFirmwareInfo() {
-    Serial.println(RESULT_INFO);
+    if (binaryMode) sendFrame(REPLY_INFO, FIRMWARE_MAJOR, FIRMWARE_MINOR, 0);
+    else Serial.println(RESULT_INFO);
 }
 
 void sendAscomState() {
     int tolerance = 5;
-    if (isMoving) Serial.println(RESULT_STATE_MOVING);
-    else if (abs(currentAngle - MIN_ANGLE) < tolerance) Serial.println(RESULT_STATE_CLOSED);
-    else if (abs(currentAngle - MAX_ANGLE) < tolerance) Serial.println(RESULT_STATE_OPEN);
-    else Serial.println(RESULT_STATE_OPEN);
+    if (isMoving) sendState(STATE_MOVING, RESULT_STATE_MOVING);
+    else if (abs(currentAngle - MIN_ANGLE) < tolerance) sendState(STATE_CLOSED, RESULT_STATE_CLOSED);
+    else if (abs(currentAngle - MAX_ANGLE) < tolerance) sendState(STATE_OPEN, RESULT_STATE_OPEN);
+    else sendState(STATE_OPEN, RESULT_STATE_OPEN);
+}
+
+void sendState(int state, const char *line) {
+    if (binaryMode) sendFrame(REPLY_STATE, state, 0, 0);
+    else Serial.println(line);
+}
+
+void sendOk() {
+    if (binaryMode) sendFrame(REPLY_OK, 0, 0, 0);
+    else Serial.println(RESULT_OK);
 }
 
 // Sends status including angle and requested LED state (1 for On, 0 for Off)
 void sendStatus() {
+    if (binaryMode) { sendFrame(REPLY_STATUS, currentAngle, isLedOnRequested ? 1 : 0, FRAME_LEVEL_PRESENT | ledLevel); return; }
     Serial.print(RESULT_STATUS_PREFIX);
     Serial.print(currentAngle);
     Serial.print(":");
-    Serial.println(isLedOnRequested ? 1 : 0); // Report 1 if requested On, 0 if requested Off
+    Serial.print(isLedOnRequested ? 1 : 0); // Report 1 if requested On, 0 if requested Off
+    Serial.print(":");
+    Serial.println(ledLevel);
 }
 
 void handleSetPosition(String command) {
@@ -123,34 +269,88 @@ void handleSetPosition(String command) {
     }
 }
 
-// Handles LED On/Off command
+// Handles LED On/Off command with an optional brightness (SETLED:1:128)
 void handleSetLed(String command) {
     String arg = command.substring(strlen(COMMAND_SETLED_PREFIX));
     bool argOk = false;
     for (int i = 0; i < arg.length(); i++) { if (isDigit(arg.charAt(i))) { argOk = true; break; }}
 
+    int level = ledLevel;
+    int colon = arg.indexOf(':');
+    if (argOk && colon >= 0) {
+        String levelArg = arg.substring(colon + 1);
+        bool levelOk = false;
+        for (int i = 0; i < levelArg.length(); i++) { if (isDigit(levelArg.charAt(i))) { levelOk = true; break; }}
+        level = levelArg.toInt();
+        if (!levelOk || level < 0 || level > MAX_BRIGHTNESS) argOk = false;
+    }
+
     if (argOk) {
-        int value = arg.toInt();
+        requestLed(arg.toInt(), level);
+    } else {
+        Serial.println(ERROR_INVALID_ARGUMENT);
+    }
+}
 
-        // Update the requested state: On if value is non-zero, Off if zero.
-        isLedOnRequested = (value != 0);
-        Serial.print("LED state requested: "); Serial.println(isLedOnRequested ? "ON" : "OFF"); // Debug
+// Records the LED request (non-zero = On) and brightness, and applies them if the cover allows
+void requestLed(int value, int level) {
+    ledLevel = level;
+    // Update the requested state: On if value is non-zero, Off if zero.
+    isLedOnRequested = (value != 0);
+    if (!binaryMode) { Serial.print("LED state requested: "); Serial.println(isLedOnRequested ? "ON" : "OFF"); } // Debug
+
+    // Apply the state physically only if closed and not moving
+    if (!isMoving && abs(currentAngle - MIN_ANGLE) < 5) {
+         if (!binaryMode) Serial.println("Applying LED state."); // Debug
+         setLed(isLedOnRequested ? HIGH : LOW);
+    } else {
+         if (!binaryMode) Serial.println("Cover not closed or moving, ensuring LED is OFF."); // Debug
+         setLed(LOW); // Ensure LED is off if cover isn't closed or is moving
+    }
+    sendOk();
+    sendStatus(); // Report the new requested state
+}
 
-        // Apply the state physically only if closed and not moving
-        if (!isMoving && abs(currentAngle - MIN_ANGLE) < 5) {
-             Serial.println("Applying LED state."); // Debug
-             setLed(isLedOnRequested ? HIGH : LOW);
-        } else {
-             Serial.println("Cover not closed or moving, ensuring LED is OFF."); // Debug
-             setLed(LOW); // Ensure LED is off if cover isn't closed or is moving
-        }
-        Serial.println(RESULT_OK);
-        sendStatus(); // Report the new requested state
+// Handles telemetry On/Off command
+void handleSetTelemetry(String command) {
+    String arg = command.substring(strlen(COMMAND_TELEMETRY_PREFIX));
+    bool argOk = false;
+    for (int i = 0; i < arg.length(); i++) { if (isDigit(arg.charAt(i))) { argOk = true; break; }}
+
+    if (argOk) {
+        setTelemetry(arg.toInt());
+    } else {
+        Serial.println(ERROR_INVALID_ARGUMENT);
+    }
+}
+
+void setTelemetry(int value) {
+    isTelemetryOn = (value != 0);
+    sendOk();
+}
+
+// Switches the reply format; the confirmation is the last ASCII line before binary replies
+void handleSetBinary(String command) {
+    String arg = command.substring(strlen(COMMAND_BINARY_PREFIX));
+    bool argOk = false;
+    for (int i = 0; i < arg.length(); i++) { if (isDigit(arg.charAt(i))) { argOk = true; break; }}
+
+    if (argOk) {
+        bool on = (arg.toInt() != 0);
+        Serial.print(RESULT_BINARY_PREFIX);
+        Serial.println(on ? 1 : 0);
+        binaryMode = on;
     } else {
         Serial.println(ERROR_INVALID_ARGUMENT);
     }
 }
 
+// Stops a move at the current angle; the move ends with RESULT:MOVE:STOPPED and its status line
+void handleStop() {
+    if (isMoving) finishMove(true);
+    sendOk();
+}
+
 void handleInvalidCommand(String command) {
     Serial.print(ERROR_INVALID_COMMAND);
     Serial.print(":");
@@ -160,19 +360,58 @@ void handleInvalidCommand(String command) {
 
 // --- Core Functions ---
 
-// Sets the physical LED state using digitalWrite
+// Sets the physical LED state; HIGH lights it at ledLevel (analogWrite 0 and 255 are plain LOW and HIGH)
 void setLed(uint8_t state) { // HIGH or LOW
-    digitalWrite(LED_PIN, state);
+    analogWrite(LED_PIN, state == HIGH ? ledLevel : 0);
 }
 
-// Moves the servo to the target position step-by-step
+// Sends one reply frame; Serial.write() queues all 11 bytes at once
+void sendFrame(char type, int a, int b, unsigned long c) {
+    uint8_t out[FRAME_REPLY_SIZE] = {
+        FRAME_SYNC, (uint8_t)type,
+        (uint8_t)a, (uint8_t)(a >> 8),
+        (uint8_t)b, (uint8_t)(b >> 8),
+        (uint8_t)c, (uint8_t)(c >> 8), (uint8_t)(c >> 16), (uint8_t)(c >> 24),
+        0
+    };
+    out[FRAME_REPLY_SIZE - 1] = crc8(out + 1, FRAME_REPLY_SIZE - 2);
+    Serial.write(out, FRAME_REPLY_SIZE);
+}
+
+// CRC-8, polynomial 0x07, initial value 0 (bitwise; no table in RAM)
+uint8_t crc8(const uint8_t *data, uint8_t length) {
+    uint8_t crc = 0;
+    for (uint8_t i = 0; i < length; i++) {
+        crc ^= data[i];
+        for (uint8_t bit = 0; bit < 8; bit++) crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+    return crc;
+}
+
+// Sends one telemetry sample (~16 bytes; the TX buffer drains it well within one step)
+void sendSample() {
+    if (binaryMode) { sendFrame(REPLY_SAMPLE, currentAngle, isLedOnRequested ? 1 : 0, millis()); return; }
+    Serial.print(TELEMETRY_PREFIX);
+    Serial.print(millis());
+    Serial.print(":");
+    Serial.print(currentAngle);
+    Serial.print(":");
+    Serial.println(isLedOnRequested ? 1 : 0);
+}
+
+// Starts a move to the target position; updateMotion() carries it out from loop()
 void moveToPosition(int target) {
+    if (isMoving) finishMove(true); // A new move replaces the running one, starting from where the servo is
+
     int constrained_target = constrain(target, MIN_ANGLE, MAX_ANGLE);
 
     if (target != constrained_target && (target < MIN_ANGLE || target > MAX_ANGLE)) {
-        Serial.print(ERROR_OUT_OF_RANGE);
-        Serial.print(": Requested="); Serial.print(target);
-        Serial.print(", Actual="); Serial.println(constrained_target);
+        if (binaryMode) sendFrame(REPLY_ERROR, FRAME_ERROR_OUT_OF_RANGE, target, constrained_target);
+        else {
+            Serial.print(ERROR_OUT_OF_RANGE);
+            Serial.print(": Requested="); Serial.print(target);
+            Serial.print(", Actual="); Serial.println(constrained_target);
+        }
     }
 
     targetAngle = constrained_target;
@@ -187,31 +426,89 @@ void moveToPosition(int target) {
 
     isMoving = true;
     setLed(LOW); // Ensure LED is OFF during movement
-    Serial.println(RESULT_STATE_MOVING);
-
-    // Gradual movement loop
-    if (targetAngle > currentAngle) {
-        for (int pos = currentAngle + 1; pos <= targetAngle; pos++) {
-            servo.write(pos);
-            currentAngle = pos;
-            delay(MOVEMENT_DELAY);
-        }
+    sendState(STATE_MOVING, RESULT_STATE_MOVING);
+    moveStartAngle = currentAngle;
+    planMove(abs(targetAngle - currentAngle));
+    moveStartMs = millis();
+    lastMotionMs = moveStartMs;
+    if (binaryMode) sendFrame(REPLY_MOVE_START, moveStartAngle, targetAngle, moveDurationMs);
+    else {
+        Serial.print(RESULT_MOVE_START);
+        Serial.print(moveStartAngle); Serial.print(":");
+        Serial.print(targetAngle); Serial.print(":");
+        Serial.println(moveDurationMs);
+    }
+    if (isTelemetryOn) sendSample(); // Start sample: the host times the move from here
+}
+
+// Computes the trapezoidal profile: accelerate, cruise at MAX_SPEED, decelerate.
+// Short moves never reach MAX_SPEED and become a triangle.
+void planMove(int distance) {
+    moveDistance = distance;
+    if (ACCELERATION <= 0) {
+        accelTime = 0;
+        peakSpeed = MAX_SPEED;
+        cruiseTime = moveDistance / MAX_SPEED;
     } else {
-        for (int pos = currentAngle - 1; pos >= targetAngle; pos--) {
-            servo.write(pos);
-            currentAngle = pos;
-            delay(MOVEMENT_DELAY);
+        accelTime = MAX_SPEED / ACCELERATION;
+        float accelDistance = 0.5 * MAX_SPEED * accelTime;
+        if (2 * accelDistance >= moveDistance) {
+            accelTime = sqrt(moveDistance / ACCELERATION);
+            peakSpeed = ACCELERATION * accelTime;
+            cruiseTime = 0;
+        } else {
+            peakSpeed = MAX_SPEED;
+            cruiseTime = (moveDistance - 2 * accelDistance) / MAX_SPEED;
         }
     }
+    moveDurationMs = (unsigned long)((2 * accelTime + cruiseTime) * 1000.0 + 0.5);
+}
+
+// Degrees travelled `t` seconds into the planned move
+float profileDistance(float t) {
+    float total = 2 * accelTime + cruiseTime;
+    if (t >= total) return moveDistance;
+    if (t < accelTime) return 0.5 * ACCELERATION * t * t;
+    if (t < accelTime + cruiseTime) return 0.5 * peakSpeed * accelTime + peakSpeed * (t - accelTime);
+    float remaining = total - t;
+    return moveDistance - 0.5 * ACCELERATION * remaining * remaining;
+}
+
+// Called from loop(); advances the servo along the profile every MOTION_INTERVAL ms
+void updateMotion() {
+    unsigned long now = millis();
+    if (now - lastMotionMs < MOTION_INTERVAL) return;
+    lastMotionMs = now;
+
+    unsigned long elapsedMs = now - moveStartMs;
+    int travelled = (int)(profileDistance(elapsedMs / 1000.0) + 0.5);
+    int pos = targetAngle > moveStartAngle ? moveStartAngle + travelled : moveStartAngle - travelled;
+    if (elapsedMs >= moveDurationMs) pos = targetAngle;
+
+    if (pos != currentAngle) {
+        servo.write(pos);
+        currentAngle = pos;
+        if (isTelemetryOn && (abs(currentAngle - moveStartAngle) % TELEMETRY_EVERY == 0 || pos == targetAngle)) sendSample();
+    }
+    if (currentAngle == targetAngle) finishMove(false);
+}
 
+// Ends the move where the servo is now and reports it
+void finishMove(bool stopped) {
     isMoving = false;
+    targetAngle = currentAngle;
+    if (binaryMode) sendFrame(REPLY_MOVE_END, currentAngle, stopped ? 1 : 0, 0);
+    else {
+        Serial.print(stopped ? RESULT_MOVE_STOPPED : RESULT_MOVE_DONE);
+        Serial.println(currentAngle);
+    }
 
-    // Set final LED state based on position and requested state
+    // Set final LED state based on position and requested state (debug text only in ASCII mode)
     if (abs(currentAngle - MIN_ANGLE) < 5) {
-        Serial.print("Movement finished at closed pos. Applying LED state: "); Serial.println(isLedOnRequested ? "ON":"OFF"); // Debug
+        if (!binaryMode) { Serial.print("Movement finished at closed pos. Applying LED state: "); Serial.println(isLedOnRequested ? "ON":"OFF"); } // Debug
         setLed(isLedOnRequested ? HIGH : LOW); // Apply requested state if closed
     } else {
-        Serial.println("Movement finished at open pos. Ensuring LED is OFF."); // Debug
+        if (!binaryMode) Serial.println("Movement finished at open pos. Ensuring LED is OFF."); // Debug
         setLed(LOW); // Ensure LED is off if not closed
     }
 
@@ -0,0 +1,482 @@
+"""ASCOM Alpaca CoverCalibrator server for the flat panel.
+
+Owns the panel's serial port and shares it over HTTP, so capture software,
+NINA/ASCOM clients and scripts can use the panel at the same time:
+
+    python3 alpaca_server.py --port /dev/ttyACM0     # or --sim for a virtual panel
+    curl http://127.0.0.1:11111/api/v1/covercalibrator/0/coverstate
+
+Everything runs on one asyncio loop with a single PanelClient. Property reads
+(coverstate, calibratorstate, brightness, ...) are answered from the client's
+PanelState cache, which the lines the firmware sends anyway keep current
+(boot status, MOVING, the status after every move or SETLED), so polling
+clients never cause serial traffic. Identical commands that are already in flight are not
+sent again; the caller joins the pending one. Moves are asynchronous as
+Alpaca expects: opencover/closecover return at once and coverstate reports
+Moving until the firmware's final status line arrives; haltcover stops the
+cover where it is (firmware v1.6 and later).
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import urllib.parse
+
+import metrics
+import protocol
+from panel_client import MoveStopped, PanelClient, PanelError
+from panel_state import PanelState
+from traffic_log import TrafficRecorder
+
+# --- Constants ---
+HTTP_PORT = 11111 # Alpaca default
+BIND_ADDRESS = "127.0.0.1" # Use 0.0.0.0 to serve the LAN
+DISCOVERY_PORT = 32227
+DISCOVERY_MESSAGE = b"alpacadiscovery1"
+MAX_REQUEST_BYTES = 16384
+KEEPALIVE_TIMEOUT = 30.0 # Seconds an idle HTTP connection is kept open
+DEVICE_NUMBER = 0
+INTERFACE_VERSION = 2
+DRIVER_VERSION = "1.0"
+SERVER_NAME = "Flat Panel Alpaca Server"
+MANUFACTURER = "DarkSkyGeek firmware / Flat-Panel-Rotator-LED-Controller"
+MAX_BRIGHTNESS = protocol.MAX_BRIGHTNESS # PWM levels from firmware v1.7; earlier firmware lights any level > 0 fully
+
+# CoverStatus / CalibratorStatus enums
+COVER_NOT_PRESENT, COVER_CLOSED, COVER_MOVING, COVER_OPEN, COVER_UNKNOWN, COVER_ERROR = range(6)
+CALIBRATOR_NOT_PRESENT, CALIBRATOR_OFF, CALIBRATOR_NOT_READY, CALIBRATOR_READY, CALIBRATOR_UNKNOWN, CALIBRATOR_ERROR = range(6)
+
+# Alpaca error numbers
+ERROR_NOT_IMPLEMENTED = 0x400
+ERROR_INVALID_VALUE = 0x401
+ERROR_NOT_CONNECTED = 0x407
+ERROR_DRIVER = 0x500
+# --- End Constants ---
+
+
+class AlpacaError(Exception):
+    """Reported in the JSON body (HTTP 200) with an Alpaca error number."""
+
+    def __init__(self, number, message):
+        super().__init__(message)
+        self.number = number
+
+
+class BadRequest(Exception):
+    """Reported as HTTP 400: the request itself is malformed."""
+
+
+class CoverCalibratorDevice:
+    """The panel behind one PanelClient, with cached state and de-duplicated commands."""
+
+    def __init__(self, port, baud_rate=protocol.BAUD_RATE, reset=False, traffic_recorder=None):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.reset = reset # False keeps a running board (and the cover) where it is
+        self.client = None
+        self.traffic_recorder = traffic_recorder # traffic_log.TrafficRecorder, attached to every client
+        self.stats = collections.Counter()
+        self.clients = set() # Alpaca ClientIDs that set Connected=True
+        self.state = PanelState() # Replaced by the client's cache once connected
+        self.last_error = None
+        self._in_flight = {} # command -> task
+        self._connecting = None
+
+    # --- Link ---
+    @property
+    def connected(self):
+        return self.client is not None and self.client.is_open
+
+    async def connect(self):
+        """Opens the serial link once; concurrent callers share the attempt."""
+        if self.connected:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.get_running_loop().create_task(self._connect())
+        try:
+            await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+    async def _connect(self):
+        client = PanelClient(self.port, self.baud_rate)
+        client.add_disconnect_listener(self._on_disconnect)
+        if self.traffic_recorder:
+            self.traffic_recorder.attach(client)
+        await client.connect(reset=self.reset)
+        self.client = client
+        self.state = client.state
+        self.last_error = None
+        await client.get_status(max_age=float("inf")) # Only queries if the boot status was not seen
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+            if self.traffic_recorder:
+                self.traffic_recorder.detach(self.client)
+        self.client = None
+
+    def _on_disconnect(self, error):
+        self.last_error = f"Serial link lost: {error}"
+
+    # --- Commands ---
+    def _send(self, command):
+        """Starts `command` unless the identical command is already in flight; returns its task."""
+        if not self.connected:
+            raise AlpacaError(ERROR_NOT_CONNECTED, "The panel is not connected")
+        task = self._in_flight.get(command)
+        if task is not None:
+            self.stats["deduplicated"] += 1
+            return task
+        self.stats["serial_commands"] += 1
+        task = asyncio.get_running_loop().create_task(self.client.request(command))
+        self._in_flight[command] = task
+        task.add_done_callback(lambda done: self._command_done(command, done))
+        return task
+
+    def _command_done(self, command, task):
+        self._in_flight.pop(command, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None and not isinstance(error, MoveStopped): # Halted on request
+            self.last_error = f"{command}: {error}"
+
+    def start_move(self, command):
+        """Starts OPEN/CLOSE and returns at once; coverstate shows Moving until the move ends."""
+        self._send(command)
+
+    async def halt_cover(self):
+        """Stops a move where it is; the interrupted OPEN/CLOSE ends and coverstate follows the final status."""
+        self._require_link()
+        try:
+            await self.client.stop()
+        except PanelError as e:
+            raise AlpacaError(ERROR_DRIVER, f"Could not halt the cover (firmware before v1.6?): {e}")
+
+    def _move_pending(self):
+        # A move command still in flight counts as moving even before the firmware's MOVING line
+        targets = {protocol.COMMAND_OPEN: protocol.MAX_ANGLE, protocol.COMMAND_CLOSE: protocol.MIN_ANGLE}
+        return any(self.state.angle != targets[command] for command in self._in_flight if command in targets)
+
+    def set_led(self, on, level=None):
+        self._send(protocol.set_led_command(on, level))
+
+    def _require_link(self):
+        if not self.connected:
+            raise AlpacaError(ERROR_NOT_CONNECTED, "The panel is not connected")
+
+    # --- Cached state ---
+    def cover_state(self):
+        self._require_link()
+        if self.state.moving or self._move_pending():
+            return COVER_MOVING
+        return {"CLOSED": COVER_CLOSED, "OPEN": COVER_OPEN}.get(self.state.cover_state, COVER_UNKNOWN)
+
+    def calibrator_changing(self):
+        return any(command.startswith(protocol.COMMAND_SETLED_PREFIX) for command in self._in_flight)
+
+    def calibrator_state(self):
+        self._require_link()
+        if self.calibrator_changing():
+            return CALIBRATOR_NOT_READY
+        if not self.state.led_requested:
+            return CALIBRATOR_OFF
+        # The firmware lights the LED only while the cover is closed
+        return CALIBRATOR_READY if self.state.led_on and not self._move_pending() else CALIBRATOR_NOT_READY
+
+    def brightness(self):
+        if self.calibrator_state() != CALIBRATOR_READY:
+            return 0
+        return MAX_BRIGHTNESS if self.state.led_level is None else self.state.led_level
+
+
+class AlpacaServer:
+    """Minimal HTTP/1.1 server for the Alpaca management and CoverCalibrator APIs."""
+
+    def __init__(self, device, http_port=HTTP_PORT, bind=BIND_ADDRESS):
+        self.device = device
+        self.http_port = http_port
+        self.bind = bind
+        self.stats = collections.Counter()
+        self._transaction_ids = itertools.count(1)
+        self._server = None
+        self._discovery = None
+        self._gets = {
+            "connected": lambda params: self.device.connected and (
+                not self._client_id(params) or self._client_id(params) in self.device.clients),
+            "description": lambda params: "Telescope cover with flat-field LED panel",
+            "driverinfo": lambda params: f"{SERVER_NAME} for {protocol.RESULT_INFO[len('RESULT:'):]}",
+            "driverversion": lambda params: DRIVER_VERSION,
+            "interfaceversion": lambda params: INTERFACE_VERSION,
+            "name": lambda params: "Flat Panel",
+            "supportedactions": lambda params: [],
+            "coverstate": lambda params: self.device.cover_state(),
+            "covermoving": lambda params: self.device.cover_state() == COVER_MOVING,
+            "calibratorstate": lambda params: self.device.calibrator_state(),
+            "calibratorchanging": lambda params: self.device.calibrator_changing(),
+            "brightness": lambda params: self.device.brightness(),
+            "maxbrightness": lambda params: MAX_BRIGHTNESS,
+        }
+        self._puts = {
+            "connected": self._put_connected,
+            "opencover": self._put_open_cover,
+            "closecover": self._put_close_cover,
+            "haltcover": self._put_halt_cover,
+            "calibratoron": self._put_calibrator_on,
+            "calibratoroff": self._put_calibrator_off,
+        }
+
+    async def start(self, discovery=True):
+        self._server = await asyncio.start_server(self._handle_connection, self.bind, self.http_port)
+        if discovery:
+            loop = asyncio.get_running_loop()
+            try:
+                self._discovery, _ = await loop.create_datagram_endpoint(
+                    lambda: _DiscoveryProtocol(self.http_port), local_addr=("0.0.0.0", DISCOVERY_PORT), allow_broadcast=True)
+            except OSError as e:
+                print(f"Alpaca discovery disabled: {e}") # Another Alpaca server already owns the port
+
+    async def stop(self):
+        if self._discovery:
+            self._discovery.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP ---
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, "text/plain", b"Malformed request line", close=True)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_REQUEST_BYTES:
+                    await self._respond(writer, 413, "text/plain", b"Request too large", close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                status, content_type, payload = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, content_type, payload, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, payload, close=False):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  413: "Payload Too Large", 500: "Internal Server Error"}.get(status, "")
+        head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, headers, body):
+        self.stats["requests"] += 1
+        url = urllib.parse.urlsplit(target)
+        # Query parameter names are case-insensitive; PUT form fields are matched exactly
+        params = {name.lower(): value for name, value in urllib.parse.parse_qsl(url.query)}
+        if method == "PUT":
+            params.update(urllib.parse.parse_qsl(body.decode("utf-8", errors="replace")))
+        parts = [part for part in url.path.lower().split("/") if part]
+        try:
+            if parts[:1] == ["management"]:
+                return self._json(200, self._management(parts[1:], params))
+            if parts[:2] != ["api", "v1"] or len(parts) != 5 or parts[2] != "covercalibrator" or parts[3] != str(DEVICE_NUMBER):
+                return 404, "text/plain", b"Unknown device or endpoint"
+            name = parts[4]
+            if method == "GET" and name in self._gets:
+                value = self._gets[name](params)
+            elif method == "PUT" and name in self._puts:
+                value = await self._puts[name](params)
+            elif name in self._gets or name in self._puts:
+                return 405, "text/plain", f"{method} is not allowed on {name}".encode()
+            elif name in ("action", "commandblind", "commandbool", "commandstring"):
+                raise AlpacaError(ERROR_NOT_IMPLEMENTED, f"{name} is not implemented")
+            else:
+                return 404, "text/plain", f"Unknown member {name}".encode()
+            return self._json(200, self._envelope(params, value))
+        except BadRequest as e:
+            return 400, "text/plain", str(e).encode()
+        except AlpacaError as e:
+            self.stats["alpaca_errors"] += 1
+            return self._json(200, self._envelope(params, None, e.number, str(e)))
+        except Exception as e:
+            return self._json(200, self._envelope(params, None, ERROR_DRIVER, str(e)))
+
+    @staticmethod
+    def _json(status, document):
+        return status, "application/json", json.dumps(document).encode()
+
+    def _envelope(self, params, value, number=0, message=""):
+        document = {"ClientTransactionID": self._uint(params.get("clienttransactionid") or params.get("ClientTransactionID")),
+                    "ServerTransactionID": next(self._transaction_ids),
+                    "ErrorNumber": number, "ErrorMessage": message}
+        if value is not None:
+            document["Value"] = value
+        return document
+
+    @staticmethod
+    def _uint(text):
+        try:
+            value = int(text)
+        except (TypeError, ValueError):
+            return 0
+        return value if 0 <= value <= 0xFFFFFFFF else 0
+
+    def _client_id(self, params):
+        return self._uint(params.get("clientid") or params.get("ClientID"))
+
+    def _management(self, parts, params):
+        if parts == ["apiversions"]:
+            return self._envelope(params, [1])
+        if parts == ["v1", "description"]:
+            return self._envelope(params, {"ServerName": SERVER_NAME, "Manufacturer": MANUFACTURER,
+                                           "ManufacturerVersion": DRIVER_VERSION, "Location": "Observatory"})
+        if parts == ["v1", "configureddevices"]:
+            return self._envelope(params, [{"DeviceName": "Flat Panel", "DeviceType": "CoverCalibrator",
+                                            "DeviceNumber": DEVICE_NUMBER, "UniqueID": protocol.DEVICE_GUID}])
+        raise BadRequest("Unknown management endpoint")
+
+    # --- PUT members ---
+    @staticmethod
+    def _field(params, name):
+        if name not in params:
+            raise BadRequest(f"Missing form field {name}")
+        return params[name]
+
+    async def _put_connected(self, params):
+        value = self._field(params, "Connected").lower()
+        if value not in ("true", "false"):
+            raise BadRequest("Connected must be True or False")
+        client_id = self._client_id(params)
+        if value == "true":
+            try:
+                await self.device.connect()
+            except (PanelError, OSError) as e:
+                raise AlpacaError(ERROR_DRIVER, f"Could not connect to {self.device.port}: {e}")
+            self.device.clients.add(client_id)
+        else:
+            # Other clients may still use the link, and reopening could reset the board
+            self.device.clients.discard(client_id)
+        return None
+
+    async def _put_open_cover(self, params):
+        self.device.start_move(protocol.COMMAND_OPEN)
+
+    async def _put_close_cover(self, params):
+        self.device.start_move(protocol.COMMAND_CLOSE)
+
+    async def _put_halt_cover(self, params):
+        await self.device.halt_cover()
+
+    async def _put_calibrator_on(self, params):
+        try:
+            brightness = int(self._field(params, "Brightness"))
+        except ValueError:
+            raise BadRequest("Brightness must be an integer")
+        if not 0 <= brightness <= MAX_BRIGHTNESS:
+            raise AlpacaError(ERROR_INVALID_VALUE, f"Brightness must be 0-{MAX_BRIGHTNESS}")
+        self.device.set_led(brightness > 0, brightness if brightness > 0 else None)
+
+    async def _put_calibrator_off(self, params):
+        self.device.set_led(False)
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    """Answers Alpaca discovery broadcasts with the HTTP port."""
+
+    def __init__(self, http_port):
+        self.reply = json.dumps({"AlpacaPort": http_port}).encode()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if data.startswith(DISCOVERY_MESSAGE):
+            self.transport.sendto(self.reply, address)
+
+
+async def serve(port, http_port=HTTP_PORT, bind=BIND_ADDRESS, reset=False, discovery=True,
+                metrics_port=None, metrics_file=None, record=None):
+    """Connects to the panel (best effort) and serves until cancelled."""
+    traffic_recorder = TrafficRecorder(record) if record else None
+    device = CoverCalibratorDevice(port, reset=reset, traffic_recorder=traffic_recorder)
+    server = AlpacaServer(device, http_port, bind)
+    await server.start(discovery)
+    exporters = []
+    if metrics_port:
+        exporters.append(asyncio.ensure_future(metrics.serve_http(metrics_port)))
+        print(f"Metrics on http://127.0.0.1:{metrics_port}/metrics")
+    if metrics_file:
+        exporters.append(asyncio.ensure_future(metrics.export_to_file(metrics_file)))
+    print(f"Alpaca CoverCalibrator on http://{bind}:{http_port}/api/v1/covercalibrator/{DEVICE_NUMBER}/ (panel on {port})")
+    try:
+        await device.connect()
+        print(f"Connected to {port}.")
+    except (PanelError, OSError) as e:
+        print(f"Panel not connected yet ({e}); clients can retry with Connected=True.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for exporter in exporters:
+            exporter.cancel()
+        await server.stop()
+        await device.close()
+        if traffic_recorder:
+            traffic_recorder.close()
+        print(f"HTTP requests: {server.stats['requests']}, serial commands: {device.stats['serial_commands']}, "
+              f"de-duplicated: {device.stats['deduplicated']}")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ASCOM Alpaca CoverCalibrator server for the flat panel.")
+    parser.add_argument("--port", help="Serial port of the panel (default: the cached or discovered one)")
+    parser.add_argument("--sim", action="store_true", help="Serve a simulated panel (panel_sim.VirtualPanel)")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help=f"HTTP port (default {HTTP_PORT})")
+    parser.add_argument("--bind", default=BIND_ADDRESS, help=f"Address to listen on (default {BIND_ADDRESS})")
+    parser.add_argument("--reset", action="store_true", help="Reset the board when opening the port")
+    parser.add_argument("--no-discovery", action="store_true", help="Do not answer Alpaca discovery broadcasts")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this loopback port")
+    parser.add_argument("--metrics-file", help="Write Prometheus metrics to this file every 15 s")
+    parser.add_argument("--record", help="Append all serial traffic to this file (see traffic_log.py)")
+    args = parser.parse_args()
+
+    panel = None
+    port = args.port
+    if args.sim:
+        from panel_sim import VirtualPanel
+        panel = VirtualPanel(reset_on_open=args.reset)
+        port = panel.start()
+    elif not port:
+        import discovery as port_discovery
+        port = port_discovery.find_cached() or next(iter(asyncio.run(port_discovery.discover())), None)
+        if not port:
+            parser.error("No panel found; pass --port")
+    try:
+        asyncio.run(serve(port, args.http_port, args.bind, args.reset, not args.no_discovery,
+                          args.metrics_port, args.metrics_file, args.record))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if panel:
+            panel.stop()
@@ -0,0 +1,127 @@
+"""ASCII vs binary framing benchmark, run against panel_sim.VirtualPanel.
+
+Sends the same commands through panel_client.PanelClient once in the default
+ASCII protocol and once after COMMAND:BINARY:1, and reports the bytes on the
+wire in each direction and the round-trip latency per command. The simulator
+charges every byte at 57600 baud, so the latency difference is mostly the
+shorter frames:
+
+    python3 bench_framing.py --runs 50
+    python3 bench_framing.py --runs 10 --moves 2 --json framing.json
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import protocol
+from bench_panel import summarize
+from panel_client import PanelClient, LINK_BYTES
+from panel_sim import VirtualPanel
+
+# --- Constants ---
+RUNS = 30 # Round trips per command and mode
+MOVES = 2 # Open/close pairs per mode (with telemetry on, so the samples count too)
+
+SCRIPT = [
+    protocol.COMMAND_PING,
+    protocol.COMMAND_INFO,
+    protocol.COMMAND_GETSTATE,
+    protocol.COMMAND_GETSTATUS,
+    protocol.set_led_command(True),
+    protocol.set_led_command(False),
+    protocol.set_telemetry_command(False),
+]
+MOVE_SCRIPT = [protocol.COMMAND_OPEN, protocol.COMMAND_CLOSE]
+# --- End Constants ---
+
+
+async def _measure(client, command, runs):
+    """Bytes per round trip in each direction plus the latency summary for one command."""
+    tx, rx = LINK_BYTES.labels(client.port, "tx"), LINK_BYTES.labels(client.port, "rx")
+    tx_start, rx_start = tx.value, rx.value
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await client.request(command)
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples)
+    result["tx_bytes"] = (tx.value - tx_start) / runs
+    result["rx_bytes"] = (rx.value - rx_start) / runs
+    return result
+
+
+async def _run_mode(client, binary, runs, moves):
+    await client.set_binary(binary)
+    results = {}
+    for command in SCRIPT:
+        results[command] = await _measure(client, command, runs)
+    if moves:
+        await client.set_telemetry(True)
+        await client.close_cover()
+        # Alternate so every OPEN starts closed and every CLOSE starts open
+        parts = {command: [] for command in MOVE_SCRIPT}
+        for _ in range(moves):
+            for command in MOVE_SCRIPT:
+                parts[command].append(await _measure(client, command, 1))
+        for command in MOVE_SCRIPT:
+            results[command] = _merge(parts[command])
+        await client.set_telemetry(False)
+    return results
+
+
+def _merge(parts):
+    merged = {key: sum(part[key] for part in parts) / len(parts) for key in ("mean_ms", "tx_bytes", "rx_bytes")}
+    merged["count"] = len(parts)
+    merged["p50_ms"] = sorted(part["mean_ms"] for part in parts)[(len(parts) - 1) // 2]
+    merged["p95_ms"] = merged["max_ms"] = max(part["mean_ms"] for part in parts)
+    return merged
+
+
+async def _run(runs, moves, time_scale):
+    panel = VirtualPanel(time_scale=time_scale, reset_on_open=False)
+    port = panel.start()
+    client = PanelClient(port)
+    try:
+        await client.connect(reset=False)
+        report = {"time_scale": time_scale, "runs": runs}
+        report["ascii"] = await _run_mode(client, False, runs, moves)
+        report["binary"] = await _run_mode(client, True, runs, moves)
+        await client.set_binary(False)
+        report["device"] = dict(panel.stats)
+        return report
+    finally:
+        await client.close()
+        panel.stop()
+
+
+def run(runs=RUNS, moves=MOVES, time_scale=1.0):
+    return asyncio.run(_run(runs, moves, time_scale))
+
+
+def print_report(report):
+    print(f"Time scale: {report['time_scale']}  runs: {report['runs']}")
+    print(f"{'Command':<22} {'ASCII tx/rx B':>14} {'binary tx/rx B':>15} {'ASCII ms':>9} {'binary ms':>10} {'speed-up':>9}")
+    for command, ascii_stats in report["ascii"].items():
+        binary_stats = report["binary"][command]
+        ratio = ascii_stats["mean_ms"] / binary_stats["mean_ms"] if binary_stats["mean_ms"] else 0.0
+        print(f"{command:<22} {ascii_stats['tx_bytes']:>6.0f}/{ascii_stats['rx_bytes']:<7.0f} "
+              f"{binary_stats['tx_bytes']:>6.0f}/{binary_stats['rx_bytes']:<8.0f} "
+              f"{ascii_stats['mean_ms']:>9.2f} {binary_stats['mean_ms']:>10.2f} {ratio:>8.2f}x")
+    print(f"Device:     {report['device']}")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ASCII and binary framing against the simulator.")
+    parser.add_argument("--runs", type=int, default=RUNS, help="Round trips per command and mode")
+    parser.add_argument("--moves", type=int, default=MOVES, help="Open/close pairs per mode (0 = skip moves)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Simulator delay scale (default 1.0 = real firmware timing)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    result = run(args.runs, args.moves, args.time_scale)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(result, handle, indent=2)
@@ -0,0 +1,215 @@
+"""Benchmark harness for the serial link, run against panel_sim.VirtualPanel.
+
+Reports connect time, per-command round-trip latency and throughput under a
+scripted load. Runs headless, so it can be used in CI:
+
+    python3 bench_panel.py --time-scale 0.1 --iterations 20 --json results.json
+"""
+import argparse
+import json
+import queue
+import statistics
+import threading
+import time
+
+import serial
+
+from panel_sim import VirtualPanel
+from serial_reader import SerialLineReader
+
+# --- Constants ---
+BAUD_RATE = 57600
+REPLY_TIMEOUT = 10.0 # Seconds to wait for any single reply
+PIPELINE_WINDOW = 4 # Commands in flight during the throughput run (4 x 13 bytes fits the 64-byte RX buffer)
+
+# Command -> prefix of the line that completes it
+SCRIPT = [
+    ("COMMAND:PING", "RESULT:PING:OK:"),
+    ("COMMAND:INFO", "RESULT:DarkSkyGeek"),
+    ("COMMAND:GETSTATE", "RESULT:STATE:"),
+    ("COMMAND:GETSTATUS", "RESULT:STATUS:"),
+    ("COMMAND:SETLED:1", "RESULT:STATUS:"),
+    ("COMMAND:SETLED:0", "RESULT:STATUS:"),
+]
+MOVES = [
+    ("COMMAND:OPEN", "RESULT:STATUS:"),
+    ("COMMAND:CLOSE", "RESULT:STATUS:"),
+]
+# --- End Constants ---
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+
+
+class BenchLink:
+    """Raw pyserial connection with a reader thread feeding a queue of decoded lines."""
+
+    def __init__(self, port):
+        self.lines = queue.Queue()
+        self.ser = serial.Serial(port, BAUD_RATE, timeout=1)
+        self.reader = SerialLineReader(self.ser, self._on_line)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _on_line(self, line):
+        text = line.decode("ascii", errors="replace").strip()
+        if text:
+            self.lines.put((time.perf_counter(), text))
+
+    def _run(self):
+        try:
+            self.reader.run()
+        except serial.SerialException:
+            pass
+
+    def send(self, command):
+        self.ser.write((command + "\n").encode("ascii"))
+
+    def wait_for(self, prefix, timeout=REPLY_TIMEOUT):
+        """Returns the arrival time of the next line starting with prefix."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No reply starting with {prefix!r}")
+            stamp, text = self.lines.get(timeout=remaining)
+            if text.startswith(prefix):
+                return stamp
+
+    def close(self):
+        self.reader.stop()
+        self.thread.join(timeout=2)
+        self.ser.close()
+
+
+def bench_connect(panel, runs):
+    """Time from opening the port to the firmware's boot status line."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        link = BenchLink(panel.port)
+        samples.append(link.wait_for("RESULT:STATUS:") - start)
+        link.close()
+        time.sleep(0.05) # Let the simulator notice the hang-up
+    return samples
+
+
+def bench_round_trips(link, script, iterations):
+    """Send-to-completion latency for each command, one at a time."""
+    results = {}
+    for command, done_prefix in script:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            link.send(command)
+            samples.append(link.wait_for(done_prefix) - start)
+        results[command] = summarize(samples)
+    return results
+
+
+def bench_moves(link, script, iterations):
+    """Full-travel move times: each iteration runs the whole script, so OPEN always starts closed."""
+    link.send(script[-1][0]) # Start from the end stop the script finishes at
+    link.wait_for(script[-1][1])
+    samples = {command: [] for command, _ in script}
+    for _ in range(iterations):
+        for command, done_prefix in script:
+            start = time.perf_counter()
+            link.send(command)
+            samples[command].append(link.wait_for(done_prefix) - start)
+    return {command: summarize(times) for command, times in samples.items()}
+
+
+def bench_throughput(link, total):
+    """Pipelined PINGs with a bounded window; returns commands/s and lost replies."""
+    start = time.perf_counter()
+    sent = completed = lost = 0
+    in_flight = 0
+    while completed + lost < total:
+        while in_flight < PIPELINE_WINDOW and sent < total:
+            link.send("COMMAND:PING")
+            sent += 1
+            in_flight += 1
+        try:
+            link.wait_for("RESULT:PING:OK:", timeout=2.0)
+            completed += 1
+            in_flight -= 1
+        except (TimeoutError, queue.Empty):
+            lost += in_flight # Whatever is still outstanding was dropped on the way
+            in_flight = 0
+    elapsed = time.perf_counter() - start
+    return {
+        "commands": total,
+        "completed": completed,
+        "lost": lost,
+        "seconds": elapsed,
+        "commands_per_s": completed / elapsed if elapsed else 0.0,
+    }
+
+
+def run(time_scale, iterations, connect_runs, burst):
+    panel = VirtualPanel(time_scale=time_scale)
+    panel.start()
+    try:
+        report = {"time_scale": time_scale}
+        report["connect"] = summarize(bench_connect(panel, connect_runs))
+        link = BenchLink(panel.port)
+        link.wait_for("RESULT:STATUS:")
+        report["round_trip"] = bench_round_trips(link, SCRIPT, iterations)
+        report["moves"] = bench_moves(link, MOVES, max(1, iterations // 10))
+        report["throughput"] = bench_throughput(link, burst)
+        report["reader"] = link.reader.stats.summary()
+        link.close()
+        report["device"] = dict(panel.stats)
+        return report
+    finally:
+        panel.stop()
+
+
+def print_report(report):
+    print(f"Time scale: {report['time_scale']}")
+    connect = report["connect"]
+    print(f"Connect:    mean {connect['mean_ms']:8.1f} ms  p95 {connect['p95_ms']:8.1f} ms  ({connect['count']} runs)")
+    for section in ("round_trip", "moves"):
+        for command, stats in report[section].items():
+            print(f"{command:<20} mean {stats['mean_ms']:8.2f} ms  p50 {stats['p50_ms']:8.2f}  "
+                  f"p95 {stats['p95_ms']:8.2f}  max {stats['max_ms']:8.2f}")
+    throughput = report["throughput"]
+    print(f"Throughput: {throughput['commands_per_s']:.1f} cmd/s "
+          f"({throughput['completed']}/{throughput['commands']} completed, {throughput['lost']} lost)")
+    print(f"Reader:     {report['reader']}")
+    print(f"Device:     {report['device']}")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the panel serial link against the simulator.")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Simulator delay scale (default 1.0 = real firmware timing)")
+    parser.add_argument("--iterations", type=int, default=20, help="Round trips per command")
+    parser.add_argument("--connect-runs", type=int, default=3, help="Number of connect measurements")
+    parser.add_argument("--burst", type=int, default=200, help="Commands in the throughput run")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    result = run(args.time_scale, args.iterations, args.connect_runs, args.burst)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(result, handle, indent=2)
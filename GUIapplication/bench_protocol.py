@@ -0,0 +1,109 @@
+"""Parse-throughput micro-benchmark for protocol.parse().
+
+Feeds a recorded traffic log (one received line per line; GUI log files with
+"Recv: " prefixes work too) or, without --log, a synthetic multi-hour session
+through the parser and reports lines per second:
+
+    python3 bench_protocol.py --log ~/flatpanel.log --min-rate 500000
+"""
+import argparse
+import collections
+import random
+import sys
+import time
+
+import protocol
+
+# --- Constants ---
+POLL_INTERVAL = 5 # Seconds between GETSTATUS polls in the synthetic session
+FLAT_SESSIONS_PER_HOUR = 1
+GARBLE_RATE = 0.001 # Fraction of synthetic lines corrupted on the wire
+# --- End Constants ---
+
+
+def load_log(path):
+    """Returns the received lines from a raw dump or a GUI log file."""
+    lines = []
+    with open(path, errors="replace") as handle:
+        for text in handle:
+            if "Recv: " in text:
+                text = text.split("Recv: ", 1)[1]
+            elif "Sent: " in text:
+                continue
+            text = text.strip()
+            if text:
+                lines.append(text)
+    return lines
+
+
+def _move(lines, start, end, led):
+    lines.append(protocol.RESULT_STATE_MOVING)
+    if end == protocol.MIN_ANGLE:
+        lines.append("Movement finished at closed pos. Applying LED state: " + ("ON" if led else "OFF"))
+    else:
+        lines.append("Movement finished at open pos. Ensuring LED is OFF.")
+    lines.append(f"{protocol.RESULT_STATUS_PREFIX}{end}:{int(led)}")
+
+
+def synthetic_session(hours, seed=1):
+    """Received traffic for `hours` of status polling with an hourly flat-field run."""
+    rng = random.Random(seed)
+    lines = [f"{protocol.RESULT_STATUS_PREFIX}{protocol.MIN_ANGLE}:0",
+             protocol.RESULT_PING + protocol.DEVICE_GUID, protocol.RESULT_STATE_CLOSED]
+    angle, led = protocol.MIN_ANGLE, False
+    polls_per_hour = 3600 // POLL_INTERVAL
+    for _ in range(hours):
+        flat_at = {rng.randrange(polls_per_hour) for _ in range(FLAT_SESSIONS_PER_HOUR)}
+        for poll in range(polls_per_hour):
+            lines.append(f"{protocol.RESULT_STATUS_PREFIX}{angle}:{int(led)}")
+            if poll % 12 == 0:
+                lines.append(protocol.RESULT_STATE_OPEN if angle > protocol.MIN_ANGLE else protocol.RESULT_STATE_CLOSED)
+            if poll in flat_at:
+                _move(lines, angle, protocol.MIN_ANGLE, led)
+                angle = protocol.MIN_ANGLE
+                for on in (True, False):
+                    lines += ["LED state requested: " + ("ON" if on else "OFF"), "Applying LED state.",
+                              protocol.RESULT_OK, f"{protocol.RESULT_STATUS_PREFIX}{angle}:{int(on)}"]
+                led = False
+                _move(lines, angle, protocol.MAX_ANGLE, led)
+                angle = protocol.MAX_ANGLE
+            if rng.random() < 0.002:
+                lines.append(f"{protocol.ERROR_OUT_OF_RANGE}: Requested=200, Actual={protocol.MAX_ANGLE}")
+    for index in range(len(lines)):
+        if rng.random() < GARBLE_RATE:
+            text = lines[index]
+            position = rng.randrange(len(text))
+            lines[index] = text[:position] + "#" + text[position + 1:]
+    return lines
+
+
+def bench(lines, repeat):
+    """Best-of-`repeat` parse rate in lines per second."""
+    parse = protocol.parse
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best if best else float("inf")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark protocol.parse() throughput.")
+    parser.add_argument("--log", help="Recorded traffic log (default: synthetic session)")
+    parser.add_argument("--hours", type=int, default=8, help="Length of the synthetic session")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes; the best is reported")
+    parser.add_argument("--min-rate", type=float, help="Exit with status 1 below this many lines/s")
+    args = parser.parse_args()
+
+    lines = load_log(args.log) if args.log else synthetic_session(args.hours)
+    kinds = collections.Counter(type(protocol.parse(line)).__name__ for line in lines)
+    rate = bench(lines, args.repeat)
+    print(f"{len(lines)} lines ({'recorded' if args.log else f'synthetic {args.hours} h'})")
+    print("Message mix: " + ", ".join(f"{name} {count}" for name, count in kinds.most_common()))
+    print(f"Parse rate: {rate:,.0f} lines/s ({1e6 / rate:.2f} us/line)")
+    if args.min_rate and rate < args.min_rate:
+        print(f"FAIL: below the {args.min_rate:,.0f} lines/s budget")
+        sys.exit(1)
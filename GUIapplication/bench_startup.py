@@ -0,0 +1,80 @@
+"""Startup-to-result benchmark for the flatpanel CLI, run against panel_sim.VirtualPanel.
+
+Launches `python -m flatpanel --port <sim> <commands>` as a fresh process
+several times and measures the wall time from spawning it to its exit, i.e.
+interpreter start, imports, connect, the commands and shutdown. Also checks
+that tkinter is never imported on this path. Exits with status 1 when the
+p95 exceeds the budget, so it can gate CI:
+
+    python3 bench_startup.py --budget 1.0
+    python3 bench_startup.py --commands close --led on --time-scale 0.1 --budget 1.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from panel_sim import VirtualPanel
+
+# --- Constants ---
+BUDGET = 1.0 # Seconds from spawn to exit for the default (non-moving) command
+RUNS = 10
+# --- End Constants ---
+
+
+def _cli(port, words):
+    return [sys.executable, "-m", "flatpanel", "--port", port] + words
+
+
+def run(words, runs=RUNS, time_scale=1.0):
+    """Returns {'times': [seconds], 'tkinter': bool, 'failures': int} for `runs` launches."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    panel = VirtualPanel(time_scale=time_scale, reset_on_open=False) # Like a board opened with DTR held low
+    port = panel.start()
+    times = []
+    failures = 0
+    try:
+        # One extra launch with -X importtime: every module imported on the CLI path is listed on stderr
+        probe = subprocess.run([sys.executable, "-X", "importtime"] + _cli(port, words)[1:], cwd=here,
+                               capture_output=True, text=True)
+        loads_tkinter = "tkinter" in probe.stderr
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run(_cli(port, words), cwd=here, capture_output=True, text=True)
+            times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                failures += 1
+                print(result.stderr.strip(), file=sys.stderr)
+    finally:
+        panel.stop()
+    return {"times": times, "tkinter": loads_tkinter, "failures": failures}
+
+
+def p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure flatpanel CLI startup-to-result time against the simulator.")
+    parser.add_argument("--commands", nargs="+", default=["state"], help="CLI command words (default: state)")
+    parser.add_argument("--led", choices=["on", "off"], help="Passed through to the CLI")
+    parser.add_argument("--runs", type=int, default=RUNS, help=f"Launches to time (default {RUNS})")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Simulator delay scale")
+    parser.add_argument("--budget", type=float, default=BUDGET, help=f"Maximum p95 in seconds (default {BUDGET})")
+    args = parser.parse_args()
+
+    words = args.commands + (["--led", args.led] if args.led else [])
+    report = run(words, args.runs, args.time_scale)
+    times = report["times"]
+    worst = p95(times)
+    print(f"flatpanel {' '.join(words)}: mean {statistics.fmean(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms, p95 {worst * 1000:.0f} ms over {len(times)} runs "
+          f"(budget {args.budget * 1000:.0f} ms)")
+    print(f"tkinter imported: {'YES' if report['tkinter'] else 'no'}, failed runs: {report['failures']}")
+    ok = worst <= args.budget and not report["tkinter"] and not report["failures"]
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,312 @@
+"""Brightness calibration: from measured flats to the PWM level for a target ADU.
+
+Take a few flats per filter at different SETLED brightness levels (firmware
+v1.7) and record the mean ADU of each, either in a CSV file
+
+    filter,level,exposure,adu[,bias]
+    Ha,64,2.0,5210
+    Ha,255,2.0,21980
+
+or as a FITS header dump (`fitsheader *.fits > night.txt`, or plain 80-column
+cards one file after another) with FILTER, EXPTIME, the panel level in
+PANELPWM and the mean in DATAMEAN. fit() converts every sample to ADU per
+second above bias and fits a polynomial in the level with NumPy. It evaluates
+the fit for all 256 levels in one call and makes the result non-decreasing.
+It then inverts that into a table with a fixed number of rate steps. Each
+filter's tables are saved to ~/.flatpanel/calibration/<filter>.json and kept
+in memory after the first load, so a lookup like "25k ADU at 2 s for Ha" is
+one division and one list index, with no NumPy involved:
+
+    python3 calibration.py fit flats.csv night.txt --bias 512
+    python3 calibration.py level Ha 25000 2
+    python3 calibration.py show
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import time
+
+import protocol
+
+# --- Constants ---
+CALIBRATION_DIR = os.path.join(os.path.expanduser("~"), ".flatpanel", "calibration")
+FIT_DEGREE = 3 # Highest polynomial degree; lowered when there are fewer distinct levels
+INVERSE_STEPS = 1024 # Rate steps in the inverse table (finer than the 256 PWM levels it maps to)
+FILTER_KEYS = ("FILTER",)
+EXPOSURE_KEYS = ("EXPTIME", "EXPOSURE")
+LEVEL_KEYS = ("PANELPWM", "FLATLEVL")
+ADU_KEYS = ("DATAMEAN", "MEANADU", "MEAN")
+BIAS_KEYS = ("BIASLEVL", "PEDESTAL")
+# --- End Constants ---
+
+
+class CalibrationError(ValueError):
+    """Missing or unusable calibration data, or a target the panel cannot reach."""
+
+
+class FlatSample:
+    """Mean ADU of one flat taken at a known brightness level and exposure."""
+
+    __slots__ = ("filter", "level", "exposure", "adu", "bias")
+
+    def __init__(self, filter, level, exposure, adu, bias=0.0):
+        self.filter = filter
+        self.level = level # PWM level 0-255
+        self.exposure = exposure # Seconds
+        self.adu = adu # Mean ADU of the frame
+        self.bias = bias # Mean ADU of a zero-length frame
+
+    @property
+    def rate(self):
+        """ADU per second contributed by the panel."""
+        return (self.adu - self.bias) / self.exposure
+
+
+# --- Loading samples ---
+def load_csv(path, bias=0.0):
+    """FlatSamples from a CSV with filter, level, exposure and adu columns (bias optional, per row)."""
+    samples = []
+    with open(path, newline="") as handle:
+        for row in csv.DictReader(handle):
+            row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+            try:
+                samples.append(FlatSample(row["filter"], int(row["level"]), float(row["exposure"]), float(row["adu"]),
+                                          float(row["bias"]) if row.get("bias") else bias))
+            except (KeyError, ValueError) as e:
+                raise CalibrationError(f"{path}: bad row {row}: {e}")
+    return samples
+
+
+def _card_value(text):
+    value = text.split("/", 1)[0].strip() if not text.lstrip().startswith("'") else text.strip()
+    if value.startswith("'"):
+        return value[1:].split("'", 1)[0].strip()
+    return value
+
+
+def _first(cards, keys):
+    for key in keys:
+        if key in cards:
+            return cards[key]
+    return None
+
+
+def load_header_dump(path, bias=0.0):
+    """FlatSamples from a FITS header dump; headers without the needed cards are skipped."""
+    headers = []
+    cards = {}
+    with open(path, errors="replace") as handle:
+        for line in handle:
+            line = line.rstrip("\n")
+            # fitsheader prints "# HDU 0 in file.fits:" before each header; raw dumps have END or a new SIMPLE
+            starts = line.startswith("#") or line[:8].strip() == "SIMPLE"
+            if (starts or line[:8].strip() == "END") and cards:
+                headers.append(cards)
+                cards = {}
+            if len(line) > 9 and line[8:10] == "= ":
+                cards[line[:8].strip().upper()] = _card_value(line[10:])
+    if cards:
+        headers.append(cards)
+    samples = []
+    for cards in headers:
+        fields = [_first(cards, keys) for keys in (FILTER_KEYS, LEVEL_KEYS, EXPOSURE_KEYS, ADU_KEYS)]
+        if None in fields:
+            continue
+        try:
+            frame_bias = float(_first(cards, BIAS_KEYS) or bias)
+            samples.append(FlatSample(fields[0], int(float(fields[1])), float(fields[2]), float(fields[3]), frame_bias))
+        except ValueError:
+            continue
+    return samples
+
+
+def load_samples(paths, bias=0.0):
+    """Samples from CSV files (*.csv) and header dumps (anything else)."""
+    samples = []
+    for path in paths:
+        samples += load_csv(path, bias) if path.lower().endswith(".csv") else load_header_dump(path, bias)
+    return samples
+
+
+# --- Fitting ---
+class CalibrationTable:
+    """Fitted response of one filter: forward rate per level and the inverse rate -> level table."""
+
+    def __init__(self, filter, forward, inverse, coefficients=(), rms=0.0, samples=0, created=None):
+        self.filter = filter
+        self.forward = forward # ADU/s above bias for every level 0-MAX_BRIGHTNESS, non-decreasing
+        self.inverse = inverse # INVERSE_STEPS + 1 levels; inverse[i] reaches at least i / INVERSE_STEPS of max_rate
+        self.coefficients = list(coefficients) # Polynomial in the level, lowest power first
+        self.rms = rms # Relative RMS residual of the fit
+        self.samples = samples
+        self.created = created or time.time()
+
+    @property
+    def max_rate(self):
+        return self.forward[-1]
+
+    def level_for(self, adu, exposure, bias=0.0):
+        """Lowest PWM level that gives at least `adu` mean ADU in `exposure` seconds."""
+        if exposure <= 0:
+            raise CalibrationError("Exposure must be positive")
+        rate = (adu - bias) / exposure
+        if rate <= 0:
+            raise CalibrationError(f"{adu} ADU is not above the bias ({bias})")
+        if rate > self.max_rate:
+            raise CalibrationError(f"{self.filter}: {adu:g} ADU in {exposure:g} s needs more than full brightness; "
+                                   f"expose at least {(adu - bias) / self.max_rate:.2f} s")
+        level = self.inverse[math.ceil(rate / self.max_rate * INVERSE_STEPS)]
+        lowest = self.forward[1]
+        if level <= 1 and rate < lowest * 0.5:
+            raise CalibrationError(f"{self.filter}: {adu:g} ADU in {exposure:g} s is too faint for the lowest level; "
+                                   f"expose at most {(adu - bias) / lowest:.3f} s")
+        return max(1, level)
+
+    def adu_at(self, level, exposure, bias=0.0):
+        """Mean ADU the fit predicts for `level` and `exposure`."""
+        return bias + self.forward[level] * exposure
+
+    def to_dict(self):
+        return {"filter": self.filter, "created": self.created, "samples": self.samples, "rms": self.rms,
+                "coefficients": self.coefficients, "forward": self.forward, "inverse": self.inverse}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["filter"], data["forward"], data["inverse"], data.get("coefficients", ()),
+                   data.get("rms", 0.0), data.get("samples", 0), data.get("created"))
+
+    def __repr__(self):
+        return (f"CalibrationTable({self.filter!r}, max {self.max_rate:.0f} ADU/s, "
+                f"{self.samples} samples, rms {self.rms * 100:.1f}%)")
+
+
+def fit_filter(samples, degree=FIT_DEGREE):
+    """Fits one filter's samples; returns its CalibrationTable. Requires NumPy."""
+    try:
+        import numpy # Only fitting needs it; lookups from saved tables (and the CLI) stay free of the import
+    except ImportError:
+        raise ImportError("Fitting a calibration needs NumPy")
+    name = samples[0].filter
+    levels = numpy.array([sample.level for sample in samples], dtype=float)
+    rates = numpy.array([sample.rate for sample in samples], dtype=float)
+    distinct = len(numpy.unique(levels))
+    if distinct < 2:
+        raise CalibrationError(f"{name}: need flats at two or more brightness levels, got {distinct}")
+    polynomial = numpy.polynomial.Polynomial.fit(levels, rates, min(degree, distinct - 1))
+    residual = polynomial(levels) - rates
+    rms = float(numpy.sqrt(numpy.mean(residual ** 2)) / max(numpy.mean(numpy.abs(rates)), 1e-9))
+
+    # Evaluated for every level at once; a dip from the fit must not make the inverse ambiguous
+    forward = numpy.maximum.accumulate(numpy.clip(polynomial(numpy.arange(protocol.MAX_BRIGHTNESS + 1)), 0.0, None))
+    if forward[-1] <= 0:
+        raise CalibrationError(f"{name}: the fitted response is never above the bias")
+    targets = numpy.linspace(0.0, forward[-1], INVERSE_STEPS + 1)
+    inverse = numpy.minimum(numpy.searchsorted(forward, targets, side="left"), protocol.MAX_BRIGHTNESS)
+    coefficients = polynomial.convert().coef
+    return CalibrationTable(name, forward.tolist(), inverse.tolist(), coefficients.tolist(), rms, len(samples))
+
+
+def fit(samples, degree=FIT_DEGREE):
+    """CalibrationTables by filter name for a mixed list of samples."""
+    by_filter = {}
+    for sample in samples:
+        by_filter.setdefault(sample.filter, []).append(sample)
+    return {name: fit_filter(group, degree) for name, group in by_filter.items()}
+
+
+# --- Storage ---
+class CalibrationStore:
+    """Per-filter tables in a directory of JSON files, cached after the first load."""
+
+    def __init__(self, directory=None):
+        self.directory = directory or CALIBRATION_DIR
+        self._tables = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", name) + ".json")
+
+    def save(self, table):
+        """Writes the table atomically and makes it the cached one."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(table.filter)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as handle:
+            json.dump(table.to_dict(), handle)
+        os.replace(temp, path)
+        self._tables[table.filter] = table
+
+    def load(self, name):
+        """The table for filter `name`; CalibrationError if it was never fitted."""
+        table = self._tables.get(name)
+        if table is None:
+            try:
+                with open(self.path(name)) as handle:
+                    table = CalibrationTable.from_dict(json.load(handle))
+            except OSError:
+                raise CalibrationError(f"No calibration for filter {name!r}; run calibration.py fit")
+            except (ValueError, KeyError) as e:
+                raise CalibrationError(f"Calibration for filter {name!r} is unreadable: {e}")
+            self._tables[name] = table
+        return table
+
+    def filters(self):
+        """Names of the filters with a saved table."""
+        try:
+            names = sorted(entry for entry in os.listdir(self.directory) if entry.endswith(".json"))
+        except OSError:
+            return []
+        result = []
+        for entry in names:
+            try:
+                with open(os.path.join(self.directory, entry)) as handle:
+                    result.append(json.load(handle)["filter"])
+            except (OSError, ValueError, KeyError):
+                continue
+        return result
+
+    def level_for(self, name, adu, exposure, bias=0.0):
+        """PWM level for `adu` mean ADU in `exposure` seconds through filter `name`."""
+        return self.load(name).level_for(adu, exposure, bias)
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and query the panel's brightness calibration.")
+    parser.add_argument("--dir", help=f"Calibration directory (default {CALIBRATION_DIR})")
+    commands = parser.add_subparsers(dest="action", required=True)
+    fit_parser = commands.add_parser("fit", help="Fit samples from CSV files and FITS header dumps and save the tables")
+    fit_parser.add_argument("paths", nargs="+", help="*.csv: filter,level,exposure,adu[,bias]; otherwise a header dump")
+    fit_parser.add_argument("--bias", type=float, default=0.0, help="Bias ADU where a sample has none")
+    fit_parser.add_argument("--degree", type=int, default=FIT_DEGREE, help="Highest polynomial degree")
+    level_parser = commands.add_parser("level", help="PWM level for a target mean ADU and exposure")
+    level_parser.add_argument("filter")
+    level_parser.add_argument("adu", type=float)
+    level_parser.add_argument("exposure", type=float, help="Seconds")
+    level_parser.add_argument("--bias", type=float, default=0.0, help="Bias ADU of the camera")
+    show_parser = commands.add_parser("show", help="List the saved tables")
+    show_parser.add_argument("filter", nargs="?")
+    args = parser.parse_args()
+
+    store = CalibrationStore(args.dir)
+    try:
+        if args.action == "fit":
+            samples = load_samples(args.paths, args.bias)
+            if not samples:
+                raise CalibrationError("No usable samples")
+            for table in fit(samples, args.degree).values():
+                store.save(table)
+                print(f"{table} -> {store.path(table.filter)}")
+        elif args.action == "level":
+            table = store.load(args.filter)
+            level = table.level_for(args.adu, args.exposure, args.bias)
+            print(f"{level}  (expected {table.adu_at(level, args.exposure, args.bias):.0f} ADU)")
+        else:
+            for name in [args.filter] if args.filter else store.filters():
+                table = store.load(name)
+                print(f"{table}: level 1 = {table.forward[1]:.1f} ADU/s, "
+                      f"level {protocol.MAX_BRIGHTNESS} = {table.max_rate:.1f} ADU/s")
+    except (CalibrationError, OSError) as e:
+        parser.exit(1, f"{e}\n")
@@ -0,0 +1,78 @@
+"""Latest-wins command coalescing for live controls.
+
+Up to v1.5 the firmware blocks while the servo moves, so anything sent
+meanwhile piles up in its 64-byte receive buffer; v1.6 takes every SETPOS at
+once and restarts its motion profile from wherever the servo is, which makes
+a drag jerky. LatestWinsScheduler keeps at most one command per key
+outstanding and remembers only the newest request made while it waits; the
+completing reply (for SETPOS, the move-complete RESULT:STATUS) is the signal
+to send the next one. Dragging a slider therefore produces a short chain of
+moves that always ends at the final position, and never a backlog of stale
+ones.
+
+    scheduler = LatestWinsScheduler()
+    scheduler.submit("SETPOS", lambda: client.set_position(angle))  # on the event loop
+"""
+import asyncio
+import collections
+import time
+
+# --- Constants ---
+MIN_SEND_INTERVAL = 0.05 # Seconds between sends for one key, even when the device answers at once
+# --- End Constants ---
+
+
+class LatestWinsScheduler:
+    """Runs at most one awaitable per key; newer submissions replace a waiting one."""
+
+    def __init__(self, min_interval=MIN_SEND_INTERVAL, on_send=None, on_error=None):
+        self.min_interval = min_interval
+        self.on_send = on_send # on_send(description) just before a command goes out
+        self.on_error = on_error # on_error(description, exception) if it fails
+        self.stats = collections.Counter() # submitted / sent / replaced / errors
+        self._waiting = {} # key -> (factory, description)
+        self._tasks = {} # key -> drain task
+        self._last_sent = {}
+
+    def submit(self, key, factory, description=None):
+        """Schedules factory() (returning an awaitable) under `key`. Call on the event loop."""
+        self.stats["submitted"] += 1
+        if key in self._waiting:
+            self.stats["replaced"] += 1
+        self._waiting[key] = (factory, description or key)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._drain(key))
+
+    def busy(self, key):
+        """True while a command for `key` is outstanding or waiting."""
+        return key in self._tasks
+
+    def cancel(self, key):
+        """Forgets a waiting command; one already sent still completes."""
+        self._waiting.pop(key, None)
+
+    async def _drain(self, key):
+        try:
+            while key in self._waiting:
+                delay = self._last_sent.get(key, 0.0) + self.min_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay) # Newer submissions may replace the target meanwhile
+                    if key not in self._waiting:
+                        break
+                factory, description = self._waiting.pop(key)
+                self._last_sent[key] = time.monotonic()
+                self.stats["sent"] += 1
+                if self.on_send:
+                    self.on_send(description)
+                try:
+                    await factory() # Completes on the device's reply: this is the backpressure
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    if self.on_error:
+                        self.on_error(description, e)
+        finally:
+            del self._tasks[key]
+
+    def summary(self):
+        return (f"{self.stats['submitted']} requested, {self.stats['sent']} sent, "
+                f"{self.stats['replaced']} coalesced, {self.stats['errors']} failed")
@@ -0,0 +1,128 @@
+"""Finds the flat panel among the serial ports by its DEVICE_GUID.
+
+Candidate ports are probed concurrently with COMMAND:PING, each with its own
+timeout. Ports that answered the PING are cached by USB VID/PID/serial
+number, so on the next launch the panel's port is known without opening
+anything. A port that timed out or could not be opened (busy, still booting)
+is not cached and is probed again next time.
+
+    ports = await discovery.discover() # ['/dev/ttyACM1']
+    port = discovery.find_cached()     # '/dev/ttyACM1' (no I/O besides listing ports)
+"""
+import asyncio
+import json
+import os
+import time
+
+import serial.tools.list_ports
+
+import protocol
+from panel_client import PanelClient, PanelError
+
+# --- Constants ---
+PROBE_TIMEOUT = 3.0 # Per port; covers a board that resets when opened
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".flatpanel", "ports.json")
+CACHE_MAX_AGE = 7 * 24 * 3600 # Seconds a port cached as something else is skipped before it is probed again
+# --- End Constants ---
+
+
+def port_key(info):
+    """'VID:PID:SERIAL' for USB ports, None for ports that cannot be recognized again."""
+    if info.vid is None or info.pid is None:
+        return None
+    return f"{info.vid:04X}:{info.pid:04X}:{info.serial_number or ''}"
+
+
+class PortCache:
+    """JSON file mapping port keys to the GUID found there (None = not a panel)."""
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_PATH
+        self.entries = {}
+        try:
+            with open(self.path) as handle:
+                self.entries = json.load(handle)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def lookup(self, info, max_age=None):
+        """Returns the cache entry for a ListPortInfo, or None if never probed (or checked more than max_age s ago)."""
+        key = port_key(info)
+        entry = self.entries.get(key) if key else None
+        if entry and max_age is not None and time.time() - entry.get("checked", 0) > max_age:
+            return None
+        return entry
+
+    def store(self, info, guid):
+        key = port_key(info)
+        if key:
+            self.entries[key] = {"guid": guid, "device": info.device, "checked": time.time()}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as handle:
+                json.dump(self.entries, handle, indent=2)
+        except OSError:
+            pass
+
+
+async def list_ports():
+    """serial.tools.list_ports.comports() without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, serial.tools.list_ports.comports)
+
+
+async def probe_port(device, timeout=PROBE_TIMEOUT):
+    """Returns the GUID in the RESULT:PING reply on `device`, or None if there was no reply (timeout, busy port, ...)."""
+    client = PanelClient(device)
+    try:
+        # DTR held low so a running board is not reset by the probe
+        await client.open(reset=False)
+        return await asyncio.wait_for(client.ping_until_ready(), timeout)
+    except (asyncio.TimeoutError, PanelError, OSError, serial.SerialException):
+        return None
+    finally:
+        await client.close()
+
+
+async def probe_ports(devices, timeout=PROBE_TIMEOUT):
+    """Probes all devices concurrently; returns {device: guid or None}."""
+    results = await asyncio.gather(*(probe_port(device, timeout) for device in devices))
+    return dict(zip(devices, results))
+
+
+def find_cached(ports=None, guid=protocol.DEVICE_GUID, cache_path=None):
+    """Device path of a present port last seen answering with `guid`, or None."""
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
+    cache = PortCache(cache_path)
+    for info in ports:
+        entry = cache.lookup(info)
+        if entry and entry.get("guid") == guid:
+            return info.device
+    return None
+
+
+async def discover(guid=protocol.DEVICE_GUID, timeout=PROBE_TIMEOUT, use_cache=True, cache_path=None):
+    """Returns the devices answering with `guid`, probing every port not already cached.
+
+    Ports cached as a panel are confirmed with a probe as well; ports cached as
+    something else are skipped for CACHE_MAX_AGE, or not at all if use_cache
+    is False. Only a PING reply is cached: a port that did not answer keeps
+    its previous entry.
+    """
+    ports = await list_ports()
+    cache = PortCache(cache_path)
+    candidates = []
+    for info in ports:
+        entry = cache.lookup(info, CACHE_MAX_AGE) if use_cache else None
+        if entry is not None and entry.get("guid") != guid:
+            continue # Known to be the mount, focuser, ...
+        candidates.append(info)
+    results = await probe_ports([info.device for info in candidates], timeout)
+    for info in candidates:
+        if results[info.device] is not None:
+            cache.store(info, results[info.device])
+    cache.save()
+    return [info.device for info in candidates if results[info.device] == guid]
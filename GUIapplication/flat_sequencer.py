@@ -0,0 +1,245 @@
+"""Flat-field session sequencer with step timing and jitter statistics.
+
+Runs the panel through a flat session: close, confirm CLOSED, LED on, settle,
+hold for N exposures, LED off, open. Each step waits for the firmware's own
+confirmation (the status line the move or SETLED ends with, checked against
+the client's PanelState), never for a fixed delay. Timed steps (settle,
+exposures) sleep until absolute deadlines on time.monotonic(), so lateness
+does not accumulate. After each run the report shows how long every step
+took and how late the timed waits woke up, which is what the settle time
+can be tightened against:
+
+    python3 flat_sequencer.py --port /dev/ttyACM0 --exposures 20 --exposure 2 --settle 1
+    python3 flat_sequencer.py --sim --time-scale 0.2 --runs 5
+
+From a Tk app, run FlatSequencer.run() on the client's LoopThread.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from panel_client import PanelClient, PanelError
+
+# --- Constants ---
+SETTLE_TIME = 2.0 # Seconds between the LED being confirmed on and the first exposure
+EXPOSURES = 10
+EXPOSURE_TIME = 1.0 # Seconds per exposure when no expose callback is given
+# --- End Constants ---
+
+
+class SequenceError(PanelError):
+    """The panel did not reach the state a step requires."""
+
+
+class StepTiming:
+    """Timing of one step of one run."""
+
+    __slots__ = ("name", "start", "end", "lateness")
+
+    def __init__(self, name, start, end, lateness=None):
+        self.name = name
+        self.start = start # time.monotonic()
+        self.end = end
+        self.lateness = lateness # Timed waits: seconds woken after the deadline
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class SessionReport:
+    """Step timings of one run."""
+
+    def __init__(self):
+        self.steps = []
+        self.start = time.monotonic()
+        self.end = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.end is not None
+
+    def summary(self):
+        lines = [f"{'Step':<12}{'Duration':>10}{'Late':>10}"]
+        for step in self.steps:
+            late = "" if step.lateness is None else f"{step.lateness * 1000:.1f} ms"
+            lines.append(f"{step.name:<12}{step.duration:>9.3f}s{late:>10}")
+        total = (self.end or time.monotonic()) - self.start
+        lines.append(f"Total {total:.2f} s" + (f", FAILED: {self.error}" if self.error else ""))
+        return "\n".join(lines)
+
+
+class SequencerStats:
+    """Per-step duration and wake-up jitter over several runs."""
+
+    def __init__(self):
+        self.durations = {} # step name -> [seconds]
+        self.lateness = {}
+
+    def add(self, report):
+        for step in report.steps:
+            self.durations.setdefault(step.name, []).append(step.duration)
+            if step.lateness is not None:
+                self.lateness.setdefault(step.name, []).append(step.lateness)
+
+    def summary(self):
+        lines = [f"{'Step':<12}{'n':>5}{'mean':>10}{'min':>10}{'max':>10}{'jitter':>10}"]
+        for name, values in self.durations.items():
+            jitter = statistics.pstdev(values) if len(values) > 1 else 0.0
+            lines.append(f"{name:<12}{len(values):>5}{statistics.fmean(values):>9.3f}s"
+                         f"{min(values):>9.3f}s{max(values):>9.3f}s{jitter * 1000:>8.1f}ms")
+        for name, values in self.lateness.items():
+            worst = max(values)
+            lines.append(f"{name} wake-up: mean {statistics.fmean(values) * 1000:.2f} ms late, "
+                         f"worst {worst * 1000:.2f} ms, jitter {statistics.pstdev(values) * 1000:.2f} ms")
+        return "\n".join(lines)
+
+
+class FlatSequencer:
+    """Scripts one flat session on a connected PanelClient.
+
+    expose(index) is an optional coroutine function that takes exposure
+    `index` (e.g. triggers the camera and returns when the frame is read
+    out); without it each exposure is a timed hold of exposure_time.
+    on_step(step, report) is called on the event loop with each StepTiming.
+    level is the PWM brightness for the session (firmware v1.7), e.g. from
+    calibration.CalibrationStore.level_for(); None keeps the panel's level.
+    """
+
+    def __init__(self, client, exposures=EXPOSURES, exposure_time=EXPOSURE_TIME, settle=SETTLE_TIME,
+                 expose=None, on_step=None, level=None):
+        self.client = client
+        self.level = level
+        self.exposures = exposures
+        self.exposure_time = exposure_time
+        self.settle = settle
+        self.expose = expose
+        self.on_step = on_step
+        self.stats = SequencerStats()
+
+    async def run(self):
+        """Runs the whole session; returns its SessionReport (also on failure, with .error set)."""
+        report = SessionReport()
+        try:
+            await self._step(report, "close", self._close)
+            await self._step(report, "led_on", self._led_on)
+            settled = await self._timed(report, "settle", time.monotonic() + self.settle)
+            for index in range(self.exposures):
+                name = f"exposure_{index + 1}"
+                if self.expose:
+                    await self._step(report, name, lambda: self.expose(index))
+                else:
+                    # Deadlines from the end of settling, so a late wake-up does not shift later frames
+                    deadline = settled + (index + 1) * self.exposure_time
+                    await self._timed(report, name, deadline)
+            await self._step(report, "led_off", self._led_off)
+            await self._step(report, "open", self._open)
+            report.end = time.monotonic()
+        except (PanelError, OSError) as e:
+            report.error = e
+            await self._make_safe()
+        except asyncio.CancelledError:
+            report.error = "cancelled"
+            await self._make_safe()
+            raise
+        finally:
+            self.stats.add(report)
+        return report
+
+    async def _step(self, report, name, action):
+        start = time.monotonic()
+        await action()
+        self._record(report, StepTiming(name, start, time.monotonic()))
+
+    async def _timed(self, report, name, deadline):
+        start = time.monotonic()
+        await asyncio.sleep(max(0.0, deadline - start))
+        end = time.monotonic()
+        self._record(report, StepTiming(name, start, end, lateness=end - deadline))
+        return end
+
+    def _record(self, report, step):
+        report.steps.append(step)
+        if self.on_step:
+            self.on_step(step, report)
+
+    # --- Steps; each returns once the firmware has confirmed it ---
+    async def _close(self):
+        await self.client.close_cover() # Resolves on the end-of-move status line
+        if self.client.state.cover_state != "CLOSED":
+            raise SequenceError(f"Cover not closed (state {self.client.state})")
+
+    async def _led_on(self):
+        await self.client.set_led(True, self.level)
+        if not self.client.state.led_on:
+            raise SequenceError(f"LED did not turn on (state {self.client.state})")
+
+    async def _led_off(self):
+        await self.client.set_led(False)
+        if self.client.state.led_requested:
+            raise SequenceError("LED did not turn off")
+
+    async def _open(self):
+        await self.client.open_cover()
+        if self.client.state.cover_state != "OPEN":
+            raise SequenceError(f"Cover not open (state {self.client.state})")
+
+    async def _make_safe(self):
+        """After a failure or abort: LED off, cover left where it is."""
+        if self.client.is_open:
+            try:
+                await self.client.set_led(False)
+            except PanelError:
+                pass
+
+
+async def _main(port, args):
+    client = PanelClient(port)
+    await client.connect(reset=not args.no_reset)
+    sequencer = FlatSequencer(client, args.exposures, args.exposure, args.settle,
+                              on_step=lambda step, report: print(f"  {step.name} {step.duration:.3f} s") if args.verbose else None,
+                              level=args.level)
+    failures = 0
+    try:
+        for run in range(args.runs):
+            report = await sequencer.run()
+            print(f"Run {run + 1}/{args.runs}\n{report.summary()}\n")
+            failures += not report.ok
+    finally:
+        await client.close()
+    if args.runs > 1:
+        print(f"Over {args.runs} runs:\n{sequencer.stats.summary()}")
+    return failures
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run flat-field sessions on the panel and report step timing.")
+    parser.add_argument("--port", help="Serial port of the panel")
+    parser.add_argument("--sim", action="store_true", help="Use a simulated panel")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Time scale of the simulated panel")
+    parser.add_argument("--exposures", type=int, default=EXPOSURES, help=f"Exposures per run (default {EXPOSURES})")
+    parser.add_argument("--exposure", type=float, default=EXPOSURE_TIME, help="Seconds per exposure")
+    parser.add_argument("--settle", type=float, default=SETTLE_TIME, help="Seconds after LED on before exposing")
+    parser.add_argument("--level", type=int, help="LED brightness 0-255 (firmware v1.7; default: keep the panel's)")
+    parser.add_argument("--runs", type=int, default=1, help="Repeat the session this many times")
+    parser.add_argument("--no-reset", action="store_true", help="Do not reset the board when opening the port")
+    parser.add_argument("--verbose", action="store_true", help="Print every step as it ends")
+    args = parser.parse_args()
+
+    panel = None
+    port = args.port
+    if args.sim:
+        from panel_sim import VirtualPanel
+        panel = VirtualPanel(time_scale=args.time_scale)
+        port = panel.start()
+    if not port:
+        parser.error("Give --port or --sim")
+    try:
+        failed = asyncio.run(_main(port, args))
+    finally:
+        if panel:
+            panel.stop()
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,194 @@
+"""Command-line control of the flat panel, for scripts and observatory automation.
+
+Connects, sends the commands, prints each confirmed result and exits; the
+GUI (and tkinter) is only imported for the `gui` command:
+
+    python -m flatpanel close --led on
+    python -m flatpanel setpos 90 status
+    python -m flatpanel --batch night_start.txt      # one command per line, '#' comments, '-' for stdin
+    python -m flatpanel gui
+
+Commands: open, close, stop, status, state, ping, info, led on|off [LEVEL],
+setpos ANGLE, telemetry on|off, flat FILTER ADU SECONDS (LED on at the level
+calibration.py resolves for that mean ADU above bias), or a raw COMMAND:...
+string. All commands of one call are
+pipelined over one connection (the client keeps them within the firmware's
+64-byte receive buffer and matches replies in order), so a batch costs one
+connect plus the firmware's own processing time.
+
+The port is --port, else the one cached by "Find Panel", else found by
+probing. The board is not reset on open (DTR held low), so the command runs
+as soon as the first PING is answered; --reset waits for a full reboot.
+--binary sends the commands as binary frames (firmware v1.6), which saves
+bytes on long batches; the next ASCII command from anyone switches back.
+Exit status: 0 if every command was confirmed, 1 if any failed, 2 if the
+panel could not be reached.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import protocol
+from panel_client import PanelClient, PanelError
+
+# --- Constants ---
+ON_OFF = {"on": True, "off": False, "1": True, "0": False}
+# --- End Constants ---
+
+
+class CommandError(ValueError):
+    """A command word or argument the CLI does not understand."""
+
+
+def parse_commands(words):
+    """Turns command words into firmware command strings, e.g. ['led', 'on'] -> ['COMMAND:SETLED:1']."""
+    commands = []
+    words = list(words)
+    while words:
+        word = words.pop(0)
+        verb = word.lower()
+        if word.upper().startswith("COMMAND:"):
+            commands.append(word.upper())
+        elif verb in ("open", "close", "stop", "status", "state", "ping", "info"):
+            commands.append({"open": protocol.COMMAND_OPEN, "close": protocol.COMMAND_CLOSE, "stop": protocol.COMMAND_STOP,
+                             "status": protocol.COMMAND_GETSTATUS, "state": protocol.COMMAND_GETSTATE,
+                             "ping": protocol.COMMAND_PING, "info": protocol.COMMAND_INFO}[verb])
+        elif verb in ("led", "telemetry"):
+            if not words or words[0].lower() not in ON_OFF:
+                raise CommandError(f"'{verb}' needs on or off")
+            on = ON_OFF[words.pop(0).lower()]
+            if verb == "telemetry":
+                commands.append(protocol.set_telemetry_command(on))
+                continue
+            level = int(words.pop(0)) if words and words[0].isdigit() else None
+            if level is not None and level > protocol.MAX_BRIGHTNESS:
+                raise CommandError(f"Brightness must be 0-{protocol.MAX_BRIGHTNESS}")
+            commands.append(protocol.set_led_command(on, level))
+        elif verb == "flat":
+            import calibration # Only this verb reads the calibration tables
+            try:
+                name, adu, seconds = words.pop(0), float(words.pop(0)), float(words.pop(0))
+            except (IndexError, ValueError):
+                raise CommandError("'flat' needs FILTER ADU SECONDS")
+            try:
+                commands.append(protocol.set_led_command(True, calibration.CalibrationStore().level_for(name, adu, seconds)))
+            except calibration.CalibrationError as e:
+                raise CommandError(str(e))
+        elif verb == "setpos":
+            try:
+                angle = int(words.pop(0))
+            except (IndexError, ValueError):
+                raise CommandError("'setpos' needs an angle")
+            if not protocol.MIN_ANGLE <= angle <= protocol.MAX_ANGLE:
+                raise CommandError(f"Angle must be {protocol.MIN_ANGLE}-{protocol.MAX_ANGLE}")
+            commands.append(protocol.set_position_command(angle))
+        else:
+            raise CommandError(f"Unknown command '{word}'")
+    return commands
+
+
+def read_batch(path):
+    """Command words of a batch file (or stdin for '-'): one or more commands per line, '#' starts a comment."""
+    handle = sys.stdin if path == "-" else open(path)
+    try:
+        words = []
+        for line in handle:
+            words += line.split("#", 1)[0].split()
+        return words
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def describe(message):
+    """One-line rendering of the message that completed a command."""
+    if isinstance(message, protocol.Status):
+        closed = abs(message.angle - protocol.MIN_ANGLE) < protocol.STATE_TOLERANCE
+        led = "on" if message.led and closed else "off (on once closed)" if message.led else "off"
+        level = f", brightness {message.level}/{protocol.MAX_BRIGHTNESS}" if message.level is not None else ""
+        return f"{'CLOSED' if closed else 'OPEN'}, angle {message.angle}, LED {led}{level}"
+    if isinstance(message, protocol.State):
+        return message.state
+    if isinstance(message, protocol.Ping):
+        return f"GUID {message.guid}"
+    if isinstance(message, protocol.Info):
+        return message.text
+    return "OK"
+
+
+async def run(port, commands, reset=False, timing=None, binary=False):
+    """Connects, pipelines `commands` and prints each result; returns the number that failed."""
+    start = time.perf_counter()
+    client = PanelClient(port)
+    try:
+        await client.connect(reset=reset)
+    except (PanelError, OSError) as e:
+        print(f"{port}: {e}", file=sys.stderr)
+        return None
+    if binary:
+        try:
+            await client.set_binary(True)
+        except PanelError as e:
+            print(f"{port}: binary mode unavailable ({e}), using ASCII", file=sys.stderr)
+    connected = time.perf_counter()
+    # All requests are queued before the first reply; the client paces them into the RX buffer
+    tasks = [asyncio.ensure_future(client.request(command)) for command in commands]
+    failed = 0
+    try:
+        for command, task in zip(commands, tasks):
+            try:
+                print(f"{command}: {describe(await task)}")
+            except PanelError as e:
+                failed += 1
+                print(f"{command}: FAILED: {e}", file=sys.stderr)
+    finally:
+        await client.close()
+    if timing is not None:
+        timing.update(connect=connected - start, commands=time.perf_counter() - connected)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="flatpanel", description="Control the flat panel from the command line.")
+    parser.add_argument("commands", nargs="*", help="open, close, stop, status, state, ping, info, led on|off [LEVEL], setpos ANGLE, "
+                                                     "telemetry on|off, flat FILTER ADU SECONDS, COMMAND:..., or gui")
+    parser.add_argument("--led", choices=["on", "off"], help="Set the LED after the other commands")
+    parser.add_argument("--batch", help="File with more commands ('-' reads stdin), sent after the ones given")
+    parser.add_argument("--port", help="Serial port (default: the cached or discovered panel)")
+    parser.add_argument("--reset", action="store_true", help="Reset the board on connect (waits for it to boot)")
+    parser.add_argument("--timing", action="store_true", help="Print connect and command times to stderr")
+    parser.add_argument("--binary", action="store_true", help="Send the commands as binary frames (firmware v1.6)")
+    args = parser.parse_args(argv)
+
+    if args.commands == ["gui"]:
+        from gui import TelescopeCoverApp # The only path that loads tkinter
+        TelescopeCoverApp().mainloop()
+        return 0
+    words = args.commands + (read_batch(args.batch) if args.batch else []) + (["led", args.led] if args.led else [])
+    try:
+        commands = parse_commands(words)
+    except CommandError as e:
+        parser.error(str(e))
+    if not commands:
+        parser.error("Nothing to do")
+
+    port = args.port
+    if not port:
+        import discovery
+        port = discovery.find_cached() or next(iter(asyncio.run(discovery.discover())), None)
+        if not port:
+            print("No panel found; pass --port", file=sys.stderr)
+            return 2
+    timing = {}
+    failed = asyncio.run(run(port, commands, args.reset, timing, args.binary))
+    if args.timing and timing:
+        print(f"connect {timing['connect'] * 1000:.0f} ms, commands {timing['commands'] * 1000:.0f} ms", file=sys.stderr)
+    if failed is None:
+        return 2
+    return 1 if failed else 0
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    sys.exit(main())
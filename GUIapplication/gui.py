@@ -1,20 +1,35 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import serial
-import serial.tools.list_ports
 import time
-# import threading # Not strictly needed if only using root.after
+import queue
+import protocol
+from panel_client import PanelClient, PanelTimeout, LoopThread
+from panel_state import DEFAULT_MAX_AGE
+from log_view import LogSink
+from command_scheduler import LatestWinsScheduler
+import discovery
+import metrics
+from traffic_log import TrafficRecorder
+from supervisor import LinkSupervisor
+from tk_bridge import WakeupQueue, ViewCache
 
 # --- Constants ---
-BAUD_RATE = 57600
-READ_TIMEOUT = 1 # How long pyserial waits for data (seconds)
-GUI_UPDATE_INTERVAL = 100 # How often to check for serial data (milliseconds)
+BAUD_RATE = protocol.BAUD_RATE
+GUI_UPDATE_INTERVAL = 100 # Milliseconds granted to queued messages before the window closes; everything else wakes the GUI itself
+LOG_MAX_LINES = 1000 # Lines kept in the status window
+LOG_FILE = None # Set to a path to keep the full history in a rotating file
+METRICS_FILE = None # Set to a path to write Prometheus metrics there (node_exporter textfile collector)
+METRICS_PORT = None # Set to a port to serve Prometheus metrics on http://127.0.0.1:<port>/metrics
+TRAFFIC_LOG = None # Set to a path to record all serial traffic there (see traffic_log.py)
+AUTO_RECONNECT = True # Reconnect and restore the requested state when the link drops (see supervisor.py)
+STATE_MAX_AGE = DEFAULT_MAX_AGE # Seconds a cached status is trusted before asking the firmware again
 # --- Angle Limits ---
-MIN_SERVO_ANGLE = 20
-MAX_SERVO_ANGLE = 180
+MIN_SERVO_ANGLE = protocol.MIN_ANGLE
+MAX_SERVO_ANGLE = protocol.MAX_ANGLE
 # --- LED On/Off Value (Now just 1 for On) ---
 # LED_ON_BRIGHTNESS = 255 # No longer needed
+LED_BRIGHTNESS = protocol.MAX_BRIGHTNESS # Level the brightness slider starts at (firmware v1.7 PWM)
 # ---
 
 # --- Main Application Class ---
@@ -24,10 +39,22 @@ class TelescopeCoverApp(tk.Tk):
         self.title("Telescope Cover Control")
         self.geometry("450x350") # Keep reduced height
 
-        self.serial_port = None
+        self.client = None # PanelClient for the open connection
+        self.supervisor = None # LinkSupervisor reconnecting self.client (AUTO_RECONNECT)
+        self.loop_thread = LoopThread() # Runs the client's asyncio loop
+        self.rx_queue = WakeupQueue(self, self.read_serial_data) # Lines and link errors from the client loop; each put wakes the Tk loop
+        self.view = ViewCache() # Skips widget updates that would change nothing
+        metrics.start_export(self.loop_thread, METRICS_FILE, METRICS_PORT)
+        self.traffic_recorder = TrafficRecorder(TRAFFIC_LOG) if TRAFFIC_LOG else None
         self.port_var = tk.StringVar()
         self.connected = tk.BooleanVar(value=False)
+        self.connecting = False # True while the client waits for the firmware to become ready
+        self.no_reset_var = tk.BooleanVar(value=False) # Open without toggling DTR
         self.stop_reading_flag = False
+        self.dragging = False # Slider held: live moves, and status replies must not move the slider under the pointer
+        # Keeps one SETPOS in flight and only the newest target waiting behind it
+        self.move_scheduler = LatestWinsScheduler(on_send=lambda d: self.rx_queue.put(("LOG", f"Sent: {d}")),
+                                                  on_error=lambda d, e: self.rx_queue.put(f"COMMAND_ERROR:{d}: {e}") if isinstance(e, PanelTimeout) else None)
 
         # --- Status Frame ---
         status_frame = ttk.LabelFrame(self, text="Status")
@@ -37,6 +64,7 @@ class TelescopeCoverApp(tk.Tk):
         self.status_text['yscrollcommand'] = status_scrollbar.set
         status_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.status_text.pack(side=tk.LEFT, padx=(5,0), pady=5, fill="both", expand=True)
+        self.status_log = LogSink(self.status_text, max_lines=LOG_MAX_LINES, log_file=LOG_FILE)
 
         # --- Serial Connection Frame ---
         connection_frame = ttk.LabelFrame(self, text="Connection")
@@ -48,6 +76,10 @@ class TelescopeCoverApp(tk.Tk):
         self.connect_button.grid(row=0, column=2, padx=5, pady=5)
         self.refresh_button = ttk.Button(connection_frame, text="Refresh Ports", command=self.update_port_list)
         self.refresh_button.grid(row=0, column=3, padx=5, pady=5)
+        self.find_button = ttk.Button(connection_frame, text="Find Panel", command=self.find_panel)
+        self.find_button.grid(row=0, column=4, padx=5, pady=5)
+        self.no_reset_check = ttk.Checkbutton(connection_frame, text="Don't reset board", variable=self.no_reset_var)
+        self.no_reset_check.grid(row=1, column=0, columnspan=5, padx=5, pady=(0,5), sticky="w")
 
         # --- Servo Control Frame ---
         servo_frame = ttk.LabelFrame(self, text="Servo Control")
@@ -57,6 +89,7 @@ class TelescopeCoverApp(tk.Tk):
         self.servo_slider = ttk.Scale(servo_frame, from_=MIN_SERVO_ANGLE, to=MAX_SERVO_ANGLE, orient=tk.HORIZONTAL,
                                       variable=self.servo_angle_var, length=200,
                                       command=self.update_servo_entry_from_slider)
+        self.servo_slider.bind("<ButtonPress-1>", self.start_slider_drag)
         self.servo_slider.bind("<ButtonRelease-1>", self.set_servo_from_slider_release)
         self.servo_slider.grid(row=0, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
         self.servo_entry = ttk.Entry(servo_frame, textvariable=self.servo_angle_var, width=5)
@@ -66,6 +99,7 @@ class TelescopeCoverApp(tk.Tk):
         servo_button_frame.grid(row=1, column=0, columnspan=4, pady=(0,5))
         ttk.Button(servo_button_frame, text=f"Open ({MAX_SERVO_ANGLE}°)", command=self.servo_open).pack(side=tk.LEFT, padx=5)
         ttk.Button(servo_button_frame, text=f"Close ({MIN_SERVO_ANGLE}°)", command=self.servo_close).pack(side=tk.LEFT, padx=5)
+        ttk.Button(servo_button_frame, text="Stop", command=self.servo_stop).pack(side=tk.LEFT, padx=5)
 
         # --- LED On/Off Control Frame ---
         led_on_off_frame = ttk.LabelFrame(self, text="LED Control")
@@ -78,6 +112,14 @@ class TelescopeCoverApp(tk.Tk):
             command=self.toggle_led # Calls updated function
         )
         self.led_checkbutton.pack(side=tk.LEFT, padx=10, pady=5)
+        ttk.Label(led_on_off_frame, text=f"Brightness (0-{protocol.MAX_BRIGHTNESS}):").pack(side=tk.LEFT, padx=5, pady=5)
+        self.led_level_var = tk.IntVar(value=LED_BRIGHTNESS)
+        self.led_level_supported = False # Set once the firmware reports a level (v1.7)
+        self.led_level_slider = ttk.Scale(led_on_off_frame, from_=0, to=protocol.MAX_BRIGHTNESS, orient=tk.HORIZONTAL,
+                                          variable=self.led_level_var, length=150,
+                                          command=lambda value: self.led_level_var.set(int(float(value))))
+        self.led_level_slider.bind("<ButtonRelease-1>", self.set_led_level_from_slider_release)
+        self.led_level_slider.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.X, expand=True)
 
         # Configure grid resizing behavior
         self.grid_rowconfigure(3, weight=1)
@@ -93,69 +135,123 @@ class TelescopeCoverApp(tk.Tk):
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     # --- Serial Communication Methods (Unchanged) ---
+    def when_done(self, future, callback):
+        # Hands a finished loop-thread future to callback on the Tk thread
+        future.add_done_callback(lambda f: self.rx_queue.put(("DONE",(callback,f))))
     def update_port_list(self):
-        try: ports = [p.device for p in serial.tools.list_ports.comports()]; self.port_combobox['values'] = ports; current = self.port_var.get(); self.port_var.set(ports[0] if ports and current not in ports else (current if current in ports else "")); self.log_status("Refreshed COM port list.")
+        # comports() can take seconds on some systems; run it on the client loop
+        self.when_done(self.loop_thread.submit(discovery.list_ports()), self.finish_port_list)
+    def finish_port_list(self, future):
+        try:
+            infos = future.result(); ports = [p.device for p in infos]; self.port_combobox['values'] = ports; current = self.port_var.get(); cached = discovery.find_cached(infos)
+            self.port_var.set(cached if cached and not self.connected.get() else (ports[0] if ports and current not in ports else (current if current in ports else ""))); self.log_status("Refreshed COM port list." + (f" Panel last seen on {cached}." if cached else ""))
         except Exception as e: self.log_status(f"Error refreshing COM ports: {e}"); messagebox.showerror("Port Error", f"Could not retrieve COM ports:\n{e}")
+    def find_panel(self):
+        self.log_status("Searching for the panel..."); self.find_button.config(state=tk.DISABLED); self.connect_button.config(state=tk.DISABLED) # Probing opens the ports
+        self.when_done(self.loop_thread.submit(discovery.discover(use_cache=False)), self.finish_find_panel) # Asked for: probe ports cached as non-panels too
+    def finish_find_panel(self, future):
+        self.update_ui_connection_state()
+        try: found = future.result()
+        except Exception as e: self.log_status(f"Panel search failed: {e}"); return
+        if not found: self.log_status("No panel answered on any port."); return
+        ports = list(self.port_combobox['values'])
+        if found[0] not in ports: self.port_combobox['values'] = ports + [found[0]]
+        self.port_var.set(found[0]); self.log_status(f"Panel found on {', '.join(found)}.")
     def toggle_connection(self): (self.connect if not self.connected.get() else self.disconnect)()
     def connect(self):
         port_name=self.port_var.get();
         if not port_name: messagebox.showerror("Connection Error", "Select COM port."); return
         try:
             self.log_status(f"Connecting to {port_name}...");
-            if self.serial_port and self.serial_port.is_open: self.serial_port.close(); time.sleep(0.1)
-            self.serial_port=serial.Serial(port_name,BAUD_RATE,timeout=READ_TIMEOUT); time.sleep(1.5); self.connected.set(True); self.log_status(f"Connected to {port_name}.");
-            self.stop_reading_flag=False; self.after(GUI_UPDATE_INTERVAL,self.read_serial_data); self.send_command("COMMAND:GETSTATUS"); self.update_ui_connection_state()
-        except Exception as e: messagebox.showerror("Connection Error",f"Failed: {e}"); self.log_status(f"Connection failed: {e}"); self.serial_port=None; self.connected.set(False); self.update_ui_connection_state()
+            if self.client: self.close_client()
+            self.client=PanelClient(port_name,BAUD_RATE); self.client.add_line_listener(self.rx_queue.put); self.client.add_disconnect_listener(lambda e: self.rx_queue.put(f"SERIAL_ERROR:{e}"))
+            if self.traffic_recorder: self.traffic_recorder.attach(self.client)
+            if AUTO_RECONNECT: self.supervisor=LinkSupervisor(self.client,on_event=lambda kind,text: self.rx_queue.put(("LINK",(kind,text))))
+            # Wait for the firmware on the client loop; finish_connect() runs from read_serial_data when it is ready
+            future=self.loop_thread.submit(self.client.connect(reset=not self.no_reset_var.get())); future.add_done_callback(lambda f: self.rx_queue.put(("CONNECTED",f)))
+            self.connecting=True; self.stop_reading_flag=False; self.update_ui_connection_state(); self.rx_queue.wake() # Anything queued before the connect
+        except Exception as e: self.connect_failed(e)
+    def finish_connect(self,future):
+        self.connecting=False
+        try: connect_time=future.result()
+        except Exception as e: self.connect_failed(e); return
+        self.connected.set(True); self.log_status(f"Connected to {self.client.port} in {connect_time:.2f} s."); self.refresh_status(); self.update_ui_connection_state()
+        if self.supervisor: self.loop_thread.call(self.supervisor.start)
+    def connect_failed(self,e):
+        self.connecting=False; messagebox.showerror("Connection Error",f"Failed: {e}"); self.log_status(f"Connection failed: {e}"); self.close_client(); self.connected.set(False); self.update_ui_connection_state()
+    def close_client(self):
+        if self.client:
+            try: self.loop_thread.submit(self.supervisor.close() if self.supervisor else self.client.close()).result(timeout=2)
+            except Exception as e: self.log_status(f"Error closing port: {e}")
+            if self.traffic_recorder: self.traffic_recorder.detach(self.client)
+        self.client=None; self.supervisor=None
+    def link_event(self,kind,text):
+        self.log_status(text)
+        if kind=="recovered": self.refresh_status()
     def disconnect(self):
         self.log_status("Disconnecting..."); self.stop_reading_flag=True
-        if self.serial_port and self.serial_port.is_open:
-            try: self.serial_port.close()
-            except Exception as e: self.log_status(f"Error closing port: {e}")
-        self.serial_port=None; self.connected.set(False); self.log_status("Disconnected."); self.update_ui_connection_state()
+        if self.client: self.log_status(f"Reader stats: {self.client.stats.summary()}"); self.log_status(f"Moves: {self.move_scheduler.summary()}")
+        self.close_client(); self.connected.set(False); self.log_status("Disconnected."); self.update_ui_connection_state()
     def send_command(self,command):
-        if self.serial_port and self.serial_port.is_open:
-            try: self.serial_port.write((command+'\n').encode('ascii')); self.log_status(f"Sent: {command}"); return True
-            except Exception as e: self.log_status(f"Serial write error: {e}"); messagebox.showerror("Serial Error",f"Send failed: {e}"); self.disconnect(); return False
+        if self.client and self.client.is_open:
+            future=self.loop_thread.submit(self.client.request(command)); future.add_done_callback(self.command_done); self.log_status(f"Sent: {command}"); return True
         else:
             if command!="COMMAND:GETSTATUS" or self.connected.get(): messagebox.showwarning("Not Connected","Connect first."); return False
+    def command_done(self,future):
+        # Runs on the client loop; ERROR: replies are already logged as received lines
+        if not future.cancelled() and isinstance(future.exception(),PanelTimeout): self.rx_queue.put(f"COMMAND_ERROR:{future.exception()}")
     def read_serial_data(self):
-        if self.connected.get() and self.serial_port and self.serial_port.is_open and not self.stop_reading_flag:
-            lines_read=0
-            try:
-                while self.serial_port.in_waiting>0:
-                    line=self.serial_port.readline().decode('ascii',errors='ignore').strip()
-                    if line: lines_read+=1; self.log_status(f"Recv: {line}"); self.parse_response(line)
-                    if lines_read>50: self.log_status("Warn: Many lines read."); break
-            except serial.SerialException as e: self.log_status(f"Read error: {e}. Disconnecting."); messagebox.showerror("Serial Error",f"Read error:\n{e}\n\nDisconnecting."); self.disconnect(); return
-            except Exception as e: self.log_status(f"Error processing data: {e}")
-            if self.connected.get() and not self.stop_reading_flag: self.after(GUI_UPDATE_INTERVAL,self.read_serial_data)
-            else: self.log_status("Serial reading stopped.") # Log reason if needed
+        # Also drained while disconnected, for port listing and discovery results; lines from a closed link are dropped
+        lines_read=0
+        try:
+            while True:
+                line=self.rx_queue.get_nowait()
+                if isinstance(line,tuple):
+                    kind,payload=line
+                    if kind=="DONE": payload[0](payload[1])
+                    elif kind=="CONNECTED": self.finish_connect(payload)
+                    elif kind=="LOG": self.log_status(payload)
+                    elif kind=="STATUS": self.finish_refresh_status(payload)
+                    elif kind=="LINK": self.link_event(*payload)
+                    continue
+                if not ((self.connected.get() or self.connecting) and self.client) or self.stop_reading_flag: continue # Left over from a closed link
+                if line.startswith("SERIAL_ERROR:") and self.supervisor: continue # The supervisor reports the loss and reconnects
+                if line.startswith("SERIAL_ERROR:"): e=line.split(":",1)[1]; self.log_status(f"Read error: {e}. Disconnecting."); messagebox.showerror("Serial Error",f"Read error:\n{e}\n\nDisconnecting."); self.disconnect(); return
+                if line.startswith("COMMAND_ERROR:"): self.log_status(line.split(":",1)[1]); continue
+                lines_read+=1; self.log_status(f"Recv: {line}"); self.parse_response(line)
+                if lines_read>50: self.log_status("Warn: Many lines read."); self.rx_queue.wake(); break # The rest after Tk has redrawn
+        except queue.Empty: pass
+        except Exception as e: self.log_status(f"Error processing data: {e}")
 
     # --- Feedback Parsing (Unchanged Logic, just interpreting 0/1 now) ---
     def parse_response(self, response):
-        if response.startswith("RESULT:STATUS:"):
-            try:
-                parts = response.split(':')
-                if len(parts) == 4:
-                    angle = int(parts[2])
-                    led_state = int(parts[3]) # Now 0 or 1
-
-                    angle = max(MIN_SERVO_ANGLE, min(MAX_SERVO_ANGLE, angle))
-
-                    if self.servo_angle_var.get() != angle: self.servo_angle_var.set(angle)
-
-                    # Update LED Checkbutton state (0=False, non-zero=True)
-                    is_led_on_arduino = (led_state != 0) # True if led_state is 1 (or any non-zero)
-                    if self.led_on_var.get() != is_led_on_arduino:
-                        self.led_on_var.set(is_led_on_arduino)
-                        # No need to log here, already logged Recv: line
-            except Exception as e: self.log_status(f"Error parsing status '{response}': {e}")
-        elif response == "RESULT:STATE:MOVING": self.log_status("Cover is moving...")
-        elif response.startswith("ERROR:"): self.log_status(f"Arduino Error: {response}"); messagebox.showwarning("Arduino Error",f"Error:\n{response}")
+        message = protocol.parse(response)
+        if isinstance(message, protocol.Status): self.show_status(message.angle, message.led, message.level)
+        elif isinstance(message, protocol.State) and message.state == "MOVING": self.log_status("Cover is moving...")
+        elif isinstance(message, protocol.MoveEnd) and message.stopped: self.log_status(f"Cover stopped at {message.angle}°.")
+        elif isinstance(message, protocol.Error): self.log_status(f"Arduino Error: {response}"); messagebox.showwarning("Arduino Error",f"Error:\n{response}")
+        elif isinstance(message, protocol.Unknown): self.log_status(f"Error parsing status '{response}'")
+
+    def show_status(self, angle, led, level=None):
+        angle = max(MIN_SERVO_ANGLE, min(MAX_SERVO_ANGLE, angle))
+
+        if not self.dragging: self.view.set(self.servo_angle_var, angle)
+
+        # Update LED Checkbutton state (firmware reports 0/1)
+        self.view.set(self.led_on_var, led) # No need to log here, already logged Recv: line
+        if level is not None: self.led_level_supported = True; self.view.set(self.led_level_var, level) # Firmware v1.7 reports the PWM level too
+    def refresh_status(self):
+        # Answered from the client's state cache while it is fresh; only a stale cache costs a GETSTATUS
+        if self.client and self.client.is_open:
+            future=self.loop_thread.submit(self.client.get_status(max_age=STATE_MAX_AGE)); future.add_done_callback(lambda f: self.rx_queue.put(("STATUS",f)))
+    def finish_refresh_status(self, future):
+        try: angle,led=future.result()
+        except Exception as e: self.log_status(f"Status query failed: {e}"); return
+        self.show_status(angle,led)
 
     # --- GUI Callbacks & Updates ---
     def set_controls_state(self, state):
-         widgets = [self.servo_slider, self.servo_entry, self.led_checkbutton]
+         widgets = [self.servo_slider, self.servo_entry, self.led_checkbutton, self.led_level_slider]
          try:
              container = self.children.get('!telescopecoverapp.!labelframe2.!frame')
              if container and container.winfo_exists(): widgets.extend(c for c in container.winfo_children() if isinstance(c, ttk.Button))
@@ -165,28 +261,41 @@ class TelescopeCoverApp(tk.Tk):
                  if w and w.winfo_exists(): w.config(state=state)
              except: pass
     def update_ui_connection_state(self):
-        is_conn = self.connected.get(); state = tk.NORMAL if is_conn else tk.DISABLED; self.set_controls_state(state)
+        is_conn = self.connected.get(); busy = is_conn or self.connecting; state = tk.NORMAL if is_conn else tk.DISABLED; self.set_controls_state(state)
         try:
-            if self.port_combobox and self.port_combobox.winfo_exists(): self.port_combobox.config(state="readonly" if not is_conn else tk.DISABLED)
-            if self.refresh_button and self.refresh_button.winfo_exists(): self.refresh_button.config(state=tk.NORMAL if not is_conn else tk.DISABLED)
-            if self.connect_button and self.connect_button.winfo_exists(): self.connect_button.config(text="Disconnect" if is_conn else "Connect")
+            if self.port_combobox and self.port_combobox.winfo_exists(): self.port_combobox.config(state="readonly" if not busy else tk.DISABLED)
+            if self.refresh_button and self.refresh_button.winfo_exists(): self.refresh_button.config(state=tk.NORMAL if not busy else tk.DISABLED)
+            if self.find_button and self.find_button.winfo_exists(): self.find_button.config(state=tk.NORMAL if not busy else tk.DISABLED)
+            if self.no_reset_check and self.no_reset_check.winfo_exists(): self.no_reset_check.config(state=tk.NORMAL if not busy else tk.DISABLED)
+            if self.connect_button and self.connect_button.winfo_exists(): self.connect_button.config(text="Disconnect" if is_conn else ("Connecting..." if self.connecting else "Connect"), state=tk.DISABLED if self.connecting else tk.NORMAL)
         except: pass
     def log_status(self, message):
         try:
-            if hasattr(self,'status_text') and self.status_text and self.status_text.winfo_exists():
-                self.status_text.config(state=tk.NORMAL); ts=time.strftime("%H:%M:%S",time.localtime()); self.status_text.insert(tk.END,f"{ts}: {message}\n"); self.status_text.see(tk.END); self.status_text.config(state=tk.DISABLED)
+            if hasattr(self,'status_log') and self.status_text.winfo_exists():
+                ts=time.strftime("%H:%M:%S",time.localtime()); self.status_log.append(f"{ts}: {message}") # Inserted once per UI frame
         except Exception as e: print(f"Log Status Error: {e} - Msg: {message}")
-    def update_servo_entry_from_slider(self, value): pass
+    def start_slider_drag(self, event=None): self.dragging = True
+    def update_servo_entry_from_slider(self, value):
+        # Follows the pointer while dragging; the scheduler drops targets the servo never had time for
+        angle = int(round(float(value)))
+        if self.servo_angle_var.get() != angle: self.servo_angle_var.set(angle)
+        if self.dragging and self.connected.get(): self.move_to(angle)
     def set_servo_from_slider_release(self, event=None):
+        self.dragging = False
         if self.connected.get(): self.set_servo_from_entry()
         else: self.log_status("Cannot set angle: Not connected.")
+    def move_to(self, angle):
+        # Latest-wins SETPOS: the move-complete RESULT:STATUS releases the next target
+        client = self.client
+        if client and client.is_open: self.loop_thread.call(self.move_scheduler.submit, "SETPOS", lambda: client.set_position(angle), f"COMMAND:SETPOS:{angle}")
+        else: messagebox.showwarning("Not Connected","Connect first.")
     def set_servo_from_entry(self, event=None):
         if not self.connected.get(): messagebox.showwarning("Not Connected","Connect first."); return
         try:
             angle=self.servo_angle_var.get()
-            if MIN_SERVO_ANGLE<=angle<=MAX_SERVO_ANGLE: self.send_command(f"COMMAND:SETPOS:{angle}")
-            else: messagebox.showwarning("Input Error",f"Angle must be {MIN_SERVO_ANGLE}-{MAX_SERVO_ANGLE}."); self.send_command("COMMAND:GETSTATUS")
-        except: messagebox.showwarning("Input Error","Invalid angle."); self.send_command("COMMAND:GETSTATUS")
+            if MIN_SERVO_ANGLE<=angle<=MAX_SERVO_ANGLE: self.move_to(angle)
+            else: messagebox.showwarning("Input Error",f"Angle must be {MIN_SERVO_ANGLE}-{MAX_SERVO_ANGLE}."); self.refresh_status()
+        except: messagebox.showwarning("Input Error","Invalid angle."); self.refresh_status()
 
     # --- Updated LED Toggle Function ---
     def toggle_led(self):
@@ -199,20 +308,34 @@ class TelescopeCoverApp(tk.Tk):
 
         if self.led_on_var.get(): # Checkbutton is now checked (True) -> Turn ON
             self.log_status("Turning LED On...")
-            self.send_command("COMMAND:SETLED:1") # Send non-zero value (1 is clear)
+            self.send_command(protocol.set_led_command(True, self.led_level())) # Send non-zero value (1 is clear)
         else: # Checkbutton is now unchecked (False) -> Turn OFF
             self.log_status("Turning LED Off...")
-            self.send_command("COMMAND:SETLED:0") # Send zero value
+            self.send_command(protocol.set_led_command(False)) # Send zero value
+
+    def led_level(self):
+        # Firmware before v1.7 rejects a level; it only ever reports on/off
+        return self.led_level_var.get() if self.led_level_supported else None
+    def set_led_level_from_slider_release(self, event=None):
+        if not self.connected.get(): return
+        # The level is kept while the LED is off and applied the next time it is turned on
+        if self.led_on_var.get(): self.send_command(protocol.set_led_command(True, self.led_level()))
 
     # --- Servo Open/Close Functions (Unchanged) ---
-    def servo_open(self): self.send_command(f"COMMAND:SETPOS:{MAX_SERVO_ANGLE}")
-    def servo_close(self): self.send_command(f"COMMAND:SETPOS:{MIN_SERVO_ANGLE}")
+    def servo_open(self): self.move_to(MAX_SERVO_ANGLE)
+    def servo_close(self): self.move_to(MIN_SERVO_ANGLE)
+    def servo_stop(self):
+        # Drops a slider target still waiting, then stops the running move where it is (firmware v1.6)
+        if self.client and self.client.is_open: self.loop_thread.call(self.move_scheduler.cancel, "SETPOS")
+        self.send_command(protocol.COMMAND_STOP)
 
     # --- Closing Function ---
     def on_closing(self):
         self.log_status("Closing..."); self.stop_reading_flag=True; self.after(int(GUI_UPDATE_INTERVAL*1.5),self._perform_disconnect_and_destroy)
     def _perform_disconnect_and_destroy(self):
         if self.connected.get(): self.disconnect()
+        self.loop_thread.stop(); self.rx_queue.close(); self.status_log.close()
+        if self.traffic_recorder: self.traffic_recorder.close()
         if self.winfo_exists(): self.destroy()
 
 # --- Run the Application ---
@@ -1,34 +1,60 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import serial
-import serial.tools.list_ports
-import threading
-import time
 import queue # For thread-safe GUI updates
-
-# --- Constants based on Arduino Firmware ---
-BAUD_RATE = 57600
-COMMAND_PING = "COMMAND:PING\n"
-COMMAND_INFO = "COMMAND:INFO\n"
-COMMAND_GETSTATE = "COMMAND:GETSTATE\n"
-COMMAND_OPEN = "COMMAND:OPEN\n"
-COMMAND_CLOSE = "COMMAND:CLOSE\n"
-RESULT_STATE_OPEN = "RESULT:STATE:OPEN"
-RESULT_STATE_CLOSED = "RESULT:STATE:CLOSED"
+from log_view import LogSink
+from panel_client import PanelClient, PanelTimeout, LoopThread
+from telemetry import TelemetryRecorder, TelemetryPlot
+from flat_sequencer import FlatSequencer
+import discovery
+import metrics
+from traffic_log import TrafficRecorder
+from supervisor import LinkSupervisor
+from tk_bridge import WakeupQueue, ViewCache
+
+# --- Constants based on Arduino Firmware (shared in protocol.py) ---
+import protocol
+from protocol import BAUD_RATE, COMMAND_PING, COMMAND_OPEN, COMMAND_CLOSE, COMMAND_STOP
+from panel_state import DEFAULT_MAX_AGE
+# --- Log Window ---
+LOG_MAX_LINES = 1000 # Lines kept in the response window
+LOG_FILE = None # Set to a path to keep the full history in a rotating file
+METRICS_FILE = None # Set to a path to write Prometheus metrics there (node_exporter textfile collector)
+METRICS_PORT = None # Set to a port to serve Prometheus metrics on http://127.0.0.1:<port>/metrics
+TRAFFIC_LOG = None # Set to a path to record all serial traffic there (see traffic_log.py)
+AUTO_RECONNECT = True # Reconnect and restore the requested state when the link drops (see supervisor.py)
+# --- State Cache ---
+STATE_MAX_AGE = DEFAULT_MAX_AGE # Seconds a cached cover state is trusted before asking the firmware again
+# --- Flat Session ---
+FLAT_EXPOSURES = 10
+FLAT_EXPOSURE_TIME = 1.0 # Seconds held per exposure
+FLAT_SETTLE_TIME = 2.0 # Seconds after the LED is confirmed on
+FLAT_FILTER = None # Filter name to look up in the calibration tables (see calibration.py); None keeps the panel's brightness
+FLAT_TARGET_ADU = 25000 # Mean flat level aimed for, in ADU above bias
+# --- Motion Plot ---
+PLOT_HEIGHT = 90 # Pixels
 # --- End Constants ---
 
 class ServoControllerApp:
     def __init__(self, master):
         self.master = master
-        self.ser = None
+        self.client = None # PanelClient for the open connection
+        self.supervisor = None # LinkSupervisor reconnecting self.client (AUTO_RECONNECT)
+        self.loop_thread = LoopThread() # Runs the client's asyncio loop
         self.port_list = []
         self.selected_port = tk.StringVar()
-        self.read_thread = None
         self.is_running = False
-        self.message_queue = queue.Queue() # Queue for messages from read_thread to GUI
+        self.no_reset = tk.BooleanVar(value=False) # Open without toggling DTR
+        self.message_queue = WakeupQueue(master, self.process_queue) # Messages from the client loop; each put wakes the GUI thread
+        self.view = ViewCache() # Label updates that would change nothing are skipped
+        metrics.start_export(self.loop_thread, METRICS_FILE, METRICS_PORT)
+        self.traffic_recorder = TrafficRecorder(TRAFFIC_LOG) if TRAFFIC_LOG else None # Binary record of the serial traffic
+        self.telemetry_on = tk.BooleanVar(value=True) # Ask the firmware for position samples during moves
+        self.recorder = TelemetryRecorder(on_move=self.report_move)
+        self.flat_future = None # Running flat session (concurrent future on the loop thread)
 
         master.title("Flat Panel Servo Control")
-        master.geometry("450x400") # Adjusted size for better layout
+        master.geometry("450x520") # Adjusted size for better layout
 
         # --- Style ---
         style = ttk.Style()
@@ -45,12 +71,16 @@ class ServoControllerApp:
         self.port_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.refresh_button = ttk.Button(connection_frame, text="Refresh", command=self.populate_ports, width=8)
         self.refresh_button.grid(row=0, column=2, padx=5, pady=5)
+        self.find_button = ttk.Button(connection_frame, text="Find Panel", command=self.find_panel, width=10)
+        self.find_button.grid(row=0, column=3, padx=5, pady=5)
 
         # Connect/Disconnect Buttons
         self.connect_button = ttk.Button(connection_frame, text="Connect", command=self.connect_serial, width=15)
         self.connect_button.grid(row=1, column=0, columnspan=2, padx=5, pady=8, sticky="ew")
         self.disconnect_button = ttk.Button(connection_frame, text="Disconnect", command=self.disconnect_serial, state="disabled", width=15)
-        self.disconnect_button.grid(row=1, column=2, padx=5, pady=8, sticky="ew")
+        self.disconnect_button.grid(row=1, column=2, columnspan=2, padx=5, pady=8, sticky="ew")
+        self.no_reset_check = ttk.Checkbutton(connection_frame, text="Don't reset board on connect", variable=self.no_reset)
+        self.no_reset_check.grid(row=2, column=0, columnspan=4, padx=5, pady=(0,5), sticky="w")
 
         connection_frame.columnconfigure(1, weight=1) # Make combobox expand horizontally
 
@@ -64,6 +94,21 @@ class ServoControllerApp:
         self.close_button = ttk.Button(control_frame, text="Close Cover", command=self.close_cover_action, state="disabled")
         self.close_button.pack(pady=8, padx=20, fill="x")
 
+        self.stop_button = ttk.Button(control_frame, text="Stop Cover", command=self.stop_cover_action, state="disabled")
+        self.stop_button.pack(pady=8, padx=20, fill="x")
+
+        self.flat_button = ttk.Button(control_frame, text="Run Flat Session", command=self.flat_session_action, state="disabled")
+        self.flat_button.pack(pady=8, padx=20, fill="x")
+
+        # --- Motion Frame ---
+        motion_frame = ttk.LabelFrame(master, text="Motion", padding=(10, 5))
+        motion_frame.pack(pady=(0, 10), padx=10, fill="x")
+        self.plot_canvas = tk.Canvas(motion_frame, height=PLOT_HEIGHT, background="white", highlightthickness=0)
+        self.plot_canvas.pack(fill="x", padx=5, pady=(5, 0))
+        self.telemetry_check = ttk.Checkbutton(motion_frame, text="Live position telemetry", variable=self.telemetry_on, command=self.toggle_telemetry)
+        self.telemetry_check.pack(anchor="w", padx=5, pady=(0, 5))
+        self.plot = TelemetryPlot(self.plot_canvas, self.recorder.ring)
+
         # --- Status Frame ---
         status_frame = ttk.LabelFrame(master, text="Status & Response", padding=(10, 5))
         status_frame.pack(pady=10, padx=10, fill="both", expand=True)
@@ -81,236 +126,433 @@ class ServoControllerApp:
 
         self.response_scrollbar.pack(side="right", fill="y", padx=(0,5), pady=5)
         self.response_text.pack(side="left", fill="both", expand=True, padx=(5,0), pady=5)
+        self.response_log = LogSink(self.response_text, max_lines=LOG_MAX_LINES, log_file=LOG_FILE)
 
 
         # --- Initial Setup ---
         self.populate_ports()
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.master.after(100, self.process_queue) # Start checking the message queue
 
     def populate_ports(self):
-        """Finds available serial ports and updates the combobox."""
-        self.port_list = [port.device for port in serial.tools.list_ports.comports()]
+        """Lists serial ports in the background; finish_populate() updates the combobox."""
+        future = self.loop_thread.submit(discovery.list_ports())
+        future.add_done_callback(lambda f: self.message_queue.put(("PORTS", f)))
+
+    def finish_populate(self, future):
+        """Updates the combobox with the listed ports, preferring the cached panel port."""
+        try:
+            ports = future.result()
+        except Exception as e:
+            self.log_response(f"Error listing serial ports: {e}")
+            ports = []
+        self.port_list = [port.device for port in ports]
         self.port_combobox['values'] = self.port_list
         if self.port_list:
-            if not self.selected_port.get() or self.selected_port.get() not in self.port_list:
+            cached = discovery.find_cached(ports)
+            if cached and not self.client:
+                self.selected_port.set(cached)
+                self.log_response(f"Panel last seen on {cached}.")
+            elif not self.selected_port.get() or self.selected_port.get() not in self.port_list:
                  self.selected_port.set(self.port_list[0])
         else:
             self.selected_port.set("")
             self.port_combobox['values'] = []
             self.log_response("No serial ports found.")
 
+    def find_panel(self):
+        """Probes all ports concurrently for the panel's GUID; the window stays responsive."""
+        self.log_response("Searching for the panel...")
+        self.find_button.config(state="disabled")
+        self.connect_button.config(state="disabled") # Probing opens the ports
+        future = self.loop_thread.submit(discovery.discover(use_cache=False)) # Asked for, so ports cached as something else are probed again
+        future.add_done_callback(lambda f: self.message_queue.put(("DISCOVERED", f)))
+
+    def finish_find_panel(self, future):
+        """Selects the port the panel answered on."""
+        if not self.client:
+            self.find_button.config(state="normal")
+            self.connect_button.config(state="normal")
+        try:
+            found = future.result()
+        except Exception as e:
+            self.log_response(f"Panel search failed: {e}")
+            return
+        if found:
+            if found[0] not in self.port_list:
+                self.port_list.append(found[0])
+                self.port_combobox['values'] = self.port_list
+            self.selected_port.set(found[0])
+            self.log_response(f"Panel found on {', '.join(found)}.")
+        else:
+            self.log_response("No panel answered on any port.")
+
 
     def connect_serial(self):
-        """Establishes serial connection to the selected port."""
+        """Starts connecting to the selected port; finish_connect() runs when the panel is ready."""
         port = self.selected_port.get()
         if not port:
             messagebox.showerror("Connection Error", "No serial port selected.")
             return
 
+        self.log_response(f"Attempting to connect to {port} at {BAUD_RATE} baud...")
+        self.update_status("Connecting...", "orange")
+        self.connect_button.config(state="disabled")
+        self.port_combobox.config(state="disabled")
+        self.refresh_button.config(state="disabled")
+        self.find_button.config(state="disabled")
+        self.no_reset_check.config(state="disabled")
+
+        self.client = PanelClient(port, BAUD_RATE)
+        self.client.add_line_listener(self.message_queue.put)
+        self.client.add_disconnect_listener(self.on_link_lost)
+        if self.traffic_recorder:
+            self.traffic_recorder.attach(self.client)
+        if AUTO_RECONNECT:
+            self.supervisor = LinkSupervisor(self.client, on_event=lambda kind, text: self.message_queue.put(("LINK", (kind, text))))
+        # Runs on the client loop; the window stays responsive while the board boots
+        future = self.loop_thread.submit(self.client.connect(reset=not self.no_reset.get()))
+        future.add_done_callback(lambda f: self.message_queue.put(("CONNECTED", f)))
+
+    def finish_connect(self, future):
+        """Completes connect_serial() on the GUI thread."""
+        port = self.client.port if self.client else self.selected_port.get()
         try:
-            self.log_response(f"Attempting to connect to {port} at {BAUD_RATE} baud...")
-            # Added timeout for non-blocking reads later
-            self.ser = serial.Serial(port, BAUD_RATE, timeout=1)
-            time.sleep(2) # Give Arduino time to reset after connection
-
-            if self.ser.is_open:
-                self.is_running = True
-                self.read_thread = threading.Thread(target=self.read_from_port, daemon=True)
-                self.read_thread.start()
-
-                self.update_status("Connected", "green")
-                self.cover_state_label.config(text="Cover State: Unknown (Requesting...)")
-                self.log_response(f"Successfully connected to {port}.")
-
-                # Update GUI state
-                self.connect_button.config(state="disabled")
-                self.disconnect_button.config(state="normal")
-                self.port_combobox.config(state="disabled")
-                self.refresh_button.config(state="disabled")
-                self.open_button.config(state="normal")
-                self.close_button.config(state="normal")
-
-                # Send initial commands to get info/state
-                self.send_command(COMMAND_PING)
-                time.sleep(0.2) # Small delay between commands
-                self.send_command(COMMAND_GETSTATE)
-
-
-            else:
-                 messagebox.showerror("Connection Error", f"Failed to open port {port}.")
-                 self.update_status("Connection Failed", "red")
+            connect_time = future.result()
+            self.is_running = True
+
+            self.update_status("Connected", "green")
+            self.view.configure(self.cover_state_label, text="Cover State: Unknown (Requesting...)")
+            self.log_response(f"Successfully connected to {port} in {connect_time:.2f} s.")
+
+            # Update GUI state
+            self.connect_button.config(state="disabled")
+            self.disconnect_button.config(state="normal")
+            self.port_combobox.config(state="disabled")
+            self.refresh_button.config(state="disabled")
+            self.find_button.config(state="disabled")
+            self.open_button.config(state="normal")
+            self.close_button.config(state="normal")
+            self.stop_button.config(state="normal")
+            self.flat_button.config(state="normal")
+
+            # Send initial commands to get info/state; replies are matched in order, so no spacing is needed
+            self.send_command(COMMAND_PING)
+            self.request_cover_state()
+            if self.telemetry_on.get():
+                self.set_telemetry(True)
+            if self.supervisor:
+                self.loop_thread.call(self.supervisor.start)
 
         except serial.SerialException as e:
             messagebox.showerror("Connection Error", f"Could not connect to {port}.\nError: {e}")
             self.update_status(f"Error: {e}", "red")
             self.log_response(f"Error connecting: {e}")
-            if self.ser:
-                self.ser.close()
-            self.ser = None
+            self.abort_connect()
         except Exception as e:
             messagebox.showerror("Error", f"An unexpected error occurred: {e}")
             self.update_status(f"Unexpected Error", "red")
             self.log_response(f"Unexpected error: {e}")
-            if self.ser:
-                self.ser.close()
-            self.ser = None
+            self.abort_connect()
+
+    def abort_connect(self):
+        """Restores the connection controls after a failed connect."""
+        self.close_client()
+        self.connect_button.config(state="normal")
+        self.port_combobox.config(state="readonly" if self.port_list else "disabled")
+        self.refresh_button.config(state="normal")
+        self.find_button.config(state="normal")
+        self.no_reset_check.config(state="normal")
+
+    def close_client(self):
+        """Closes the client connection (if any) on the loop thread."""
+        if self.client:
+            try:
+                self.loop_thread.submit(self.supervisor.close() if self.supervisor else self.client.close()).result(timeout=2)
+            except Exception as e:
+                self.log_response(f"Error closing port: {e}")
+            if self.traffic_recorder:
+                self.traffic_recorder.detach(self.client)
+        self.client = None
+        self.supervisor = None
 
     def disconnect_serial(self):
         """Closes the serial connection."""
-        self.is_running = False # Signal the reading thread to stop
-        if self.read_thread:
-             self.read_thread.join(timeout=2) # Wait for thread to finish
-
-        if self.ser and self.ser.is_open:
+        self.is_running = False
+        if self.client:
+            self.log_response(f"Reader stats: {self.client.stats.summary()}")
             try:
-                self.ser.close()
+                self.close_client()
                 self.log_response("Serial port disconnected.")
             except Exception as e:
                 self.log_response(f"Error closing port: {e}")
 
-        self.ser = None
+        self.client = None
         self.update_status("Disconnected", "black")
-        self.cover_state_label.config(text="Cover State: Unknown")
+        self.view.configure(self.cover_state_label, text="Cover State: Unknown")
 
         # Update GUI state
         self.connect_button.config(state="normal")
         self.disconnect_button.config(state="disabled")
         self.port_combobox.config(state="readonly" if self.port_list else "disabled")
         self.refresh_button.config(state="normal")
+        self.find_button.config(state="normal")
+        self.no_reset_check.config(state="normal")
         self.open_button.config(state="disabled")
         self.close_button.config(state="disabled")
+        self.stop_button.config(state="disabled")
+        self.flat_button.config(state="disabled", text="Run Flat Session")
         self.populate_ports() # Refresh port list in case it changed
 
 
     def send_command(self, command):
-        """Sends a command string over the serial port."""
-        if self.ser and self.ser.is_open:
-            try:
-                # Ensure command ends with newline and is bytes
-                if isinstance(command, str):
-                    if not command.endswith('\n'):
-                         command += '\n'
-                    command_bytes = command.encode('ascii')
-                elif isinstance(command, bytes):
-                     if not command.endswith(b'\n'):
-                         command += b'\n'
-                     command_bytes = command
-                else:
-                    self.log_response(f"Error: Invalid command type {type(command)}")
-                    return
-
-                self.ser.write(command_bytes)
-                # Log command without the newline for readability
-                self.log_response(f"Sent: {command_bytes.decode('ascii').strip()}")
-
-            except serial.SerialException as e:
-                self.log_response(f"Serial write error: {e}")
-                messagebox.showerror("Serial Error", f"Failed to send command.\nError: {e}")
-                self.disconnect_serial() # Disconnect on write error
-            except Exception as e:
-                 self.log_response(f"Unexpected write error: {e}")
-                 messagebox.showerror("Error", f"An unexpected error occurred during send.\nError: {e}")
+        """Queues a command string on the client; the reply arrives through the message queue."""
+        if self.client and self.client.is_open:
+            if isinstance(command, bytes):
+                command = command.decode('ascii')
+            command = command.strip()
+            future = self.loop_thread.submit(self.client.request(command))
+            future.add_done_callback(self.command_done)
+            self.log_response(f"Sent: {command}")
         else:
             self.log_response("Cannot send command: Not connected.")
             # messagebox.showwarning("Not Connected", "Please connect to the serial port first.")
 
 
-    def read_from_port(self):
-        """Reads data from serial port in a separate thread."""
-        while self.is_running and self.ser and self.ser.is_open:
-            try:
-                if self.ser.in_waiting > 0:
-                    line = self.ser.readline()
-                    if line:
-                        try:
-                            decoded_line = line.decode('ascii').strip()
-                            if decoded_line: # Don't queue empty lines
-                                self.message_queue.put(decoded_line)
-                        except UnicodeDecodeError:
-                            self.message_queue.put(f"Received non-ASCII data: {line}")
-            except serial.SerialException as e:
-                 # Put error message in queue for main thread to handle
-                 self.message_queue.put(f"SERIAL_ERROR:{e}")
-                 break # Exit thread on serial error
-            except Exception as e:
-                 self.message_queue.put(f"READ_THREAD_ERROR:{e}")
-                 break # Exit thread on other errors
-            time.sleep(0.05) # Small delay to prevent high CPU usage
+    def command_done(self, future):
+        """Runs on the client loop when a command finishes; reports timeouts to the GUI."""
+        if future.cancelled():
+            return
+        error = future.exception()
+        # ERROR: replies are already logged as received lines; lost links arrive via on_link_lost
+        if isinstance(error, PanelTimeout):
+            self.message_queue.put(f"COMMAND_ERROR:{error}")
+
+
+    def toggle_telemetry(self):
+        """Called when the telemetry Checkbutton changes."""
+        if self.client and self.client.is_open:
+            self.set_telemetry(self.telemetry_on.get())
+
+
+    def set_telemetry(self, on):
+        """Turns the firmware's move samples on or off."""
+        future = self.loop_thread.submit(self.client.set_telemetry(on))
+        future.add_done_callback(self.telemetry_done)
+        self.log_response(f"Sent: {protocol.set_telemetry_command(on)}")
+
+
+    def telemetry_done(self, future):
+        """Runs on the client loop; older firmware answers ERROR:INVALID_COMMAND."""
+        if not future.cancelled() and future.exception() is not None:
+            self.message_queue.put(f"COMMAND_ERROR:Telemetry unavailable: {future.exception()}")
+
+
+    def report_move(self, report):
+        """Logs the timing of each finished move; slow, stalled or interrupted moves are flagged."""
+        if report.ok:
+            self.log_response(str(report))
+        else:
+            self.log_response(f"WARNING: {report}")
+            self.update_status("Move timing off (see log)", "orange")
+
+
+    def on_link_lost(self, error):
+        """Runs on the client loop when the serial link fails."""
+        self.message_queue.put(f"SERIAL_ERROR:{error}")
+
+
+    def link_event(self, kind, text):
+        """Shows a LinkSupervisor event; after a recovery the telemetry setting is sent again."""
+        self.log_response(text)
+        if kind == "recovered":
+            self.update_status("Connected", "green")
+            self.request_cover_state()
+            if self.telemetry_on.get():
+                self.set_telemetry(True) # A reset board starts with telemetry off
+        elif kind == "failed":
+            self.update_status("Reconnected, state not restored", "orange")
 
 
     def process_queue(self):
-        """Processes messages from the read thread queue in the main GUI thread."""
+        """Processes everything queued by the client loop; runs on the GUI thread whenever a message arrives."""
+        sample = None # Only the newest telemetry sample of one pass is shown
         try:
             while True: # Process all messages currently in the queue
                 message = self.message_queue.get_nowait()
-                # Check for special error messages from read_thread
-                if isinstance(message, str):
-                    if message.startswith("SERIAL_ERROR:"):
+                if isinstance(message, tuple) and message[0] == "CONNECTED":
+                    self.finish_connect(message[1])
+                elif isinstance(message, tuple) and message[0] == "PORTS":
+                    self.finish_populate(message[1])
+                elif isinstance(message, tuple) and message[0] == "DISCOVERED":
+                    self.finish_find_panel(message[1])
+                elif isinstance(message, tuple) and message[0] == "STATE":
+                    self.finish_cover_state(message[1])
+                elif isinstance(message, tuple) and message[0] == "FLAT_STEP":
+                    self.log_response(f"Flats: {message[1].name} done in {message[1].duration:.2f} s")
+                elif isinstance(message, tuple) and message[0] == "FLAT_DONE":
+                    self.finish_flat_session(message[1])
+                elif isinstance(message, tuple) and message[0] == "LINK":
+                    self.link_event(*message[1])
+                # Check for special error messages from the client loop
+                elif isinstance(message, str):
+                    if message.startswith("SERIAL_ERROR:") and self.supervisor:
+                        self.update_status("Reconnecting...", "orange") # The supervisor logs the loss
+                    elif message.startswith("SERIAL_ERROR:"):
                         error_msg = message.split(":", 1)[1]
                         self.log_response(f"Serial read error: {error_msg}")
                         messagebox.showerror("Serial Error", f"Lost connection or read error.\n{error_msg}")
                         self.disconnect_serial() # Attempt graceful disconnect
-                    elif message.startswith("READ_THREAD_ERROR:"):
-                         error_msg = message.split(":", 1)[1]
-                         self.log_response(f"Read thread error: {error_msg}")
-                         messagebox.showerror("Thread Error", f"Error in reading thread.\n{error_msg}")
-                         self.disconnect_serial() # Attempt graceful disconnect
+                    elif message.startswith("COMMAND_ERROR:"):
+                         self.log_response(message.split(":", 1)[1])
                     else:
                         # Process normal Arduino response
+                        parsed = protocol.parse(message)
+                        version = self.recorder.ring.version
+                        self.recorder.feed(parsed) # Samples and status lines feed the plot
+                        if self.recorder.ring.version != version:
+                            self.plot.request() # One redraw after this pass, however many samples it drains
+                        if isinstance(parsed, protocol.Sample):
+                            sample = parsed # Too many to log
+                            continue
+                        if sample:
+                            self.show_progress(sample) # Before whatever the next line changes
+                            sample = None
                         self.log_response(f"Recv: {message}")
-                        self.update_cover_state(message) # Update state label if applicable
+                        self.update_cover_state(parsed) # Update state label if applicable
 
         except queue.Empty:
-             pass # No messages currently in queue
+             pass # Drained; the next put wakes this again
         finally:
-             # Reschedule after processing queue or if it was empty
-             self.master.after(100, self.process_queue)
+             if sample:
+                 self.show_progress(sample)
+
+
+    def request_cover_state(self):
+        """Asks for the cover state; the client answers from its cache unless that is stale."""
+        future = self.loop_thread.submit(self.client.get_state(max_age=STATE_MAX_AGE))
+        future.add_done_callback(lambda f: self.message_queue.put(("STATE", f)))
 
 
-    def update_cover_state(self, response):
-        """Updates the cover state label based on Arduino response."""
-        if RESULT_STATE_OPEN in response:
-             self.cover_state_label.config(text="Cover State: OPEN", foreground="dark green")
-        elif RESULT_STATE_CLOSED in response:
-             self.cover_state_label.config(text="Cover State: CLOSED", foreground="dark red")
+    def finish_cover_state(self, future):
+        """Shows the result of request_cover_state()."""
+        try:
+            state = future.result()
+        except Exception as e:
+            self.log_response(f"State query failed: {e}")
+            return
+        if state:
+            self.update_cover_state(protocol.State(protocol.RESULT_STATE_PREFIX + state, state))
+
+
+    def update_cover_state(self, message):
+        """Updates the cover state label based on a parsed Arduino response."""
+        if isinstance(message, protocol.MoveStart):
+             self.view.configure(self.cover_state_label, text=f"Cover State: Moving to {message.target}\N{DEGREE SIGN} "
+                                                                 f"({message.duration / 1000.0:.1f} s)...", foreground="orange")
+             return
+        if isinstance(message, protocol.MoveEnd) and message.stopped:
+             self.log_response(f"Cover stopped at {message.angle}\N{DEGREE SIGN}.")
+             return
+        if isinstance(message, protocol.Status) and self.client and self.client.state.moving:
+             return # A status read during a move; the move's own status line follows MOVE:DONE
+        if isinstance(message, protocol.Status) and self.client:
+             # Every status line (end of a move, SETLED) updates the client's cache; show its cover state
+             state = self.client.state.cover_state
+             message = protocol.State(message.line, state) if state else message
+        if not isinstance(message, protocol.State):
+             return
+        if message.state == "OPEN":
+             self.view.configure(self.cover_state_label, text="Cover State: OPEN", foreground="dark green")
+        elif message.state == "CLOSED":
+             self.view.configure(self.cover_state_label, text="Cover State: CLOSED", foreground="dark red")
         # Keep "Unknown" if response doesn't match known states
 
 
+    def show_progress(self, sample):
+        """Shows the angle of a telemetry sample while the cover moves."""
+        self.view.configure(self.cover_state_label, text=f"Cover State: Moving... {sample.angle}\N{DEGREE SIGN}", foreground="orange")
+
+
     def log_response(self, message):
-        """Appends a message to the response text area."""
-        self.response_text.config(state="normal") # Enable writing
-        self.response_text.insert(tk.END, message + "\n")
-        self.response_text.see(tk.END) # Scroll to the bottom
-        self.response_text.config(state="disabled") # Disable writing
+        """Appends a message to the response text area (batched and trimmed by LogSink)."""
+        self.response_log.append(message)
 
 
     def update_status(self, text, color="black"):
         """Updates the main status label."""
-        self.status_label.config(text=f"Status: {text}", foreground=color)
+        self.view.configure(self.status_label, text=f"Status: {text}", foreground=color)
 
 
     def open_cover_action(self):
         """Sends the open command."""
         self.send_command(COMMAND_OPEN)
-        self.cover_state_label.config(text="Cover State: Opening...", foreground="orange")
+        self.view.configure(self.cover_state_label, text="Cover State: Opening...", foreground="orange")
 
 
     def close_cover_action(self):
         """Sends the close command."""
         self.send_command(COMMAND_CLOSE)
-        self.cover_state_label.config(text="Cover State: Closing...", foreground="orange")
+        self.view.configure(self.cover_state_label, text="Cover State: Closing...", foreground="orange")
+
+
+    def stop_cover_action(self):
+        """Stops the cover where it is (firmware v1.6); the interrupted move's status line follows."""
+        self.send_command(COMMAND_STOP)
+
+
+    def flat_session_action(self):
+        """Starts a flat session (close, LED on, settle, exposures, LED off, open), or aborts the running one."""
+        if self.flat_future and not self.flat_future.done():
+            self.flat_future.cancel() # The sequencer turns the LED off
+            self.log_response("Aborting flat session...")
+            return
+        level = None
+        if FLAT_FILTER is not None:
+            import calibration # Only needed when a filter is configured
+            try:
+                level = calibration.CalibrationStore().level_for(FLAT_FILTER, FLAT_TARGET_ADU, FLAT_EXPOSURE_TIME)
+            except calibration.CalibrationError as e:
+                self.log_response(f"Flat session not started: {e}")
+                return
+            self.log_response(f"Calibration: {FLAT_FILTER} at {FLAT_TARGET_ADU} ADU -> brightness {level}")
+        sequencer = FlatSequencer(self.client, FLAT_EXPOSURES, FLAT_EXPOSURE_TIME, FLAT_SETTLE_TIME,
+                                  on_step=lambda step, report: self.message_queue.put(("FLAT_STEP", step)),
+                                  level=level)
+        self.flat_future = self.loop_thread.submit(sequencer.run())
+        self.flat_future.add_done_callback(lambda f: self.message_queue.put(("FLAT_DONE", f)))
+        self.flat_button.config(text="Abort Flat Session")
+        self.log_response(f"Flat session: {FLAT_EXPOSURES} x {FLAT_EXPOSURE_TIME:g} s after {FLAT_SETTLE_TIME:g} s settle")
+
+
+    def finish_flat_session(self, future):
+        """Logs the step timing report of a finished flat session."""
+        self.flat_button.config(text="Run Flat Session")
+        if future.cancelled():
+            self.log_response("Flat session aborted.")
+            return
+        try:
+            report = future.result()
+        except Exception as e:
+            self.log_response(f"Flat session failed: {e}")
+            return
+        for line in report.summary().splitlines():
+            self.log_response(line)
 
 
     def on_closing(self):
         """Handles window close event."""
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
-            self.is_running = False # Signal thread to stop
-            if self.read_thread and self.read_thread.is_alive():
-                self.read_thread.join(timeout=1) # Wait briefly for thread
-
-            if self.ser and self.ser.is_open:
-                 self.ser.close()
+            self.is_running = False
+            try:
+                self.close_client()
+            except Exception:
+                pass
+            self.loop_thread.stop()
+            self.message_queue.close()
+            self.plot.stop()
+            self.response_log.close()
+            if self.traffic_recorder:
+                self.traffic_recorder.close()
             self.master.destroy()
 
 
@@ -0,0 +1,89 @@
+import collections
+import logging
+import logging.handlers
+import tkinter as tk
+
+# --- Constants ---
+DEFAULT_MAX_LINES = 1000 # Lines kept in the Text widget
+TRIM_SLACK = 0.1 # Let the widget overshoot by this fraction before deleting in one go
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+# --- End Constants ---
+
+
+class LogSink:
+    """Bounded, batched writer for a read-only tk.Text log.
+
+    append() only queues the line; everything queued during one pass of the
+    Tk event loop is inserted with a single insert() from an idle callback,
+    and old lines are deleted in bulk once the widget exceeds its cap. If
+    log_file is given the complete history also goes to a rotating file, so
+    only the tail has to live in the widget.
+    """
+
+    def __init__(self, widget, max_lines=DEFAULT_MAX_LINES, log_file=None):
+        self.widget = widget
+        self.max_lines = max_lines
+        self._pending = collections.deque(maxlen=max_lines) # Older unflushed lines would be trimmed anyway
+        self._shown = 0 # Lines currently in the widget
+        self._flush_id = None
+        self.file_logger = None
+        if log_file:
+            self.file_logger = logging.getLogger(f"flatpanel.log.{id(self)}")
+            self.file_logger.propagate = False
+            self.file_logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger.addHandler(handler)
+
+    def append(self, message):
+        """Queues one line for the widget (and the log file). Call from the Tk thread."""
+        self._pending.append(message)
+        if self.file_logger:
+            self.file_logger.info(message)
+        if self._flush_id is None:
+            self._flush_id = self.widget.after_idle(self.flush)
+
+    def flush(self):
+        """Writes all queued lines with one insert and trims the widget."""
+        self._flush_id = None
+        if not self._pending or not self.widget.winfo_exists():
+            self._pending.clear()
+            return
+        lines = list(self._pending)
+        self._pending.clear()
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, "\n".join(lines) + "\n")
+        self._shown += len(lines)
+        if self._shown > self.max_lines * (1 + TRIM_SLACK):
+            excess = self._shown - self.max_lines
+            self.widget.delete("1.0", f"{excess + 1}.0")
+            self._shown -= excess
+        self.widget.see(tk.END)
+        self.widget.config(state=tk.DISABLED)
+
+    def clear(self):
+        self._pending.clear()
+        self.widget.config(state=tk.NORMAL)
+        self.widget.delete("1.0", tk.END)
+        self.widget.config(state=tk.DISABLED)
+        self._shown = 0
+
+    def close(self):
+        """Flushes pending lines and closes the log file."""
+        if self._flush_id is not None:
+            try:
+                self.widget.after_cancel(self._flush_id)
+            except tk.TclError:
+                pass
+            self._flush_id = None
+        try:
+            self.flush() # The file already has these lines; this puts them in the widget too
+        except tk.TclError:
+            self._pending.clear() # The Tk application is already gone
+        if self.file_logger:
+            for handler in list(self.file_logger.handlers):
+                handler.close()
+                self.file_logger.removeHandler(handler)
+            self.file_logger = None
@@ -0,0 +1,253 @@
+"""Always-on link metrics in Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects updated inline on
+the hot path (an attribute increment or a bisect per observation), so they
+stay enabled all the time. Exposition is opt-in: write the text format to a
+file for node_exporter's textfile collector, or serve it on a loopback port.
+
+    loop_thread.submit(metrics.export_to_file("/var/lib/node_exporter/flatpanel.prom"))
+    loop_thread.submit(metrics.serve_http(9477))   # curl http://127.0.0.1:9477/metrics
+
+Metric names are prefixed with flatpanel_. PanelClient records command
+latency, bytes, lines, errors, connects and move durations; MeteredQueue
+records how long lines wait for the GUI thread.
+"""
+import asyncio
+import bisect
+import os
+import queue
+import time
+
+import protocol
+
+# --- Constants ---
+PREFIX = "flatpanel_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+FULL_MOVE = protocol.move_duration(protocol.MAX_ANGLE - protocol.MIN_ANGLE) # Seconds; 2.0 s with the v1.6 profile
+# Seconds; fine around a full move, where MoveMonitor's 10% tolerance lies
+MOVE_BUCKETS = tuple(sorted({0.1, 0.25, 0.5, 1.0, 2 * FULL_MOVE, 5.0} |
+                            {round(FULL_MOVE * f, 2) for f in (0.5, 0.75, 0.9, 0.95, 1.0, 1.05, 1.1, 1.25, 1.5)}))
+EXPORT_INTERVAL = 15.0 # Seconds between textfile writes
+HTTP_PORT = 9477
+# --- End Constants ---
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """The child for one combination of label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child._samples(self.name, _label_text(self.labelnames, values))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_number(value)}" for name, labels, value in self._samples()]
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def _samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, name, labels):
+        running = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            running += count
+            le = f'le="{_number(bound)}"'
+            yield f"{name}_bucket", labels[:-1] + "," + le + "}" if labels else "{" + le + "}", running
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    """The metrics to export, in registration order."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing # Modules may be imported twice (e.g. as __main__); share the series
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labelnames=()):
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name, help_text, labelnames=()):
+    return REGISTRY.register(Gauge(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+# --- GUI dispatch ---
+GUI_DISPATCH_LAG = histogram("gui_dispatch_lag_seconds", "Time a received line waits for the GUI thread",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+GUI_QUEUE_DEPTH = gauge("gui_queue_depth", "Items waiting in the GUI queue when it was last drained")
+
+
+class MeteredQueue(queue.Queue):
+    """queue.Queue that records how long each item waited and the depth at each get()."""
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        queued_at, item = self.queue.popleft()
+        GUI_DISPATCH_LAG.observe(time.monotonic() - queued_at)
+        GUI_QUEUE_DEPTH.set(len(self.queue))
+        return item
+
+
+# --- Export ---
+def write_textfile(path, registry=REGISTRY):
+    """Writes the exposition atomically (node_exporter must never see a half-written file)."""
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w") as handle:
+        handle.write(registry.render())
+    os.replace(temp, path)
+
+
+async def export_to_file(path, interval=EXPORT_INTERVAL, registry=REGISTRY):
+    """Rewrites `path` every `interval` seconds until cancelled."""
+    while True:
+        try:
+            write_textfile(path, registry)
+        except OSError:
+            pass # Try again next time; metrics must never take the panel down
+        await asyncio.sleep(interval)
+
+
+async def serve_http(port=HTTP_PORT, bind="127.0.0.1", registry=REGISTRY):
+    """Serves GET /metrics on a loopback port until cancelled."""
+
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path.split(b"?")[0] in (b"/metrics", b"/"):
+                body, status = registry.render().encode(), "200 OK"
+            else:
+                body, status = b"Not found\n", "404 Not Found"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, bind, port)
+    async with server:
+        await server.serve_forever()
+
+
+def start_export(loop_thread, path=None, port=None):
+    """Starts the configured exporters on a panel_client.LoopThread; returns their futures."""
+    futures = []
+    if path:
+        futures.append(loop_thread.submit(export_to_file(path)))
+    if port:
+        futures.append(loop_thread.submit(serve_http(port)))
+    return futures
@@ -0,0 +1,221 @@
+"""Controls several flat panels from one event loop.
+
+Each panel is a PanelClient; on POSIX their ports are all registered with the
+one asyncio selector, so dozens of panels cost no threads at all. Group
+operations run on every panel concurrently and report each panel's result
+as soon as it is in:
+
+    controller = PanelController()
+    controller.add("/dev/ttyACM0", name="east")
+    controller.add("/dev/ttyACM1", name="west")
+    await controller.connect_all()
+    async for result in controller.as_completed(close_and_light):
+        print(result)
+
+    python3 multi_panel.py --port /dev/ttyACM0 --port /dev/ttyACM1 close --led on
+    python3 multi_panel.py --sim 24 close --led on
+
+Panels are identified by port, by USB VID:PID:SERIAL (stable across
+re-plugging) or by DEVICE_GUID. The stock firmware uses the same GUID on
+every board, so GUID lookup only singles out a panel flashed with its own.
+"""
+import argparse
+import asyncio
+import time
+
+import serial.tools.list_ports
+
+import discovery
+import protocol
+from panel_client import PanelClient, PanelError, PanelTimeout
+
+# --- Constants ---
+CONNECT_TIMEOUT = 5.0 # Per panel
+# --- End Constants ---
+
+
+class DeviceResult:
+    """Outcome of a group operation on one panel."""
+
+    __slots__ = ("name", "value", "error", "elapsed")
+
+    def __init__(self, name, value=None, error=None, elapsed=0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed # Seconds from the start of the group operation
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        outcome = f"{self.value}" if self.ok else f"FAILED: {self.error}"
+        return f"{self.name}: {outcome} ({self.elapsed:.2f} s)"
+
+
+# --- Operations: coroutine functions taking one PanelClient ---
+async def close_and_light(client):
+    """Closes the cover, then turns the LED on (it only lights once closed)."""
+    await client.close_cover()
+    return await client.set_led(True)
+
+
+async def dark_and_open(client):
+    """Turns the LED off, then opens the cover."""
+    await client.set_led(False)
+    return await client.open_cover()
+
+
+class PanelController:
+    """A named set of PanelClients sharing the running event loop."""
+
+    def __init__(self):
+        self.clients = {} # name -> PanelClient
+
+    def add(self, port, name=None, baud_rate=protocol.BAUD_RATE):
+        """Adds the panel on `port`; returns its name (the port unless given)."""
+        name = name or port
+        if name in self.clients:
+            raise ValueError(f"Duplicate panel name {name}")
+        self.clients[name] = PanelClient(port, baud_rate)
+        return name
+
+    def add_usb(self, usb_key, name=None, ports=None):
+        """Adds the panel whose USB 'VID:PID:SERIAL' (see discovery.port_key) is `usb_key`."""
+        ports = serial.tools.list_ports.comports() if ports is None else ports
+        for info in ports:
+            key = discovery.port_key(info) # The serial number keeps its case; VID:PID may be typed in lower case
+            if key and key.upper() == usb_key.upper():
+                return self.add(info.device, name or usb_key)
+        raise PanelError(f"No port with USB id {usb_key}")
+
+    async def add_guid(self, guid, name=None):
+        """Probes the ports for `guid` and adds the one panel answering with it."""
+        found = [port for port in await discovery.discover(guid) if port not in self.ports()]
+        if len(found) != 1:
+            raise PanelError(f"{len(found)} unclaimed ports answer with {guid}; add them by port or USB id")
+        return self.add(found[0], name or guid)
+
+    def ports(self):
+        return [client.port for client in self.clients.values()]
+
+    def _select(self, names):
+        if names is None:
+            return dict(self.clients)
+        return {name: self.clients[name] for name in names}
+
+    async def as_completed(self, operation, names=None, timeout=None):
+        """Runs operation(client) on every (or the named) panel at once; yields DeviceResults as they finish."""
+        start = time.monotonic()
+
+        async def run(name, client):
+            try:
+                if timeout is None:
+                    value = await operation(client)
+                else:
+                    value = await asyncio.wait_for(operation(client), timeout)
+                return DeviceResult(name, value, elapsed=time.monotonic() - start)
+            except asyncio.TimeoutError:
+                error = PanelTimeout(f"Not done within {timeout:.1f} s")
+                return DeviceResult(name, error=error, elapsed=time.monotonic() - start)
+            except (PanelError, OSError, serial.SerialException) as e:
+                return DeviceResult(name, error=e, elapsed=time.monotonic() - start)
+
+        tasks = [asyncio.ensure_future(run(name, client)) for name, client in self._select(names).items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel() # Only matters if the caller stopped iterating early
+
+    async def run(self, operation, names=None, timeout=None, on_result=None):
+        """Like as_completed() but returns {name: DeviceResult}; on_result(result) is called per panel."""
+        results = {}
+        async for result in self.as_completed(operation, names, timeout):
+            results[result.name] = result
+            if on_result:
+                on_result(result)
+        return results
+
+    # --- Group operations ---
+    async def connect_all(self, reset=True, names=None, on_result=None):
+        return await self.run(lambda client: client.connect(reset=reset, timeout=CONNECT_TIMEOUT), names, on_result=on_result)
+
+    async def close_all(self):
+        """Closes every port (not the covers)."""
+        await asyncio.gather(*(client.close() for client in self.clients.values()))
+
+    async def open_covers(self, names=None, on_result=None):
+        return await self.run(lambda client: client.open_cover(), names, on_result=on_result)
+
+    async def close_covers(self, names=None, on_result=None):
+        return await self.run(lambda client: client.close_cover(), names, on_result=on_result)
+
+    async def set_leds(self, on, names=None, on_result=None):
+        return await self.run(lambda client: client.set_led(on), names, on_result=on_result)
+
+    async def status_all(self, max_age=None, names=None):
+        return await self.run(lambda client: client.get_status(max_age), names)
+
+
+async def _main(ports, action, led, reset):
+    controller = PanelController()
+    for port in ports:
+        controller.add(port)
+    start = time.monotonic()
+    connected = await controller.connect_all(reset=reset, on_result=lambda result: print(f"connect {result}"))
+    names = [name for name, result in connected.items() if result.ok]
+    print(f"{len(names)}/{len(ports)} panels ready in {time.monotonic() - start:.2f} s")
+    if (action, led) == ("close", "on"):
+        operation = close_and_light
+    elif (action, led) == ("open", "off"):
+        operation = dark_and_open
+    else:
+        operation = lambda client: _sequence(client, action, led)
+    start = time.monotonic()
+    results = await controller.run(operation, names, on_result=lambda result: print(f"{action or 'led'} {result}"))
+    failed = sum(not result.ok for result in results.values())
+    print(f"Done in {time.monotonic() - start:.2f} s, {failed} failed")
+    await controller.close_all()
+    return failed
+
+
+async def _sequence(client, action, led):
+    status = None
+    if action == "close":
+        status = await client.close_cover()
+    elif action == "open":
+        status = await client.open_cover()
+    if led:
+        status = await client.set_led(led == "on")
+    return status or await client.get_status()
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one operation on several flat panels at once.")
+    parser.add_argument("action", nargs="?", choices=["open", "close", "status"], help="Cover action")
+    parser.add_argument("--led", choices=["on", "off"], help="LED state to set (after the cover action)")
+    parser.add_argument("--port", action="append", default=[], help="Serial port of a panel (repeatable)")
+    parser.add_argument("--sim", type=int, default=0, help="Add this many simulated panels")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Time scale of simulated panels")
+    parser.add_argument("--no-reset", action="store_true", help="Do not reset the boards when opening the ports")
+    args = parser.parse_args()
+    if not args.action and not args.led:
+        parser.error("Nothing to do: give an action and/or --led")
+
+    panels = []
+    if args.sim:
+        from panel_sim import VirtualPanel
+        panels = [VirtualPanel(time_scale=args.time_scale) for _ in range(args.sim)]
+        args.port += [panel.start() for panel in panels]
+    if not args.port:
+        parser.error("No panels: give --port (repeatable) or --sim N")
+    try:
+        failures = asyncio.run(_main(args.port, args.action, args.led, not args.no_reset))
+    finally:
+        for panel in panels:
+            panel.stop()
+    raise SystemExit(1 if failures else 0)
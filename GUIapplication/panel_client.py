@@ -0,0 +1,626 @@
+"""Headless asyncio client for the flat panel firmware.
+
+Every command returns an awaitable that resolves to the protocol message that
+completes it (or raises PanelError for an ERROR: reply). Commands may be issued back to back;
+they are written immediately as long as the firmware's 64-byte receive buffer
+can hold them, and replies are matched to requests in order. With firmware
+v1.6 a move only occupies the link until RESULT:MOVE:START; the commands
+behind it are answered while the cover travels, and the move's own future
+resolves on the status line after RESULT:MOVE:DONE (or raises MoveStopped).
+
+After set_binary(True) (firmware v1.6) commands go out as 5-byte binary
+frames and the firmware answers in 11-byte frames. Received frames are turned
+into the same protocol messages, with the ASCII equivalent as their line, so
+listeners, the state cache and recordings see no difference. Commands without
+a binary form are sent as ASCII, which switches the firmware back to ASCII.
+
+    async def main():
+        client = PanelClient("/dev/ttyACM0")
+        await client.connect() # Returns as soon as the firmware is ready
+        guid, state = await asyncio.gather(client.ping(), client.get_state())
+        await client.close_cover()
+        await client.set_led(True)
+        await client.close()
+"""
+import asyncio
+import collections
+import os
+import threading
+import time
+
+import serial
+
+import metrics
+import protocol
+from panel_state import PanelState
+from serial_reader import LineBuffer, ReaderStats, SerialLineReader
+
+# --- Constants ---
+CONNECT_TIMEOUT = 5.0 # Seconds for the firmware to become ready after opening the port
+BOOT_TIMEOUT = 3.0 # Wait this long for the post-reset status line before probing with PING
+PING_RETRY = 0.5 # Seconds between readiness PINGs
+CONNECT_LOG = os.path.join(os.path.expanduser("~"), ".flatpanel", "connect_times.csv")
+DEFAULT_TIMEOUT = 2.0 # Seconds to wait for a reply once the firmware starts on a command
+MOVE_TIMEOUT = (protocol.MAX_ANGLE - protocol.MIN_ANGLE) * protocol.MOVEMENT_DELAY / 1000.0 + 3.0
+MOVE_END_MARGIN = 2.0 # Seconds allowed beyond a v1.6 move's announced duration
+MOVE_COMMANDS = (protocol.COMMAND_OPEN, protocol.COMMAND_CLOSE, protocol.COMMAND_SETPOS_PREFIX)
+_FRAME_START = bytes((protocol.FRAME_SYNC,))
+# --- End Constants ---
+
+# --- Metrics (always on; see metrics.py for export) ---
+COMMAND_LATENCY = metrics.histogram("command_latency_seconds", "Time from writing a command to its completing reply",
+                                    ("port", "command"))
+COMMAND_ERRORS = metrics.counter("command_errors_total", "Commands that failed", ("port", "command", "reason"))
+LINK_BYTES = metrics.counter("link_bytes_total", "Bytes through the serial port", ("port", "direction"))
+LINK_LINES = metrics.counter("link_lines_total", "Lines received from the firmware", ("port",))
+LINK_QUEUE = metrics.gauge("link_queue_depth", "Commands unsent (waiting for buffer room) or pending a reply",
+                           ("port", "queue"))
+LINK_CONNECTS = metrics.counter("link_connects_total", "Successful connects, including reconnects", ("port",))
+LINK_LOST = metrics.counter("link_lost_total", "Links lost without close() being called", ("port",))
+MOVE_DURATION = metrics.histogram("move_duration_seconds", "Servo moves from MOVING to the final status line",
+                                  ("port",), buckets=metrics.MOVE_BUCKETS)
+
+
+class PanelError(Exception):
+    """The panel rejected a command or could not be reached."""
+
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.line = line # The ERROR: line from the firmware, if any
+
+
+class PanelTimeout(PanelError):
+    """No completing reply arrived in time."""
+
+
+class PanelDisconnected(PanelError):
+    """The serial link was closed or lost while a command was outstanding."""
+
+
+class MoveStopped(PanelError):
+    """A move ended early: COMMAND:STOP, or replaced by a newer move. angle is where the cover stopped."""
+
+    def __init__(self, message, line=None, angle=None):
+        super().__init__(message, line)
+        self.angle = angle
+
+
+def record_connect_time(port, seconds, reset, path=None):
+    """Appends one connect measurement to the CSV history (best effort)."""
+    path = path or CONNECT_LOG
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new_file = not os.path.exists(path)
+        with open(path, "a") as handle:
+            if new_file:
+                handle.write("timestamp,port,reset,seconds\n")
+            handle.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')},{port},{int(reset)},{seconds:.3f}\n")
+    except OSError:
+        pass
+
+
+def expected_reply(command):
+    """Message type(s) that complete `command`."""
+    if command == protocol.COMMAND_PING:
+        return protocol.Ping
+    if command == protocol.COMMAND_GETSTATE:
+        return protocol.State
+    if command == protocol.COMMAND_INFO:
+        return protocol.Info
+    if command.startswith(protocol.COMMAND_TELEMETRY_PREFIX) or command in (protocol.COMMAND_STOP, protocol.COMMAND_ABORT):
+        return protocol.Ok
+    if command.startswith(protocol.COMMAND_BINARY_PREFIX):
+        return protocol.BinaryMode
+    if command == protocol.COMMAND_GETSTATUS or command.startswith(MOVE_COMMANDS + (protocol.COMMAND_SETLED_PREFIX,)):
+        # Moves and SETLED report MOVING/OK/debug lines first and always finish with a status line
+        return protocol.Status
+    return (protocol.Ping, protocol.State, protocol.Info, protocol.Status, protocol.Ok)
+
+
+class _Request:
+    """One command on its way to, or being processed by, the firmware."""
+
+    __slots__ = ("command", "keyword", "data", "wire", "expects", "future", "timeout", "timer", "sent_at")
+
+    def __init__(self, command, future, timeout):
+        self.command = command
+        self.keyword = command.split(":")[1] if command.startswith("COMMAND:") else command # Metrics label
+        self.data = protocol.encode(command)
+        self.wire = None # Bytes actually written: data, or its binary frame
+        self.expects = expected_reply(command)
+        self.future = future
+        self.timeout = timeout
+        self.timer = None
+        self.sent_at = None
+
+
+class PanelClient:
+    """Asyncio connection to one panel over a serial port."""
+
+    def __init__(self, port, baud_rate=protocol.BAUD_RATE):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.ser = None
+        self.stats = ReaderStats()
+        self.connect_time = None # Seconds from open to firmware ready, set by connect()
+        self.boot_status = None # (angle, led_requested) from the post-reset status line
+        self.state = PanelState() # Kept current from every received line
+        self._loop = None
+        self._buffer = LineBuffer(frame_sync=protocol.FRAME_SYNC, frame_size=protocol.REPLY_FRAME.size)
+        self.binary = False # Commands go out as binary frames (set_binary)
+        self._switching = None # COMMAND:BINARY request in flight; nothing else is sent until it is answered
+        self._unsent = collections.deque() # Waiting for room in the device's receive buffer
+        self._pending = collections.deque() # Written, waiting for their completing line
+        self._move = None # v1.6: the move request after RESULT:MOVE:START, off the link until its status line
+        self._move_end = None # The MoveEnd line; the next status line completes self._move
+        self._line_listeners = []
+        self._message_listeners = []
+        self._disconnect_listeners = []
+        self._traffic_listeners = []
+        self._reader = None # Thread fallback where the port cannot be registered with the loop
+        self._reader_thread = None
+        self._move_started = None # time.monotonic() of the last MOVING line
+        self._rx_bytes = LINK_BYTES.labels(port, "rx")
+        self._tx_bytes = LINK_BYTES.labels(port, "tx")
+        self._rx_lines = LINK_LINES.labels(port)
+        self._unsent_depth = LINK_QUEUE.labels(port, "unsent")
+        self._pending_depth = LINK_QUEUE.labels(port, "pending")
+
+    # --- Listeners ---
+    def add_line_listener(self, callback):
+        """callback(line) for every received line, called on the event loop."""
+        self._line_listeners.append(callback)
+
+    def remove_line_listener(self, callback):
+        if callback in self._line_listeners:
+            self._line_listeners.remove(callback)
+
+    def add_message_listener(self, callback):
+        """callback(message) with the parsed protocol.Message for every received line."""
+        self._message_listeners.append(callback)
+
+    def remove_message_listener(self, callback):
+        if callback in self._message_listeners:
+            self._message_listeners.remove(callback)
+
+    def add_disconnect_listener(self, callback):
+        """callback(exception) when the link is lost (not on close())."""
+        self._disconnect_listeners.append(callback)
+
+    def remove_disconnect_listener(self, callback):
+        if callback in self._disconnect_listeners:
+            self._disconnect_listeners.remove(callback)
+
+    def add_traffic_listener(self, callback):
+        """callback(data, sent) with the raw bytes of every line written (sent=True) or received.
+
+        Binary frames are passed as the bytes of their ASCII equivalent.
+        """
+        self._traffic_listeners.append(callback)
+
+    def remove_traffic_listener(self, callback):
+        if callback in self._traffic_listeners:
+            self._traffic_listeners.remove(callback)
+
+    # --- Connection ---
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    async def open(self, reset=True):
+        """Opens the serial port and starts receiving.
+
+        With reset=False DTR is held low so an already running Arduino is not
+        auto-reset. (Linux still pulses DTR on the very first open unless the
+        port has been set with `stty -F <port> -hupcl`.)
+        """
+        self._loop = asyncio.get_running_loop()
+        self.ser = await self._loop.run_in_executor(None, self._open_port, reset)
+        self._start_receiving()
+
+    def _open_port(self, reset):
+        if reset:
+            return serial.Serial(self.port, self.baud_rate, timeout=1)
+        port = serial.Serial(timeout=1)
+        port.port = self.port
+        port.baudrate = self.baud_rate
+        port.dtr = False # Applied as the port opens
+        port.rts = False
+        port.open()
+        return port
+
+    async def connect(self, reset=True, timeout=CONNECT_TIMEOUT):
+        """Opens the port and returns as soon as the firmware is ready.
+
+        Ready means the boot status line the firmware prints after a reset, or a
+        PING reply when the board was not reset. Returns the connect time in
+        seconds and appends it to CONNECT_LOG.
+        """
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        booted = loop.create_future()
+
+        def watch_boot(message):
+            if not booted.done() and isinstance(message, protocol.Status):
+                booted.set_result(message)
+
+        self.add_message_listener(watch_boot)
+        try:
+            await asyncio.wait_for(self._wait_ready(reset, booted), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise PanelTimeout(f"{self.port}: panel not ready within {timeout:.1f} s")
+        except BaseException:
+            await self.close()
+            raise
+        finally:
+            self.remove_message_listener(watch_boot)
+        if booted.done():
+            self.boot_status = self._status(booted.result())
+        self.connect_time = time.monotonic() - start
+        LINK_CONNECTS.labels(self.port).inc()
+        record_connect_time(self.port, self.connect_time, reset)
+        return self.connect_time
+
+    async def _wait_ready(self, reset, booted):
+        await self.open(reset)
+        if reset:
+            try:
+                await asyncio.wait_for(asyncio.shield(booted), BOOT_TIMEOUT)
+                return
+            except asyncio.TimeoutError:
+                pass # Board without auto-reset circuitry; fall through to PING
+        await self.ping_until_ready()
+
+    async def ping_until_ready(self):
+        """PINGs every PING_RETRY seconds until the firmware answers; returns its GUID.
+
+        Callers bound the total wait with asyncio.wait_for().
+        """
+        while True:
+            try:
+                return await self.ping(timeout=PING_RETRY)
+            except PanelTimeout:
+                continue
+            except PanelDisconnected:
+                raise
+            except PanelError:
+                continue # Leftover garbage in the firmware's buffer; try again
+
+    async def close(self):
+        """Closes the port; outstanding commands fail with PanelDisconnected."""
+        self._stop_receiving()
+        self._fail_all(PanelDisconnected("Connection closed"))
+        self.state.invalidate()
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+        self.ser = None
+
+    def _start_receiving(self):
+        self._buffer.clear()
+        self.binary = False # A fresh or reset board answers in ASCII; any ASCII command switches it back
+        self.state.invalidate() # Opening may have reset the board
+        self.stats = ReaderStats()
+        if os.name == "posix" and hasattr(self.ser, "fileno"):
+            # Readiness is reported by the loop's selector; nothing polls
+            self._loop.add_reader(self.ser.fileno(), self._on_readable)
+        else:
+            self._reader = SerialLineReader(self.ser, self._on_raw_line_threadsafe, self._buffer)
+            self.stats = self._reader.stats
+            self._reader_thread = threading.Thread(target=self._run_reader, daemon=True)
+            self._reader_thread.start()
+
+    def _stop_receiving(self):
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader = None
+        elif self.ser is not None and self._loop is not None:
+            try:
+                self._loop.remove_reader(self.ser.fileno())
+            except (ValueError, OSError, serial.SerialException):
+                pass
+
+    def _run_reader(self):
+        try:
+            self._reader.run()
+        except Exception as e:
+            self._loop.call_soon_threadsafe(self._connection_lost, e)
+
+    def _on_raw_line_threadsafe(self, raw):
+        # Line plus terminator, or a whole frame (the reader thread owns the raw reads)
+        self._rx_bytes.inc(len(raw) + (0 if raw[:1] == _FRAME_START else 1))
+        self._loop.call_soon_threadsafe(self._on_raw_line, raw)
+
+    def _on_readable(self):
+        woke_at = time.monotonic()
+        self.stats.wakeups += 1
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            self._connection_lost(e)
+            return
+        if not data:
+            self.stats.idle_wakeups += 1
+            return
+        self.stats.bytes += len(data)
+        self._rx_bytes.inc(len(data))
+        for raw in self._buffer.feed(data):
+            self._on_raw_line(raw)
+            self.stats.record_line(time.monotonic() - woke_at)
+
+    def _connection_lost(self, exc):
+        if self.ser is None:
+            return
+        self._stop_receiving()
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        self.ser = None
+        LINK_LOST.labels(self.port).inc()
+        self.state.invalidate()
+        self._fail_all(PanelDisconnected(f"Connection lost: {exc}"))
+        for callback in self._disconnect_listeners:
+            callback(exc)
+
+    def _fail_all(self, exc):
+        for request in ([self._move] if self._move else []) + list(self._pending) + list(self._unsent):
+            if request.timer:
+                request.timer.cancel()
+            if not request.future.done():
+                request.future.set_exception(exc)
+                COMMAND_ERRORS.labels(self.port, request.keyword, "disconnected").inc()
+        self._pending.clear()
+        self._unsent.clear()
+        self._move = None
+        self._move_end = None
+        self._move_started = None
+        self._switching = None
+        self.binary = False
+        self._update_depth()
+
+    # --- Receive path ---
+    def _on_raw_line(self, raw):
+        message = None
+        if raw[:1] == _FRAME_START:
+            message = protocol.decode_frame(raw)
+            raw = message.line.encode("ascii", errors="replace")
+        for callback in self._traffic_listeners:
+            callback(raw, False)
+        line = message.line if message is not None else raw.decode("ascii", errors="replace").strip()
+        if not line:
+            return
+        self._rx_lines.inc()
+        for callback in self._line_listeners:
+            callback(line)
+        if message is None:
+            message = protocol.parse(line)
+        if isinstance(message, protocol.BinaryMode):
+            self.binary = message.on # Before the requests waiting behind the switch are encoded
+        self.state.feed(message)
+        if isinstance(message, protocol.State) and message.state == "MOVING":
+            self._move_started = time.monotonic()
+        elif isinstance(message, (protocol.Status, protocol.MoveEnd)) and self._move_started is not None:
+            if self._move is None or isinstance(message, protocol.MoveEnd): # Not a GETSTATUS during a v1.6 move
+                MOVE_DURATION.labels(self.port).observe(time.monotonic() - self._move_started)
+                self._move_started = None
+        for callback in self._message_listeners:
+            callback(message)
+        if isinstance(message, protocol.MoveStart):
+            self._on_move_start(message)
+            return
+        if isinstance(message, protocol.MoveEnd):
+            self._move_end = message
+            return
+        if isinstance(message, protocol.Status) and self._move_end is not None:
+            self._on_move_end(message) # Printed together with MOVE:DONE/STOPPED; no reply can come between
+            return
+        if not self._pending:
+            return # Unsolicited: boot status, late replies
+        head = self._pending[0]
+        if protocol.is_rejection(message):
+            self._finish(head, error=PanelError(line, line))
+        elif isinstance(message, head.expects):
+            self._finish(head, result=message)
+        # Anything else (MOVING, RESULT:OK, debug text, OUT_OF_RANGE warnings) is progress
+
+    def _on_move_start(self, message):
+        # The firmware has taken the move off its input and answers other commands while it runs
+        if not self._pending or not self._pending[0].command.startswith(MOVE_COMMANDS):
+            return
+        request = self._pending.popleft()
+        if request.timer:
+            request.timer.cancel()
+        if self._move is not None: # Its end was lost; the firmware has moved on either way
+            self._finish(self._move, error=MoveStopped(f"{self._move.command} replaced by {request.command}"))
+        self._move = request
+        request.timer = self._loop.call_later(message.duration / 1000.0 + MOVE_END_MARGIN, self._expire, request)
+        self._arm_head()
+        self._pump()
+
+    def _on_move_end(self, status):
+        end = self._move_end
+        self._move_end = None
+        if self._move is None:
+            return
+        if end.stopped:
+            self._finish(self._move, error=MoveStopped(f"{self._move.command} stopped at {end.angle}", end.line, end.angle))
+        else:
+            self._finish(self._move, result=status)
+
+    def _finish(self, request, result=None, error=None):
+        if request.timer:
+            request.timer.cancel()
+        if request is self._move:
+            self._move = None
+        if request is self._switching:
+            self._switching = None
+        if request in self._pending:
+            was_head = self._pending[0] is request
+            self._pending.remove(request)
+        else:
+            was_head = False
+        if not request.future.done():
+            if error is not None:
+                request.future.set_exception(error)
+                reason = ("timeout" if isinstance(error, PanelTimeout) else "stopped" if isinstance(error, MoveStopped)
+                          else "rejected")
+                COMMAND_ERRORS.labels(self.port, request.keyword, reason).inc()
+            else:
+                request.future.set_result(result)
+                COMMAND_LATENCY.labels(self.port, request.keyword).observe(time.monotonic() - request.sent_at)
+        if was_head:
+            self._arm_head()
+        self._pump()
+
+    def _arm_head(self):
+        # A command's timeout only starts once everything queued ahead of it is done
+        if self._pending and self._pending[0].timer is None:
+            head = self._pending[0]
+            head.timer = self._loop.call_later(head.timeout, self._expire, head)
+
+    def _expire(self, request):
+        self._finish(request, error=PanelTimeout(f"No reply to {request.command} within {request.timeout:.1f} s"))
+
+    # --- Send path ---
+    def _in_flight_bytes(self):
+        return sum(len(request.wire) for request in self._pending)
+
+    def _update_depth(self):
+        self._unsent_depth.set(len(self._unsent))
+        self._pending_depth.set(len(self._pending) + (self._move is not None))
+
+    def _pump(self):
+        self._send_ready()
+        self._update_depth()
+
+    def _send_ready(self):
+        while self._unsent and self.is_open and self._switching is None:
+            request = self._unsent[0]
+            wire = self._encode(request.command, request.data)
+            if self._pending and self._in_flight_bytes() + len(wire) > protocol.RX_BUFFER_SIZE:
+                return # The firmware would drop these bytes; wait for a reply first
+            self._unsent.popleft()
+            request.wire = wire
+            if request.command.startswith(protocol.COMMAND_BINARY_PREFIX):
+                self._switching = request
+            try:
+                self.ser.write(wire)
+            except (serial.SerialException, OSError) as e:
+                self._unsent.appendleft(request)
+                self._connection_lost(e)
+                return
+            request.sent_at = time.monotonic()
+            self._tx_bytes.inc(len(wire))
+            for callback in self._traffic_listeners:
+                callback(request.data, True)
+            self._pending.append(request)
+            if len(self._pending) == 1:
+                self._arm_head()
+
+    def _encode(self, command, data):
+        if self.binary:
+            frame = protocol.encode_frame(command)
+            if frame is not None:
+                return frame
+            self.binary = False # Sent as ASCII, which switches the firmware's replies back to ASCII
+        return data
+
+    async def request(self, command, timeout=None):
+        """Sends a raw command string and returns the protocol.Message that completes it."""
+        if not self.is_open:
+            raise PanelDisconnected("Not connected")
+        if timeout is None:
+            timeout = MOVE_TIMEOUT if command.startswith(MOVE_COMMANDS) else DEFAULT_TIMEOUT
+        request = _Request(command.strip(), self._loop.create_future(), timeout)
+        self._unsent.append(request)
+        self._pump()
+        return await request.future
+
+    # --- Commands ---
+    async def ping(self, timeout=None):
+        """Returns the device GUID."""
+        return (await self.request(protocol.COMMAND_PING, timeout)).guid
+
+    async def info(self):
+        return (await self.request(protocol.COMMAND_INFO)).text
+
+    async def get_state(self, max_age=None):
+        """Returns 'OPEN', 'CLOSED' or 'MOVING'.
+
+        With max_age (seconds) the answer comes from self.state when that is
+        fresh enough, without a serial round trip; a move in progress is always
+        answered from the cache instead of waiting for the firmware.
+        """
+        if max_age is not None and self.state.fresh(max_age):
+            self.state.hits += 1
+            return self.state.cover_state
+        self.state.misses += 1
+        return (await self.request(protocol.COMMAND_GETSTATE)).state
+
+    async def get_status(self, max_age=None):
+        """Returns (angle, led_requested); from the cache if max_age is given and it is fresh enough."""
+        if max_age is not None and self.state.fresh(max_age):
+            self.state.hits += 1
+            return self.state.angle, self.state.led_requested
+        self.state.misses += 1
+        return self._status(await self.request(protocol.COMMAND_GETSTATUS))
+
+    async def set_position(self, angle):
+        """Moves to `angle` and returns the final (angle, led_requested)."""
+        return self._status(await self.request(protocol.set_position_command(angle)))
+
+    async def open_cover(self):
+        return self._status(await self.request(protocol.COMMAND_OPEN))
+
+    async def close_cover(self):
+        return self._status(await self.request(protocol.COMMAND_CLOSE))
+
+    async def set_led(self, on, level=None):
+        """Requests the LED on/off (lit only while closed), at PWM `level` if given (v1.7); returns (angle, led_requested)."""
+        return self._status(await self.request(protocol.set_led_command(on, level)))
+
+    async def stop(self):
+        """Stops a move where it is (firmware v1.6); the move's own command raises MoveStopped."""
+        await self.request(protocol.COMMAND_STOP)
+
+    async def set_binary(self, on):
+        """Switches both directions to binary frames, or back to ASCII (PanelError on firmware before v1.6)."""
+        await self.request(protocol.binary_command(on))
+
+    async def set_telemetry(self, on):
+        """Turns per-degree T: samples during moves on or off (PanelError on firmware without telemetry)."""
+        await self.request(protocol.set_telemetry_command(on))
+
+    @staticmethod
+    def _status(message):
+        return message.angle, message.led
+
+
+class LoopThread:
+    """Runs an asyncio event loop in a daemon thread so Tk code can submit coroutines."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedules a coroutine; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, callback, *args):
+        """Runs a plain callback on the loop thread."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=2)
@@ -0,0 +1,500 @@
+"""Pseudo-terminal stand-in for ArduinoProgram/FlatFieldPanel.ino.
+
+Opens a pty, prints the slave path and speaks the firmware's serial protocol
+with the firmware's timing (including the non-blocking v1.6 motion profile,
+so commands are answered while the cover moves), so the GUIs and benchmarks
+can run without a board:
+
+    python3 panel_sim.py --link /dev/ttyUSBsim
+
+Linking under /dev/ttyUSB* makes the device show up in the GUIs' port lists.
+"""
+import argparse
+import collections
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+from protocol import (
+    BAUD_RATE, MIN_ANGLE, MAX_ANGLE, MOTION_INTERVAL, STATE_TOLERANCE, RX_BUFFER_SIZE, DEVICE_GUID,
+    COMMAND_PING, COMMAND_INFO, COMMAND_GETSTATE, COMMAND_GETSTATUS, COMMAND_OPEN, COMMAND_CLOSE,
+    COMMAND_SETPOS_PREFIX, COMMAND_SETLED_PREFIX, COMMAND_TELEMETRY_PREFIX, COMMAND_STOP, COMMAND_ABORT,
+    COMMAND_BINARY_PREFIX, RESULT_BINARY_PREFIX, ERROR_BAD_FRAME,
+    FRAME_SYNC, COMMAND_FRAME, FRAME_COMMANDS, FRAME_ARG_COMMANDS, FRAME_SETLED_LEVEL, crc8, encode_reply, parse,
+    MAX_BRIGHTNESS,
+    RESULT_PING, RESULT_INFO, RESULT_STATE_OPEN, RESULT_STATE_CLOSED, RESULT_STATE_MOVING,
+    RESULT_STATUS_PREFIX, RESULT_OK, RESULT_MOVE_START, RESULT_MOVE_DONE, RESULT_MOVE_STOPPED, TELEMETRY_PREFIX,
+    ERROR_INVALID_COMMAND, ERROR_INVALID_ARGUMENT, ERROR_OUT_OF_RANGE,
+    move_duration, profile_distance,
+)
+
+# --- Firmware timing not visible in the protocol ---
+SETUP_DELAY = 500 # delay(500) in setup()
+BOOTLOADER_DELAY = 1000 # Optiboot waits this long for an upload after a DTR reset
+LINE_BUFFER_SIZE = 64 # readSerial() drops characters beyond this many per line
+BYTE_TIME = 10.0 / BAUD_RATE # Seconds to clock one 8N1 byte out of the UART
+# --- End Constants ---
+
+
+_FRAME_TO_COMMAND = {code: command for command, code in FRAME_COMMANDS.items() if command != COMMAND_ABORT}
+_FRAME_TO_PREFIX = {code: prefix for prefix, code in FRAME_ARG_COMMANDS.items()}
+
+
+class _Reset(Exception):
+    """Raised inside the firmware thread when the host resets the board."""
+
+
+def arduino_to_int(text):
+    """String::toInt() as seen by an `int` on the Uno: atol() truncated to 16 bits."""
+    text = text.lstrip()
+    sign = 1
+    if text[:1] in ("-", "+"):
+        sign = -1 if text[0] == "-" else 1
+        text = text[1:]
+    digits = ""
+    for char in text:
+        if not char.isdigit():
+            break
+        digits += char
+    value = sign * int(digits) if digits else 0
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+
+class VirtualPanel:
+    """Simulated flat panel behind a pseudo-terminal."""
+
+    def __init__(self, time_scale=1.0, reset_on_open=True, link=None,
+                 drop_rate=0.0, garble_rate=0.0, seed=None):
+        self.time_scale = time_scale # 1.0 = firmware speed, 0.1 = ten times faster
+        self.reset_on_open = reset_on_open # Emulate the DTR auto-reset of an Uno
+        self.link = link # Optional symlink pointing at the pty
+        self.drop_rate = drop_rate # Probability of losing each transmitted byte
+        self.garble_rate = garble_rate # Probability of corrupting each transmitted line
+        self.disconnect_after = None # Yank the port this many degrees into the next move
+        self.slow_steps = 0 # Extra milliseconds per degree beyond the announced plan, to exercise move-timing checks
+        self.random = random.Random(seed)
+        self.port = None
+        self.stats = collections.Counter()
+
+        # Firmware globals
+        self.current_angle = MIN_ANGLE
+        self.target_angle = MIN_ANGLE
+        self.led_requested = False
+        self.led_on = False # Physical pin state
+        self.led_level = MAX_BRIGHTNESS # PWM duty while lit
+        self.moving = False
+        self.telemetry = False
+        self.input_line = bytearray()
+        self.frame = bytearray() # Binary command frame received so far
+        self.binary = False # Replies go out as binary frames
+        self.move_start_angle = MIN_ANGLE
+        self.move_start_ms = 0
+        self.move_duration_ms = 0
+        self.last_motion_ms = 0
+
+        self._master = None
+        self._running = False
+        self._host_open = False
+        self._booting = False
+        self._generation = 0 # Bumped on every reset
+        self._boot_time = time.monotonic() # millis() counts from here
+        self._rx = collections.deque()
+        self._rx_cond = threading.Condition()
+        self._tx_lock = threading.Lock()
+        self._threads = []
+
+    # --- Lifecycle ---
+    def start(self):
+        """Creates the pty and starts the UART and firmware threads. Returns the port path."""
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        os.close(slave) # Hang-up on the master now tells us when a host opens the port
+        if self.link:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+        self._running = True
+        if not self.reset_on_open:
+            self._reset() # Board has been powered and running all along
+        for target in (self._uart_loop, self._firmware_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self.port
+
+    def stop(self):
+        """Shuts the device down and removes the pty."""
+        self._running = False
+        with self._rx_cond:
+            self._rx_cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+        self._threads = []
+        self._close_master()
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def yank(self):
+        """Simulates the USB cable being pulled: the host sees an I/O error."""
+        self.stats["disconnects"] += 1
+        self._running = False
+        with self._rx_cond:
+            self._rx_cond.notify_all()
+        self._close_master()
+
+    @property
+    def running(self):
+        return self._running
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _close_master(self):
+        with self._tx_lock:
+            if self._master is not None:
+                os.close(self._master)
+                self._master = None
+
+    def _sleep(self, milliseconds):
+        time.sleep(milliseconds / 1000.0 * self.time_scale)
+
+    def _millis(self):
+        return int((time.monotonic() - self._boot_time) * 1000.0 / self.time_scale)
+
+    def _reset(self):
+        with self._rx_cond:
+            self._generation += 1
+            self._booting = True
+            self._rx.clear()
+            self._rx_cond.notify_all()
+        self.stats["resets"] += 1
+
+    # --- UART side: moves bytes between the pty and the 64-byte ring buffer ---
+    def _uart_loop(self):
+        poller = select.poll()
+        poller.register(self._master, select.POLLIN)
+        while self._running:
+            try:
+                events = poller.poll(50)
+            except (OSError, ValueError):
+                break
+            hung_up = any(mask & select.POLLHUP for _, mask in events)
+            if hung_up:
+                self._host_open = False
+                time.sleep(0.01) # Nobody has the port open; wait for a host
+                continue
+            if not self._host_open:
+                self._host_open = True
+                if self.reset_on_open:
+                    self._reset()
+            if not any(mask & select.POLLIN for _, mask in events):
+                continue
+            try:
+                data = os.read(self._master, 1024)
+            except OSError:
+                continue
+            with self._rx_cond:
+                if self._booting:
+                    continue # The bootloader swallows anything sent during reset
+                for byte in data:
+                    if len(self._rx) >= RX_BUFFER_SIZE:
+                        self.stats["rx_overflow_bytes"] += 1
+                    else:
+                        self._rx.append(byte)
+                self._rx_cond.notify_all()
+
+    def _transmit(self, data):
+        data = bytearray(data)
+        if self.garble_rate and self.random.random() < self.garble_rate:
+            index = self.random.randrange(len(data) - 2)
+            data[index] = self.random.choice(b"#%&*?~")
+            self.stats["garbled_lines"] += 1
+        if self.drop_rate:
+            kept = bytearray(b for b in data if self.random.random() >= self.drop_rate)
+            self.stats["dropped_bytes"] += len(data) - len(kept)
+            data = kept
+        # The line is complete on the host only once the UART has clocked out every byte
+        time.sleep(len(data) * BYTE_TIME * self.time_scale)
+        with self._tx_lock:
+            if self._master is None or not self._host_open:
+                return
+            try:
+                os.write(self._master, data)
+            except OSError:
+                return
+        self.stats["tx_bytes"] += len(data)
+
+    # --- Firmware side: Serial.* helpers ---
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            raise _Reset()
+        if not self._running:
+            raise _Reset()
+
+    def _println(self, text):
+        if not self.binary:
+            self._transmit((text + "\r\n").encode("ascii"))
+            return
+        frame = encode_reply(parse(text)) # The firmware sends the same content as a frame
+        if frame is not None: # Debug text is not sent in binary mode
+            self._transmit(frame)
+
+    # --- Firmware ---
+    def _firmware_loop(self):
+        while self._running:
+            with self._rx_cond:
+                while self._running and not self._booting:
+                    self._rx_cond.wait(0.1)
+                generation = self._generation
+            if not self._running:
+                break
+            try:
+                self._setup(generation)
+                while True:
+                    self._read_serial(generation)
+                    if self.moving:
+                        self._update_motion(generation)
+                    self._idle(generation)
+            except _Reset:
+                continue
+
+    def _idle(self, generation):
+        # loop() spins on the board; here the thread sleeps until a byte arrives or the next motion tick is due
+        with self._rx_cond:
+            self._check_generation(generation)
+            if not self._rx:
+                self._rx_cond.wait(MOTION_INTERVAL / 1000.0 * self.time_scale if self.moving else 0.1)
+
+    def _read_serial(self, generation):
+        while True:
+            with self._rx_cond:
+                self._check_generation(generation)
+                if not self._rx:
+                    return
+                byte = self._rx.popleft()
+            if self.frame or byte == FRAME_SYNC:
+                if not self.frame:
+                    self.input_line = bytearray() # ASCII never contains FRAME_SYNC; a partial line before it is noise
+                self.frame.append(byte)
+                if len(self.frame) == COMMAND_FRAME.size:
+                    frame, self.frame = bytes(self.frame), bytearray()
+                    self._handle_frame(frame, generation)
+            elif byte == ord("\n"):
+                command = self.input_line.decode("ascii", errors="replace").strip()
+                self.input_line = bytearray()
+                if command:
+                    self.binary = False # Any ASCII command switches the replies back to ASCII
+                self._dispatch(command, generation)
+            elif len(self.input_line) < LINE_BUFFER_SIZE:
+                self.input_line.append(byte)
+
+    def _setup(self, generation):
+        self._boot_time = time.monotonic()
+        if self.reset_on_open:
+            self._sleep(BOOTLOADER_DELAY)
+        self.current_angle = self.target_angle = MIN_ANGLE
+        self.led_requested = False
+        self.moving = False
+        self.led_on = False
+        self.led_level = MAX_BRIGHTNESS
+        self.telemetry = False
+        self.input_line = bytearray()
+        self.frame = bytearray()
+        self.binary = False
+        self._sleep(SETUP_DELAY)
+        with self._rx_cond:
+            self._check_generation(generation)
+            self._booting = False
+        self._send_status()
+
+    def _dispatch(self, command, generation):
+        self.stats["commands"] += 1
+        if command == COMMAND_PING: self._println(RESULT_PING + DEVICE_GUID)
+        elif command == COMMAND_INFO: self._println(RESULT_INFO)
+        elif command == COMMAND_GETSTATE: self._send_ascom_state()
+        elif command == COMMAND_GETSTATUS: self._send_status()
+        elif command == COMMAND_OPEN: self._move_to_position(MAX_ANGLE, generation)
+        elif command == COMMAND_CLOSE: self._move_to_position(MIN_ANGLE, generation)
+        elif command in (COMMAND_STOP, COMMAND_ABORT): self._handle_stop()
+        elif command.startswith(COMMAND_SETPOS_PREFIX): self._handle_set_position(command, generation)
+        elif command.startswith(COMMAND_SETLED_PREFIX): self._handle_set_led(command)
+        elif command.startswith(COMMAND_TELEMETRY_PREFIX): self._handle_set_telemetry(command)
+        elif command.startswith(COMMAND_BINARY_PREFIX): self._handle_set_binary(command)
+        elif command: self._println(f"{ERROR_INVALID_COMMAND}:{command}")
+
+    def _is_closed(self):
+        return abs(self.current_angle - MIN_ANGLE) < STATE_TOLERANCE
+
+    def _send_ascom_state(self):
+        if self.moving: self._println(RESULT_STATE_MOVING)
+        elif self._is_closed(): self._println(RESULT_STATE_CLOSED)
+        else: self._println(RESULT_STATE_OPEN)
+
+    def _send_status(self):
+        self._println(f"{RESULT_STATUS_PREFIX}{self.current_angle}:{1 if self.led_requested else 0}:{self.led_level}")
+
+    def _handle_set_position(self, command, generation):
+        arg = command[len(COMMAND_SETPOS_PREFIX):]
+        if any(char.isdigit() for char in arg):
+            self._move_to_position(arduino_to_int(arg), generation)
+        else:
+            self._println(ERROR_INVALID_ARGUMENT)
+
+    def _handle_set_led(self, command):
+        arg = command[len(COMMAND_SETLED_PREFIX):]
+        _, sep, level_arg = arg.partition(":")
+        level = arduino_to_int(level_arg) if sep else self.led_level
+        if (not any(char.isdigit() for char in arg)
+                or sep and (not any(char.isdigit() for char in level_arg) or not 0 <= level <= MAX_BRIGHTNESS)):
+            self._println(ERROR_INVALID_ARGUMENT)
+            return
+        self.led_level = level
+        self.led_requested = arduino_to_int(arg) != 0
+        self._println("LED state requested: " + ("ON" if self.led_requested else "OFF"))
+        if not self.moving and self._is_closed():
+            self._println("Applying LED state.")
+            self.led_on = self.led_requested
+        else:
+            self._println("Cover not closed or moving, ensuring LED is OFF.")
+            self.led_on = False
+        self._println(RESULT_OK)
+        self._send_status()
+
+    def _handle_set_telemetry(self, command):
+        arg = command[len(COMMAND_TELEMETRY_PREFIX):]
+        if any(char.isdigit() for char in arg):
+            self.telemetry = arduino_to_int(arg) != 0
+            self._println(RESULT_OK)
+        else:
+            self._println(ERROR_INVALID_ARGUMENT)
+
+    def _handle_set_binary(self, command):
+        arg = command[len(COMMAND_BINARY_PREFIX):]
+        if any(char.isdigit() for char in arg):
+            on = arduino_to_int(arg) != 0
+            self._println(f"{RESULT_BINARY_PREFIX}{1 if on else 0}") # Still ASCII
+            self.binary = on
+        else:
+            self._println(ERROR_INVALID_ARGUMENT)
+
+    def _handle_frame(self, frame, generation):
+        self.stats["frames"] += 1
+        if crc8(frame[1:-1]) != frame[-1]:
+            self._println(ERROR_BAD_FRAME) # In the current mode: line noise must not switch an ASCII session
+            return
+        self.binary = True # A valid frame switches the replies to frames
+        _, code, arg, _ = COMMAND_FRAME.unpack(frame)
+        command = _FRAME_TO_COMMAND.get(code)
+        if code == FRAME_SETLED_LEVEL:
+            command = f"{COMMAND_SETLED_PREFIX}{arg >> 8 & 1}:{arg & 0xFF}"
+        elif command is None:
+            prefix = _FRAME_TO_PREFIX.get(code)
+            command = f"{prefix}{arg}" if prefix else f"FRAME:{code:#04x}"
+        self._dispatch(command, generation)
+
+    def _send_sample(self):
+        self._println(f"{TELEMETRY_PREFIX}{self._millis()}:{self.current_angle}:{1 if self.led_requested else 0}")
+
+    def _handle_stop(self):
+        if self.moving:
+            self._finish_move(True)
+        self._println(RESULT_OK)
+
+    def _move_to_position(self, target, generation):
+        if self.moving:
+            self._finish_move(True) # A new move replaces the running one
+        constrained = max(MIN_ANGLE, min(MAX_ANGLE, target))
+        if target != constrained:
+            self._println(f"{ERROR_OUT_OF_RANGE}: Requested={target}, Actual={constrained}")
+        self.target_angle = constrained
+
+        if self.target_angle == self.current_angle:
+            self.led_on = self.led_requested if self._is_closed() else False
+            self._send_status()
+            return
+
+        self.moving = True
+        self.led_on = False
+        self._println(RESULT_STATE_MOVING)
+        self.move_start_angle = self.current_angle
+        self.move_duration_ms = int(move_duration(self.target_angle - self.current_angle) * 1000.0 + 0.5)
+        self.move_start_ms = self.last_motion_ms = self._millis()
+        self._println(f"{RESULT_MOVE_START}{self.move_start_angle}:{self.target_angle}:{self.move_duration_ms}")
+        if self.telemetry:
+            self._send_sample()
+
+    def _update_motion(self, generation):
+        now = self._millis()
+        if now - self.last_motion_ms < MOTION_INTERVAL:
+            return
+        self.last_motion_ms = now
+        degrees = self.target_angle - self.move_start_angle
+        # slow_steps stretches the real motion; the announced plan stays the firmware's
+        actual_ms = self.move_duration_ms + self.slow_steps * abs(degrees)
+        elapsed = (now - self.move_start_ms) * self.move_duration_ms / actual_ms if actual_ms else 0
+        travelled = int(profile_distance(self.move_duration_ms / 1000.0, degrees, elapsed / 1000.0) + 0.5)
+        position = self.move_start_angle + (travelled if degrees > 0 else -travelled)
+        if now - self.move_start_ms >= actual_ms:
+            position = self.target_angle
+
+        if position != self.current_angle:
+            self.current_angle = position
+            if self.telemetry:
+                self._send_sample()
+            if self.disconnect_after is not None and abs(position - self.move_start_angle) >= self.disconnect_after:
+                self.disconnect_after = None
+                self.yank()
+                raise _Reset()
+        self._check_generation(generation)
+        if self.current_angle == self.target_angle:
+            self._finish_move(False)
+
+    def _finish_move(self, stopped):
+        self.moving = False
+        self.target_angle = self.current_angle
+        self._println(f"{RESULT_MOVE_STOPPED if stopped else RESULT_MOVE_DONE}{self.current_angle}")
+        if self._is_closed():
+            self._println("Movement finished at closed pos. Applying LED state: " + ("ON" if self.led_requested else "OFF"))
+            self.led_on = self.led_requested
+        else:
+            self._println("Movement finished at open pos. Ensuring LED is OFF.")
+            self.led_on = False
+        self._send_status()
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated FlatFieldPanel on a pseudo-terminal.")
+    parser.add_argument("--link", help="Create a symlink to the pty (e.g. /dev/ttyUSBsim)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Scale all firmware delays (default 1.0)")
+    parser.add_argument("--no-reset", action="store_true", help="Do not emulate the auto-reset when the port is opened")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability of dropping each transmitted byte")
+    parser.add_argument("--garble-rate", type=float, default=0.0, help="Probability of corrupting each transmitted line")
+    parser.add_argument("--disconnect-after", type=int, help="Drop the connection this many degrees into the first move")
+    parser.add_argument("--slow-steps", type=int, default=0, help="Extra milliseconds per degree beyond the plan (a sluggish move)")
+    parser.add_argument("--seed", type=int, help="Random seed for fault injection")
+    args = parser.parse_args()
+
+    panel = VirtualPanel(time_scale=args.time_scale, reset_on_open=not args.no_reset, link=args.link,
+                         drop_rate=args.drop_rate, garble_rate=args.garble_rate, seed=args.seed)
+    panel.disconnect_after = args.disconnect_after
+    panel.slow_steps = args.slow_steps
+    print(f"Virtual panel on {panel.start()}" + (f" (linked as {args.link})" if args.link else ""))
+    try:
+        while panel.running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        panel.stop()
+        print(f"Stopped. Stats: {dict(panel.stats)}")
@@ -0,0 +1,139 @@
+"""Last known panel state, kept current from the lines the firmware sends anyway.
+
+The firmware reports a status line on boot, after every move and after every
+SETLED, prints RESULT:STATE:MOVING when a move starts and (with telemetry)
+samples during it. Nothing changes on the board without one of those lines,
+so while the link is open the cache below is as good as a GETSTATE or
+GETSTATUS round trip, and unlike those it also answered during a move when
+the firmware blocked for it (up to v1.5). From v1.6 RESULT:MOVE:START
+announces the move's plan, so progress and planned_angle follow the motion
+profile between lines, and only RESULT:MOVE:DONE/STOPPED ends the move.
+
+    state = client.state
+    if state.fresh(max_age=30):
+        print(state.cover_state, state.angle, state.age())
+"""
+import time
+
+import protocol
+
+# --- Constants ---
+DEFAULT_MAX_AGE = 30.0 # Seconds; callers use this unless they need something stricter
+# --- End Constants ---
+
+
+class PanelState:
+    """Angle, LED request, moving flag and cover state with a freshness timestamp."""
+
+    def __init__(self):
+        self.angle = None # Last reported angle; None until the first status line
+        self.led_requested = False
+        self.led_level = None # PWM brightness used while lit (v1.7 status lines); None if not reported
+        self.moving = False
+        self.move_start = None # Start angle of the running v1.6 move (from RESULT:MOVE:START)
+        self.move_target = None # Its target; None when no planned move is running
+        self.move_started = None # time.monotonic() when it was announced
+        self.move_duration = None # Planned seconds
+        self.updated = None # time.monotonic() of the last line that confirmed the state
+        self.hits = 0 # Reads answered from the cache
+        self.misses = 0 # Reads that needed a query
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(state) after every update. Runs on the thread that feeds messages."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def feed(self, message):
+        """Updates the cache from one parsed message; returns True if it carried state."""
+        if isinstance(message, protocol.Status):
+            # A GETSTATUS or SETLED answered during a v1.6 move does not end it
+            self.angle, self.led_requested, self.moving = message.angle, message.led, self.move_target is not None
+            if message.level is not None:
+                self.led_level = message.level
+        elif isinstance(message, protocol.Sample):
+            self.angle, self.led_requested, self.moving = message.angle, message.led, True
+        elif isinstance(message, protocol.State):
+            self.moving = message.state == "MOVING"
+            if not self.moving:
+                self._clear_move()
+        elif isinstance(message, protocol.MoveStart):
+            self.angle, self.moving = message.start, True
+            self.move_start, self.move_target = message.start, message.target
+            self.move_started, self.move_duration = time.monotonic(), message.duration / 1000.0
+        elif isinstance(message, protocol.MoveEnd):
+            self.angle, self.moving = message.angle, False
+            self._clear_move()
+        else:
+            return False
+        self.updated = time.monotonic()
+        for callback in list(self._listeners):
+            callback(self)
+        return True
+
+    def _clear_move(self):
+        self.move_start = self.move_target = self.move_started = self.move_duration = None
+
+    def invalidate(self):
+        """Forgets everything, e.g. when the link closes or the board resets."""
+        self.angle = None
+        self.moving = False
+        self._clear_move()
+        self.updated = None
+        for callback in list(self._listeners):
+            callback(self)
+
+    @property
+    def known(self):
+        return self.angle is not None
+
+    def age(self):
+        """Seconds since the last state line (infinite if there was none)."""
+        return float("inf") if self.updated is None else time.monotonic() - self.updated
+
+    def fresh(self, max_age=DEFAULT_MAX_AGE):
+        """True if the cache can answer reads; a move in progress always counts as fresh."""
+        return self.known and (self.moving or self.age() <= max_age)
+
+    @property
+    def closed(self):
+        return self.known and abs(self.angle - protocol.MIN_ANGLE) < protocol.STATE_TOLERANCE
+
+    @property
+    def cover_state(self):
+        """'MOVING', 'CLOSED' or 'OPEN' as sendAscomState() would answer; None if unknown."""
+        if self.moving:
+            return "MOVING"
+        if not self.known:
+            return None
+        return "CLOSED" if self.closed else "OPEN"
+
+    @property
+    def led_on(self):
+        """Whether the LED is lit: the firmware lights it only while closed and not moving."""
+        return self.led_requested and self.closed and not self.moving
+
+    @property
+    def progress(self):
+        """Fraction 0-1 of the running v1.6 move by its plan; None without one."""
+        if self.move_target is None:
+            return None
+        if self.move_duration <= 0:
+            return 1.0
+        return min(1.0, (time.monotonic() - self.move_started) / self.move_duration)
+
+    @property
+    def planned_angle(self):
+        """Where the motion profile puts the servo now during a v1.6 move, else the last reported angle."""
+        if self.move_target is None:
+            return self.angle
+        degrees = self.move_target - self.move_start
+        travelled = protocol.profile_distance(self.move_duration, degrees, time.monotonic() - self.move_started)
+        return self.move_start + round(travelled) * (1 if degrees >= 0 else -1)
+
+    def __repr__(self):
+        return (f"PanelState(angle={self.angle}, led_requested={self.led_requested}, moving={self.moving}, "
+                f"age={self.age():.1f}s)")
@@ -0,0 +1,521 @@
+"""Serial protocol shared by the GUIs, the client library and the simulator.
+
+Mirrors the constants in ArduinoProgram/FlatFieldPanel.ino. parse() turns a
+received line into a typed message through a prefix dispatch table; the
+encode helpers build outgoing command bytes.
+
+    >>> parse("RESULT:STATUS:180:1:255")
+    Status(angle=180, led=True, level=255)
+"""
+import functools
+import struct
+
+# --- Link ---
+BAUD_RATE = 57600
+MIN_ANGLE = 20 # Closed position
+MAX_ANGLE = 180 # Open position
+MOVEMENT_DELAY = 20 # Milliseconds per degree while moving (firmware up to v1.5, blocking moves)
+MAX_SPEED = 100.0 # Degrees per second at cruise (v1.6 motion profile)
+ACCELERATION = 250.0 # Degrees per second squared at both ends of a move (0 = constant MAX_SPEED)
+MOTION_INTERVAL = 10 # Milliseconds between servo updates while moving
+STATE_TOLERANCE = 5 # Degrees from an end stop still reported as that state
+RX_BUFFER_SIZE = 64 # Arduino serial receive buffer; bytes beyond it are lost while the firmware is busy
+MAX_BRIGHTNESS = 255 # PWM level of a fully lit LED (v1.7; earlier firmware is only on or off)
+
+# --- Communication Protocol ---
+DEVICE_GUID = "b45ba2c9-f554-4b4e-a43c-10605ca3b84d"
+
+COMMAND_PING = "COMMAND:PING"
+COMMAND_INFO = "COMMAND:INFO"
+COMMAND_GETSTATE = "COMMAND:GETSTATE"
+COMMAND_OPEN = "COMMAND:OPEN"
+COMMAND_CLOSE = "COMMAND:CLOSE"
+COMMAND_SETPOS_PREFIX = "COMMAND:SETPOS:"
+COMMAND_SETLED_PREFIX = "COMMAND:SETLED:" # 0=Off, non-zero=On, then optionally :<brightness 0-255> (v1.7)
+COMMAND_GETSTATUS = "COMMAND:GETSTATUS"
+COMMAND_TELEMETRY_PREFIX = "COMMAND:TELEMETRY:" # 0=Off (default after reset), non-zero=On
+COMMAND_STOP = "COMMAND:STOP" # Stops a move where it is (v1.6)
+COMMAND_ABORT = "COMMAND:ABORT" # Same as COMMAND_STOP
+COMMAND_BINARY_PREFIX = "COMMAND:BINARY:" # 1 = reply in binary frames from now on, 0 = ASCII (v1.6)
+
+RESULT_PING = "RESULT:PING:OK:"
+RESULT_INFO = "RESULT:DarkSkyGeek's Telescope Cover Firmware v1.7-PWMLED"
+RESULT_STATE_PREFIX = "RESULT:STATE:"
+RESULT_STATE_UNKNOWN = "RESULT:STATE:UNKNOWN"
+RESULT_STATE_OPEN = "RESULT:STATE:OPEN"
+RESULT_STATE_CLOSED = "RESULT:STATE:CLOSED"
+RESULT_STATE_MOVING = "RESULT:STATE:MOVING"
+RESULT_STATUS_PREFIX = "RESULT:STATUS:" # <angle>:<0 or 1>, then :<brightness> from v1.7
+RESULT_OK = "RESULT:OK"
+RESULT_MOVE_START = "RESULT:MOVE:START:" # <from>:<to>:<planned ms>, right after MOVING (v1.6)
+RESULT_MOVE_DONE = "RESULT:MOVE:DONE:" # <angle>; the move's status line follows
+RESULT_MOVE_STOPPED = "RESULT:MOVE:STOPPED:" # <angle>; stopped by STOP or a newer move, status follows
+RESULT_BINARY_PREFIX = "RESULT:BINARY:" # <0 or 1>, the last ASCII line before binary replies
+TELEMETRY_PREFIX = "T:" # T:<millis>:<angle>:<0 or 1>, once per degree while moving with telemetry on
+
+ERROR_PREFIX = "ERROR:"
+ERROR_INVALID_COMMAND = "ERROR:INVALID_COMMAND"
+ERROR_INVALID_ARGUMENT = "ERROR:INVALID_ARGUMENT"
+ERROR_OUT_OF_RANGE = "ERROR:OUT_OF_RANGE"
+ERROR_BAD_FRAME = "ERROR:BAD_FRAME" # Binary frame with a wrong CRC-8
+# --- End Constants ---
+
+
+# --- Messages ---
+class Message:
+    """A line received from the firmware."""
+
+    __slots__ = ("line",)
+
+    def __init__(self, line):
+        self.line = line
+
+    def __repr__(self):
+        fields = [name for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ()) if name != "line"]
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in fields)
+        return f"{type(self).__name__}({args})"
+
+
+class Status(Message):
+    """RESULT:STATUS:<angle>:<led>[:<level>] - sent on boot, after every move and on request."""
+
+    __slots__ = ("angle", "led", "level")
+
+    def __init__(self, line, angle, led, level=None):
+        self.line = line
+        self.angle = angle
+        self.led = led # LED requested on (lit only while closed)
+        self.level = level # PWM brightness used while lit; None before v1.7
+
+
+class State(Message):
+    """RESULT:STATE:<OPEN|CLOSED|MOVING|UNKNOWN>."""
+
+    __slots__ = ("state",)
+
+    def __init__(self, line, state):
+        self.line = line
+        self.state = state
+
+
+class Ping(Message):
+    """RESULT:PING:OK:<guid>."""
+
+    __slots__ = ("guid",)
+
+    def __init__(self, line, guid):
+        self.line = line
+        self.guid = guid
+
+
+class Sample(Message):
+    """T:<millis>:<angle>:<led> - one telemetry sample, timestamped by the board's millis()."""
+
+    __slots__ = ("millis", "angle", "led")
+
+    def __init__(self, line, millis, angle, led):
+        self.line = line
+        self.millis = millis
+        self.angle = angle
+        self.led = led
+
+
+class MoveStart(Message):
+    """RESULT:MOVE:START:<from>:<to>:<ms> - a non-blocking move has begun; commands are served meanwhile."""
+
+    __slots__ = ("start", "target", "duration")
+
+    def __init__(self, line, start, target, duration):
+        self.line = line
+        self.start = start
+        self.target = target
+        self.duration = duration # Planned milliseconds
+
+
+class MoveEnd(Message):
+    """RESULT:MOVE:DONE:<angle> or RESULT:MOVE:STOPPED:<angle>; the next status line belongs to the move."""
+
+    __slots__ = ("angle", "stopped")
+
+    def __init__(self, line, angle, stopped):
+        self.line = line
+        self.angle = angle
+        self.stopped = stopped
+
+
+class BinaryMode(Message):
+    """RESULT:BINARY:<0|1> - confirms the reply format for the following commands."""
+
+    __slots__ = ("on",)
+
+    def __init__(self, line, on):
+        self.line = line
+        self.on = on
+
+
+class Info(Message):
+    """Any other RESULT: line, i.e. the firmware description."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, line, text):
+        self.line = line
+        self.text = text
+
+
+class Ok(Message):
+    """RESULT:OK."""
+
+    __slots__ = ()
+
+
+class Error(Message):
+    """ERROR:<code>[:<detail>] - the firmware rejected a command."""
+
+    __slots__ = ("code", "detail")
+
+    def __init__(self, line, code, detail=""):
+        self.line = line
+        self.code = code
+        self.detail = detail
+
+
+class InvalidCommand(Error):
+    __slots__ = ()
+
+
+class InvalidArgument(Error):
+    __slots__ = ()
+
+
+class OutOfRange(Error):
+    """Only a warning: the firmware still moves to the clamped angle."""
+
+    __slots__ = ()
+
+
+class Debug(Message):
+    """Free-form firmware text such as 'Applying LED state.'."""
+
+    __slots__ = ()
+
+
+class Unknown(Message):
+    """A RESULT:/ERROR:/T: line that does not parse, e.g. garbled on the wire."""
+
+    __slots__ = ()
+
+
+# --- Decoding ---
+def _parse_status(line, arg):
+    parts = arg.split(":")
+    try:
+        if len(parts) == 2:
+            return Status(line, int(parts[0]), int(parts[1]) != 0)
+        if len(parts) == 3:
+            return Status(line, int(parts[0]), int(parts[1]) != 0, int(parts[2]))
+    except ValueError:
+        pass
+    return Unknown(line)
+
+
+def _parse_state(line, arg):
+    return State(line, arg) if arg in ("OPEN", "CLOSED", "MOVING", "UNKNOWN") else Unknown(line)
+
+
+def _parse_ping(line, arg):
+    return Ping(line, arg[3:]) if arg.startswith("OK:") else Unknown(line)
+
+
+def _parse_ok(line, arg):
+    return Ok(line) if not arg else Unknown(line)
+
+
+def _parse_sample(line, rest):
+    parts = rest.split(":")
+    if len(parts) != 3:
+        return Unknown(line)
+    try:
+        return Sample(line, int(parts[0]), int(parts[1]), parts[2] != "0")
+    except ValueError:
+        return Unknown(line)
+
+
+def _parse_move(line, arg):
+    kind, _, rest = arg.partition(":")
+    parts = rest.split(":")
+    try:
+        if kind == "START" and len(parts) == 3:
+            return MoveStart(line, int(parts[0]), int(parts[1]), int(parts[2]))
+        if kind in ("DONE", "STOPPED") and len(parts) == 1:
+            return MoveEnd(line, int(parts[0]), kind == "STOPPED")
+    except ValueError:
+        pass
+    return Unknown(line)
+
+
+def _parse_binary(line, arg):
+    return BinaryMode(line, arg == "1") if arg in ("0", "1") else Unknown(line)
+
+
+_RESULT_PARSERS = {
+    "STATUS": _parse_status,
+    "MOVE": _parse_move,
+    "STATE": _parse_state,
+    "PING": _parse_ping,
+    "OK": _parse_ok,
+    "BINARY": _parse_binary,
+}
+
+_ERROR_TYPES = {
+    "INVALID_COMMAND": InvalidCommand,
+    "INVALID_ARGUMENT": InvalidArgument,
+    "OUT_OF_RANGE": OutOfRange,
+}
+
+
+def _parse_result(line, rest):
+    kind, _, arg = rest.partition(":")
+    parser = _RESULT_PARSERS.get(kind)
+    if parser is None:
+        return Info(line, rest)
+    return parser(line, arg)
+
+
+def _parse_error(line, rest):
+    code, _, detail = rest.partition(":")
+    error_type = _ERROR_TYPES.get(code, Error)
+    return error_type(line, code, detail.strip())
+
+
+_PARSERS = {
+    "RESULT": _parse_result,
+    "ERROR": _parse_error,
+    "T": _parse_sample,
+}
+
+
+def parse(line):
+    """Turns one received line (without line ending) into a Message."""
+    head, sep, rest = line.partition(":")
+    parser = _PARSERS.get(head) if sep else None
+    if parser is None:
+        return Debug(line)
+    return parser(line, rest)
+
+
+def is_rejection(message):
+    """True for errors that mean the command was not carried out."""
+    return isinstance(message, Error) and not isinstance(message, OutOfRange)
+
+
+# --- Motion ---
+def move_duration(degrees):
+    """Seconds the v1.6 firmware plans for a move of `degrees` (same trapezoid as planMove())."""
+    distance = abs(degrees)
+    if ACCELERATION <= 0:
+        return distance / MAX_SPEED
+    accel_time = MAX_SPEED / ACCELERATION
+    if MAX_SPEED * accel_time >= distance: # Never reaches MAX_SPEED: triangular profile
+        return 2 * (distance / ACCELERATION) ** 0.5
+    return 2 * accel_time + (distance - MAX_SPEED * accel_time) / MAX_SPEED
+
+
+def profile_distance(duration, degrees, t):
+    """Degrees travelled `t` seconds into a move of `degrees` planned to take `duration` seconds."""
+    distance = abs(degrees)
+    if t >= duration:
+        return distance
+    if ACCELERATION <= 0:
+        return distance * t / duration
+    accel_time = min(MAX_SPEED / ACCELERATION, duration / 2)
+    peak = ACCELERATION * accel_time
+    if t < accel_time:
+        return 0.5 * ACCELERATION * t * t
+    if t < duration - accel_time:
+        return 0.5 * peak * accel_time + peak * (t - accel_time)
+    remaining = duration - t
+    return distance - 0.5 * ACCELERATION * remaining * remaining
+
+
+# --- Encoding ---
+def set_position_command(angle):
+    return f"{COMMAND_SETPOS_PREFIX}{int(angle)}"
+
+
+def set_led_command(on, level=None):
+    """SETLED, with a PWM brightness 0-MAX_BRIGHTNESS if level is given (firmware before v1.7 ignores it)."""
+    if level is None:
+        return f"{COMMAND_SETLED_PREFIX}{1 if on else 0}"
+    return f"{COMMAND_SETLED_PREFIX}{1 if on else 0}:{int(level)}"
+
+
+def set_telemetry_command(on):
+    return f"{COMMAND_TELEMETRY_PREFIX}{1 if on else 0}"
+
+
+def binary_command(on):
+    return f"{COMMAND_BINARY_PREFIX}{1 if on else 0}"
+
+
+@functools.lru_cache(maxsize=512)
+def _encode_str(command):
+    return (command.rstrip("\r\n") + "\n").encode("ascii")
+
+
+def encode(command):
+    """Command string -> bytes on the wire (newline terminated). Repeated commands come from a cache."""
+    if isinstance(command, bytes):
+        command = command.decode("ascii")
+    return _encode_str(command)
+
+
+# --- Binary framing (v1.6, after COMMAND:BINARY:1) ---
+# Host -> device: sync, command byte, int16 argument, CRC-8 (5 bytes instead of up to 20).
+# Device -> host: sync, reply type, int16 a, int16 b, uint32 c, CRC-8 (11 bytes instead of up to 26).
+# Little-endian as on the AVR. The CRC-8 (polynomial 0x07) covers everything between sync and CRC.
+# ASCII never contains FRAME_SYNC, so both sides tell frames from lines by their first byte.
+FRAME_SYNC = 0xA5
+COMMAND_FRAME = struct.Struct("<BBhB")
+REPLY_FRAME = struct.Struct("<BBhhIB")
+GUID_PREFIX = int(DEVICE_GUID[:8], 16) # A PING frame carries the first 32 bits of the GUID
+
+FRAME_COMMANDS = { # Exact commands -> command byte
+    COMMAND_PING: ord("P"),
+    COMMAND_INFO: ord("I"),
+    COMMAND_GETSTATE: ord("E"),
+    COMMAND_GETSTATUS: ord("S"),
+    COMMAND_OPEN: ord("O"),
+    COMMAND_CLOSE: ord("C"),
+    COMMAND_STOP: ord("H"),
+    COMMAND_ABORT: ord("H"),
+}
+FRAME_ARG_COMMANDS = { # Prefix commands -> command byte; the number goes into the argument
+    COMMAND_SETPOS_PREFIX: ord("M"),
+    COMMAND_SETLED_PREFIX: ord("L"),
+    COMMAND_TELEMETRY_PREFIX: ord("T"),
+}
+FRAME_SETLED_LEVEL = ord("B") # SETLED:<on>:<level> (v1.7); the argument is on << 8 | level
+REPLY_PING, REPLY_INFO, REPLY_STATE, REPLY_STATUS = ord("P"), ord("I"), ord("E"), ord("S")
+REPLY_OK, REPLY_ERROR, REPLY_SAMPLE, REPLY_MOVE_START, REPLY_MOVE_END = ord("K"), ord("X"), ord("T"), ord("G"), ord("D")
+FRAME_STATES = ("UNKNOWN", "OPEN", "CLOSED", "MOVING") # REPLY_STATE a
+FRAME_ERRORS = (None, ERROR_INVALID_COMMAND, ERROR_INVALID_ARGUMENT, ERROR_OUT_OF_RANGE, ERROR_BAD_FRAME) # REPLY_ERROR a
+FIRMWARE_INFO = "RESULT:DarkSkyGeek's Telescope Cover Firmware v{}.{}-{}" # REPLY_INFO a, b
+FRAME_LEVEL_PRESENT = 0x100 # REPLY_STATUS c: brightness in the low byte, this bit set from v1.7
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+_CRC8 = _crc8_table()
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = _CRC8[crc ^ byte]
+    return crc
+
+
+@functools.lru_cache(maxsize=512)
+def encode_frame(command):
+    """Command string -> 5-byte binary frame, or None for commands without a binary form."""
+    code = FRAME_COMMANDS.get(command)
+    arg = 0
+    if code is None and command.startswith(COMMAND_SETLED_PREFIX) and command.count(":") == 3:
+        on, _, level = command[len(COMMAND_SETLED_PREFIX):].partition(":")
+        try:
+            on, level = int(on) != 0, int(level)
+        except ValueError:
+            return None
+        if not 0 <= level <= MAX_BRIGHTNESS:
+            return None
+        code, arg = FRAME_SETLED_LEVEL, on << 8 | level
+    elif code is None:
+        for prefix, prefix_code in FRAME_ARG_COMMANDS.items():
+            if command.startswith(prefix):
+                try:
+                    arg = int(command[len(prefix):])
+                except ValueError:
+                    return None
+                code = prefix_code
+                break
+        else:
+            return None
+        if not -0x8000 <= arg <= 0x7FFF:
+            return None
+    frame = bytearray(COMMAND_FRAME.pack(FRAME_SYNC, code, arg, 0))
+    frame[-1] = crc8(frame[1:-1])
+    return bytes(frame)
+
+
+def decode_frame(frame):
+    """11-byte reply frame -> the Message its ASCII equivalent would parse to (.line is that equivalent)."""
+    if len(frame) != REPLY_FRAME.size or crc8(frame[1:-1]) != frame[-1]:
+        return Unknown(f"FRAME:{bytes(frame).hex()}")
+    _, kind, a, b, c, _ = REPLY_FRAME.unpack(frame)
+    if kind == REPLY_STATUS:
+        if c & FRAME_LEVEL_PRESENT:
+            return Status(f"{RESULT_STATUS_PREFIX}{a}:{b}:{c & 0xFF}", a, b != 0, c & 0xFF)
+        return Status(f"{RESULT_STATUS_PREFIX}{a}:{b}", a, b != 0)
+    if kind == REPLY_SAMPLE:
+        return Sample(f"{TELEMETRY_PREFIX}{c}:{a}:{b}", c, a, b != 0)
+    if kind == REPLY_STATE and a < len(FRAME_STATES):
+        return State(RESULT_STATE_PREFIX + FRAME_STATES[a], FRAME_STATES[a])
+    if kind == REPLY_OK:
+        return Ok(RESULT_OK)
+    if kind == REPLY_MOVE_START:
+        return MoveStart(f"{RESULT_MOVE_START}{a}:{b}:{c}", a, b, c)
+    if kind == REPLY_MOVE_END:
+        return MoveEnd(f"{RESULT_MOVE_STOPPED if b else RESULT_MOVE_DONE}{a}", a, b != 0)
+    if kind == REPLY_PING:
+        guid = DEVICE_GUID if c == GUID_PREFIX else f"{c:08x}"
+        return Ping(RESULT_PING + guid, guid)
+    if kind == REPLY_INFO:
+        line = FIRMWARE_INFO.format(a, b, "PWMLED" if (a, b) >= (1, 7) else "DigitalLED")
+        return Info(line, line[len("RESULT:"):])
+    if kind == REPLY_ERROR and 0 < a < len(FRAME_ERRORS):
+        if FRAME_ERRORS[a] == ERROR_OUT_OF_RANGE:
+            return parse(f"{ERROR_OUT_OF_RANGE}: Requested={b}, Actual={c}")
+        return parse(FRAME_ERRORS[a] + (f":frame 0x{b:02X}" if FRAME_ERRORS[a] == ERROR_INVALID_COMMAND else ""))
+    return Unknown(f"FRAME:{bytes(frame).hex()}")
+
+
+def encode_reply(message):
+    """The reply frame the firmware sends instead of `message` in binary mode; None for debug text."""
+    if isinstance(message, Status):
+        level = 0 if message.level is None else FRAME_LEVEL_PRESENT | message.level
+        fields = (REPLY_STATUS, message.angle, int(message.led), level)
+    elif isinstance(message, Sample):
+        fields = (REPLY_SAMPLE, message.angle, int(message.led), message.millis)
+    elif isinstance(message, State):
+        fields = (REPLY_STATE, FRAME_STATES.index(message.state), 0, 0)
+    elif isinstance(message, Ok):
+        fields = (REPLY_OK, 0, 0, 0)
+    elif isinstance(message, MoveStart):
+        fields = (REPLY_MOVE_START, message.start, message.target, message.duration)
+    elif isinstance(message, MoveEnd):
+        fields = (REPLY_MOVE_END, message.angle, int(message.stopped), 0)
+    elif isinstance(message, Ping):
+        fields = (REPLY_PING, 0, 0, int(message.guid[:8], 16))
+    elif isinstance(message, Info):
+        major, _, minor = message.text.rpartition(" v")[2].partition("-")[0].partition(".")
+        fields = (REPLY_INFO, int(major), int(minor), 0)
+    elif isinstance(message, OutOfRange):
+        numbers = [int(part.split("=")[1]) for part in message.detail.split(",")]
+        fields = (REPLY_ERROR, FRAME_ERRORS.index(ERROR_OUT_OF_RANGE), numbers[0], numbers[1])
+    elif isinstance(message, Error):
+        code = ERROR_PREFIX + message.code
+        fields = (REPLY_ERROR, FRAME_ERRORS.index(code) if code in FRAME_ERRORS else 1, 0, 0)
+    else:
+        return None
+    frame = bytearray(REPLY_FRAME.pack(FRAME_SYNC, *fields, 0))
+    frame[-1] = crc8(frame[1:-1])
+    return bytes(frame)
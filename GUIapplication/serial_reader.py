@@ -0,0 +1,206 @@
+import os
+import selectors
+import threading
+import time
+
+# --- Constants ---
+READ_CHUNK = 256 # Max bytes pulled per wakeup when in_waiting is unknown
+MAX_PARTIAL_LINE = 1024 # Discard unterminated garbage beyond this many bytes
+FALLBACK_TIMEOUT = 0.5 # Blocking read timeout (seconds) where select() is unavailable
+# --- End Constants ---
+
+
+class LineBuffer:
+    """Incrementally splits a raw byte stream into complete lines.
+
+    With frame_sync, a byte of that value (never part of ASCII text) starts a
+    fixed-size binary frame of frame_size bytes, returned whole and unchanged
+    in between the lines.
+    """
+
+    def __init__(self, max_partial=MAX_PARTIAL_LINE, frame_sync=None, frame_size=0):
+        self._buffer = bytearray()
+        self.max_partial = max_partial
+        self.discarded_bytes = 0
+        self.frame_sync = frame_sync
+        self.frame_size = frame_size
+
+    def feed(self, data):
+        """Adds bytes and returns the list of complete lines (without terminators)."""
+        self._buffer += data
+        if self.frame_sync is not None:
+            return self._feed_mixed()
+        lines = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            lines.append(bytes(self._buffer[start:end]).rstrip(b"\r"))
+            start = end + 1
+        if start:
+            del self._buffer[:start]
+        if len(self._buffer) > self.max_partial:
+            # A line this long is noise, not firmware output; drop it
+            self.discarded_bytes += len(self._buffer)
+            self._buffer.clear()
+        return lines
+
+    def _feed_mixed(self):
+        buffer = self._buffer
+        sync, size = self.frame_sync, self.frame_size
+        items = []
+        start = 0
+        while start < len(buffer):
+            if buffer[start] == sync:
+                if len(buffer) - start < size:
+                    break
+                items.append(bytes(buffer[start:start + size]))
+                start += size
+                continue
+            end = buffer.find(b"\n", start)
+            frame = buffer.find(sync, start, end if end >= 0 else len(buffer))
+            if frame >= 0:
+                # Text cut short by a frame is noise (e.g. a line garbled on the wire)
+                self.discarded_bytes += frame - start
+                start = frame
+                continue
+            if end < 0:
+                break
+            items.append(bytes(buffer[start:end]).rstrip(b"\r"))
+            start = end + 1
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_partial:
+            self.discarded_bytes += len(buffer)
+            buffer.clear()
+        return items
+
+    def clear(self):
+        """Drops any partially received line."""
+        self._buffer.clear()
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+class ReaderStats:
+    """Counters describing how the reader spends its wakeups."""
+
+    def __init__(self):
+        self.wakeups = 0 # Times the reader returned from waiting
+        self.idle_wakeups = 0 # Wakeups that produced no bytes
+        self.bytes = 0
+        self.lines = 0
+        self.last_latency = 0.0 # Seconds from wakeup to line handoff
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.started = time.monotonic()
+
+    def record_line(self, latency):
+        self.lines += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.lines if self.lines else 0.0
+
+    def idle_wakeup_rate(self):
+        """Idle wakeups per second since the reader started."""
+        elapsed = time.monotonic() - self.started
+        return self.idle_wakeups / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """One-line human readable summary for the log window."""
+        return (f"{self.lines} lines, {self.bytes} bytes, "
+                f"latency mean {self.mean_latency * 1000:.2f} ms / max {self.max_latency * 1000:.2f} ms, "
+                f"{self.wakeups} wakeups ({self.idle_wakeups} idle)")
+
+
+class SerialLineReader:
+    """Blocks until the serial port has bytes, then hands complete lines to a callback.
+
+    On POSIX the port's file descriptor is watched with a selector together with
+    a wakeup pipe used by stop(), so an idle port costs no CPU at all. Elsewhere
+    the reader falls back to a blocking read with a timeout.
+    """
+
+    def __init__(self, ser, on_line, buffer=None):
+        self.ser = ser
+        self.on_line = on_line # Called from the reader thread with each raw line (bytes)
+        self.buffer = buffer if buffer is not None else LineBuffer()
+        self.stats = ReaderStats()
+        self._stopping = False
+        self._wake_r = self._wake_w = None
+        self._lock = threading.Lock()
+
+    def _can_select(self):
+        return os.name == "posix" and hasattr(self.ser, "fileno")
+
+    def run(self):
+        """Reads until stop() is called; serial errors propagate to the caller."""
+        self.stats.started = time.monotonic()
+        if self._can_select():
+            self._run_selector()
+        else:
+            self._run_blocking()
+
+    def stop(self):
+        """Asks run() to return as soon as possible. Safe to call from any thread."""
+        with self._lock:
+            self._stopping = True
+            if self._wake_w is not None:
+                try:
+                    os.write(self._wake_w, b"x")
+                except OSError:
+                    pass
+
+    def _run_selector(self):
+        with self._lock:
+            if self._stopping:
+                return
+            self._wake_r, self._wake_w = os.pipe()
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self.ser.fileno(), selectors.EVENT_READ, "serial")
+            selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+            while not self._stopping:
+                events = selector.select()
+                woke_at = time.monotonic()
+                self.stats.wakeups += 1
+                if self._stopping:
+                    break
+                if not any(key.data == "serial" for key, _ in events):
+                    self.stats.idle_wakeups += 1
+                    continue
+                # read() raises SerialException if the device vanished
+                data = self.ser.read(self.ser.in_waiting or 1)
+                self._handle(data, woke_at)
+        finally:
+            selector.close()
+            with self._lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_r = self._wake_w = None
+
+    def _run_blocking(self):
+        self.ser.timeout = FALLBACK_TIMEOUT
+        while not self._stopping:
+            data = self.ser.read(1)
+            woke_at = time.monotonic()
+            self.stats.wakeups += 1
+            if data and self.ser.in_waiting:
+                data += self.ser.read(min(self.ser.in_waiting, READ_CHUNK))
+            self._handle(data, woke_at)
+
+    def _handle(self, data, woke_at):
+        if not data:
+            self.stats.idle_wakeups += 1
+            return
+        self.stats.bytes += len(data)
+        for line in self.buffer.feed(data):
+            self.on_line(line)
+            self.stats.record_line(time.monotonic() - woke_at)
@@ -0,0 +1,263 @@
+"""Hot-plug aware reconnection for a PanelClient.
+
+When the link is lost (USB hub reset, cable knocked, board power-cycled),
+LinkSupervisor waits for the panel's port to come back, reconnects with
+capped exponential backoff, resyncs the cover and LED state and re-applies
+the last position and LED state that were requested, without anybody clicking
+Refresh and Connect:
+
+    supervisor = LinkSupervisor(client, on_event=print)
+    await client.connect()
+    supervisor.start()
+
+The panel is found again by its USB VID:PID:SERIAL, so it may come back
+under another device name (/dev/ttyACM0 -> /dev/ttyACM1). Retries wake as
+soon as a port appears: PortWatcher follows udev events when pyudev is
+installed, otherwise the modification time of /dev (one stat() per
+DEV_POLL_INTERVAL, no port enumeration), and comports() polling only where
+there is no /dev. Time from loss to a resynced panel is recorded in the
+flatpanel_link_recovery_seconds metric.
+"""
+import asyncio
+import os
+import time
+
+import serial
+
+try:
+    import pyudev
+except ImportError: # Optional: /dev is watched directly without it
+    pyudev = None
+
+import discovery
+import metrics
+import protocol
+from panel_client import PanelError
+
+# --- Constants ---
+BACKOFF_START = 0.5 # Seconds before the second attempt; doubles per failure
+BACKOFF_MAX = 10.0 # Never wait longer than this between attempts
+RECONNECT_TIMEOUT = 5.0 # Per attempt
+DEV_POLL_INTERVAL = 0.25 # Seconds between stat() calls on /dev
+COMPORTS_POLL_INTERVAL = 1.0 # Seconds between comports() calls where there is no /dev
+# --- End Constants ---
+
+LINK_RECOVERY = metrics.histogram("link_recovery_seconds", "Time from losing the link to a resynced panel",
+                                  ("port",), buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0))
+
+
+def _to_int(text):
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+class PortWatcher:
+    """Signals when serial ports may have appeared or disappeared."""
+
+    def __init__(self):
+        self.changed = asyncio.Event()
+        self.backend = None
+        self._task = None
+        self._monitor = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if pyudev is not None:
+            try:
+                self._monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+                self._monitor.filter_by("tty")
+                self._monitor.start()
+                loop.add_reader(self._monitor.fileno(), self._on_udev)
+                self.backend = "udev"
+                return
+            except (OSError, ValueError):
+                self._monitor = None
+        if os.path.isdir("/dev"):
+            self._task = loop.create_task(self._watch_dev())
+            self.backend = "/dev"
+        else:
+            self._task = loop.create_task(self._poll_comports())
+            self.backend = "comports"
+
+    def stop(self):
+        if self._monitor is not None:
+            asyncio.get_running_loop().remove_reader(self._monitor.fileno())
+            self._monitor = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait(self, timeout):
+        """Returns True when ports changed within `timeout` seconds, else False."""
+        self.changed.clear()
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _on_udev(self):
+        while self._monitor is not None and self._monitor.poll(timeout=0) is not None:
+            self.changed.set()
+
+    async def _watch_dev(self):
+        last = os.stat("/dev").st_mtime_ns
+        while True:
+            await asyncio.sleep(DEV_POLL_INTERVAL)
+            try:
+                current = os.stat("/dev").st_mtime_ns
+            except OSError:
+                continue
+            if current != last:
+                last = current
+                self.changed.set()
+
+    async def _poll_comports(self):
+        last = None
+        while True:
+            devices = {info.device for info in await discovery.list_ports()}
+            if last is not None and devices != last:
+                self.changed.set()
+            last = devices
+            await asyncio.sleep(COMPORTS_POLL_INTERVAL)
+
+
+class LinkSupervisor:
+    """Reconnects one PanelClient after a lost link and restores the requested state.
+
+    on_event(kind, text) is called on the event loop with kind 'lost',
+    'retry', 'reconnected', 'reapplied', 'recovered' or 'failed' (resync
+    error; the link is up but the requested state could not be restored).
+    """
+
+    def __init__(self, client, reset=False, on_event=None):
+        self.client = client
+        self.name = client.port # Metric label; stays the same if the device name changes
+        self.reset = reset # Reconnect without resetting the board, so a running panel keeps its state
+        self.on_event = on_event
+        self.usb_key = None
+        self.desired_angle = None # Last position requested through the client
+        self.desired_led = None
+        self.desired_level = None # Last brightness requested (v1.7); a board that reset comes back at full
+        self.recoveries = [] # Seconds per completed recovery
+        self.watcher = None
+        self._task = None
+        client.add_traffic_listener(self._on_traffic)
+        client.add_disconnect_listener(self._on_lost)
+
+    @property
+    def recovering(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts supervising; call on the loop once the client is connected."""
+        if self.watcher is None:
+            self.watcher = PortWatcher()
+            self.watcher.start()
+            asyncio.get_running_loop().create_task(self._remember_port(self.client.port))
+
+    def stop(self):
+        """Stops supervising (call before closing the client on purpose)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.client.remove_traffic_listener(self._on_traffic)
+        self.client.remove_disconnect_listener(self._on_lost)
+
+    async def close(self):
+        """stop(), then closes the client."""
+        self.stop()
+        await self.client.close()
+
+    def _event(self, kind, text):
+        if self.on_event:
+            self.on_event(kind, text)
+
+    def _on_traffic(self, data, sent):
+        if not sent:
+            return
+        command = data.decode("ascii", errors="replace").strip()
+        if command == protocol.COMMAND_OPEN:
+            self.desired_angle = protocol.MAX_ANGLE
+        elif command == protocol.COMMAND_CLOSE:
+            self.desired_angle = protocol.MIN_ANGLE
+        elif command.startswith(protocol.COMMAND_SETPOS_PREFIX):
+            angle = _to_int(command[len(protocol.COMMAND_SETPOS_PREFIX):])
+            if angle is not None and protocol.MIN_ANGLE <= angle <= protocol.MAX_ANGLE:
+                self.desired_angle = angle # Out-of-range requests are rejected by the firmware
+        elif command in (protocol.COMMAND_STOP, protocol.COMMAND_ABORT):
+            self.desired_angle = None # Stopped on purpose: stay wherever the cover is
+        elif command.startswith(protocol.COMMAND_SETLED_PREFIX):
+            on, sep, level = command[len(protocol.COMMAND_SETLED_PREFIX):].partition(":")
+            self.desired_led = _to_int(on) not in (0, None)
+            level = _to_int(level) if sep else None
+            if level is not None and 0 <= level <= protocol.MAX_BRIGHTNESS:
+                self.desired_level = level # Without a level the firmware keeps its current one
+
+    def _on_lost(self, error):
+        if self.watcher is None or self.recovering:
+            return
+        self._event("lost", f"Link to {self.client.port} lost ({error}); reconnecting")
+        self._task = asyncio.get_running_loop().create_task(self._recover(time.monotonic()))
+
+    async def _remember_port(self, device):
+        # comports() can take seconds on some systems; until it answers, the device path is used
+        for info in await discovery.list_ports():
+            if info.device == device:
+                self.usb_key = discovery.port_key(info)
+
+    async def _find_port(self):
+        """The panel's current device name, or None while it is absent."""
+        ports = await discovery.list_ports()
+        if self.usb_key:
+            for info in ports:
+                if discovery.port_key(info) == self.usb_key:
+                    return info.device
+            return None
+        return self.client.port if os.path.exists(self.client.port) else None # Non-USB port or a symlink
+
+    async def _recover(self, lost_at):
+        delay = BACKOFF_START
+        attempts = 0
+        while True:
+            port = await self._find_port()
+            if port is not None:
+                attempts += 1
+                self.client.port = port
+                try:
+                    await self.client.connect(reset=self.reset, timeout=RECONNECT_TIMEOUT)
+                    break
+                except (PanelError, OSError, serial.SerialException) as e:
+                    self._event("retry", f"Reconnect attempt {attempts} to {port} failed: {e}; next in {delay:.1f} s")
+            # Sleep out the backoff, but try at once when a port appears
+            await self.watcher.wait(delay)
+            delay = min(delay * 2, BACKOFF_MAX)
+        self._event("reconnected", f"Reconnected to {self.client.port} after {time.monotonic() - lost_at:.1f} s")
+        try:
+            await self._resync()
+        except PanelError as e:
+            self._event("failed", f"Reconnected, but could not restore the panel state: {e}")
+            return
+        elapsed = time.monotonic() - lost_at
+        self.recoveries.append(elapsed)
+        LINK_RECOVERY.labels(self.name).observe(elapsed)
+        self._event("recovered", f"Recovered in {elapsed:.1f} s ({attempts} attempts)")
+
+    async def _resync(self):
+        """Reads the panel's state and re-applies the last requested position, LED state and brightness."""
+        angle, led = await self.client.get_status(max_age=float("inf")) # Boot status if the board reset
+        if self.desired_angle is not None and abs(angle - self.desired_angle) >= 1:
+            self._event("reapplied", f"Panel at {angle}; moving back to {self.desired_angle}")
+            angle, led = await self.client.set_position(self.desired_angle)
+        level = self.client.state.led_level
+        if self.desired_level is not None and level is not None and level != self.desired_level:
+            self._event("reapplied", f"LED brightness {level}; setting it back to {self.desired_level}")
+            await self.client.set_led(bool(self.desired_led), self.desired_level)
+        elif self.desired_led is not None and led != self.desired_led:
+            self._event("reapplied", f"Turning the LED {'on' if self.desired_led else 'off'} again")
+            await self.client.set_led(self.desired_led, self.desired_level)
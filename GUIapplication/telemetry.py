@@ -0,0 +1,349 @@
+"""Motion telemetry: sample ring buffer, move timing checks and a live plot.
+
+With COMMAND:TELEMETRY:1 the firmware prints T:<millis>:<angle>:<led> when a
+move starts and after every degree. TelemetryRecorder keeps those samples
+(and every status line) in a fixed-size SampleRing and hands each finished
+move to MoveMonitor, which flags moves whose duration is off the plan (the
+duration announced in RESULT:MOVE:START from firmware v1.6, MOVEMENT_DELAY
+per degree before): a board that stalls on serial output, restarts mid-move
+or runs modified firmware shows up here. The samples report the
+angle written to the servo; the firmware has no position feedback.
+
+    recorder = TelemetryRecorder(on_move=print)
+    client.add_message_listener(recorder.feed)  # or feed() from the GUI thread
+    times, angles, leds = recorder.ring.snapshot()
+"""
+import array
+import bisect
+import collections
+import time
+
+try:
+    import numpy
+except ImportError: # Optional: only needed for SampleRing.to_numpy()
+    numpy = None
+
+import protocol
+
+# --- Constants ---
+DEFAULT_CAPACITY = 4096 # Samples kept; a full 160-degree move is 161
+DURATION_TOLERANCE = 0.1 # Fraction a move may deviate from its planned duration
+DURATION_SLACK = 0.05 # Seconds always allowed on top (serial output, rounding of millis(), MOTION_INTERVAL)
+STALL_GAP = 5 # Before v1.6: a gap of this many MOVEMENT_DELAYs between samples counts as a stall
+STALL_TIME = 0.25 # v1.6: seconds without a sample that count as a stall (the first degree alone takes ~90 ms)
+REPORT_HISTORY = 100 # MoveReports kept by TelemetryRecorder
+PLOT_MAX_FPS = 10 # Upper bound on plot redraws per second
+PLOT_WINDOW = 10.0 # Seconds of history shown
+PLOT_IDLE_REDRAW = 1.0 # Seconds between redraws that only scroll the time axis (while samples are in the window)
+# --- End Constants ---
+
+
+class SampleRing:
+    """Fixed-size ring of (time, angle, led) in typed arrays; the oldest samples are overwritten."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = array.array("d", bytes(8 * capacity)) # time.monotonic() seconds
+        self.angles = array.array("h", bytes(2 * capacity))
+        self.leds = array.array("b", bytes(capacity))
+        self.version = 0 # Bumped on every append, so readers can skip unchanged data
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, angle, led):
+        index = self._next
+        self.times[index] = timestamp
+        self.angles[index] = angle
+        self.leds[index] = 1 if led else 0
+        self._next = (index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        self.version += 1
+
+    def clear(self):
+        self._next = self._count = 0
+        self.version += 1
+
+    def latest(self):
+        """The newest (time, angle, led), or None when empty."""
+        if not self._count:
+            return None
+        index = self._next - 1
+        return self.times[index], self.angles[index], bool(self.leds[index])
+
+    def snapshot(self, since=None):
+        """Copies of (times, angles, leds) in time order, optionally only samples at or after `since`."""
+        start = (self._next - self._count) % self.capacity
+        end = start + self._count
+        if end <= self.capacity:
+            parts = [(start, end)]
+        else:
+            parts = [(start, self.capacity), (0, end - self.capacity)]
+        times, angles, leds = array.array("d"), array.array("h"), array.array("b")
+        for lo, hi in parts:
+            times += self.times[lo:hi]
+            angles += self.angles[lo:hi]
+            leds += self.leds[lo:hi]
+        if since is not None:
+            first = bisect.bisect_left(times, since)
+            times, angles, leds = times[first:], angles[first:], leds[first:]
+        return times, angles, leds
+
+    def to_numpy(self, since=None):
+        """snapshot() as NumPy arrays (no copy beyond the snapshot). Requires NumPy."""
+        if numpy is None:
+            raise ImportError("NumPy is not installed")
+        times, angles, leds = self.snapshot(since)
+        return (numpy.frombuffer(times, dtype=numpy.float64), numpy.frombuffer(angles, dtype=numpy.int16),
+                numpy.frombuffer(leds, dtype=numpy.int8).astype(bool))
+
+
+class MoveReport:
+    """Timing of one move, measured on the board's clock."""
+
+    __slots__ = ("start_angle", "end_angle", "duration", "expected", "max_gap", "complete", "stopped", "stall_limit")
+
+    def __init__(self, start_angle, end_angle, duration, expected, max_gap, complete, stopped=False,
+                 stall_limit=STALL_GAP * protocol.MOVEMENT_DELAY / 1000.0):
+        self.start_angle = start_angle
+        self.end_angle = end_angle
+        self.duration = duration # Seconds from the start sample to the last sample
+        self.expected = expected # Planned seconds (degrees * MOVEMENT_DELAY before v1.6)
+        self.max_gap = max_gap # Longest pause between two samples, seconds
+        self.complete = complete # False if the move ended without its final status line
+        self.stopped = stopped # Ended early by STOP or a newer move; the duration is not checked
+        self.stall_limit = stall_limit # max_gap above this counts as a stall
+
+    @property
+    def deviation(self):
+        """Relative duration error, e.g. 0.25 for a move 25% slower than expected."""
+        return self.duration / self.expected - 1.0 if self.expected else 0.0
+
+    @property
+    def ok(self):
+        allowed = self.expected * DURATION_TOLERANCE + DURATION_SLACK
+        on_time = self.stopped or abs(self.duration - self.expected) <= allowed
+        return self.complete and self.max_gap <= self.stall_limit and on_time
+
+    def __str__(self):
+        text = (f"Move {self.start_angle}\N{DEGREE SIGN} -> {self.end_angle}\N{DEGREE SIGN} took "
+                f"{self.duration:.2f} s (expected {self.expected:.2f} s, {self.deviation:+.0%})")
+        if not self.complete:
+            text += ", interrupted"
+        elif self.stopped:
+            text += ", stopped early"
+        elif not self.ok:
+            text += f", longest pause {self.max_gap * 1000:.0f} ms"
+        return text
+
+
+class MoveMonitor:
+    """Turns a stream of Sample/Status (and v1.6 MoveStart/MoveEnd) messages into one MoveReport per move."""
+
+    def __init__(self):
+        self._first = None
+        self._last = None
+        self._max_gap = 0
+        self._plan = None # MoveStart of the running v1.6 move
+
+    @property
+    def moving(self):
+        return self._first is not None
+
+    def feed(self, message):
+        """Returns a MoveReport when `message` ends a move, else None."""
+        if isinstance(message, protocol.Sample):
+            report = None
+            if self._last is not None and message.millis < self._last.millis:
+                report = self._finish(complete=False) # millis() restarted: the board was reset
+            if self._first is None:
+                self._first, self._max_gap = message, 0
+            else:
+                self._max_gap = max(self._max_gap, message.millis - self._last.millis)
+            self._last = message
+            return report
+        if isinstance(message, protocol.MoveStart):
+            report = self._finish(complete=False) if self._first is not None else None # Its end was lost
+            self._plan = message
+            return report
+        if isinstance(message, protocol.MoveEnd):
+            report = None
+            if self._first is not None:
+                report = self._finish(complete=message.angle == self._last.angle, stopped=message.stopped)
+            self._plan = None
+            return report
+        if isinstance(message, protocol.Status) and self._first is not None and self._plan is None:
+            return self._finish(complete=message.angle == self._last.angle) # Firmware without MOVE lines
+        return None
+
+    def _finish(self, complete, stopped=False):
+        first, last, plan = self._first, self._last, self._plan
+        self._first = self._last = self._plan = None
+        duration = (last.millis - first.millis) / 1000.0
+        if plan is not None:
+            return MoveReport(first.angle, last.angle, duration, plan.duration / 1000.0, self._max_gap / 1000.0,
+                              complete, stopped, STALL_TIME)
+        degrees = abs(last.angle - first.angle)
+        return MoveReport(first.angle, last.angle, duration, degrees * protocol.MOVEMENT_DELAY / 1000.0,
+                          self._max_gap / 1000.0, complete)
+
+
+class TelemetryRecorder:
+    """Feeds received messages into a SampleRing and a MoveMonitor.
+
+    Sample times are mapped from the board's millis() onto time.monotonic()
+    once per move, so the ring stays in time order across resets and the
+    intervals within a move keep the board's precision.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, on_move=None):
+        self.ring = SampleRing(capacity)
+        self.monitor = MoveMonitor()
+        self.on_move = on_move # on_move(MoveReport) for every finished move
+        self.reports = collections.deque(maxlen=REPORT_HISTORY)
+        self._offset = None # monotonic() - millis/1000 for the current move
+
+    def feed(self, message):
+        now = time.monotonic()
+        report = self.monitor.feed(message)
+        if isinstance(message, protocol.Sample):
+            if self._offset is None or report is not None: # First sample of a move, or millis() restarted
+                self._offset = now - message.millis / 1000.0
+            timestamp = self._offset + message.millis / 1000.0
+            latest = self.ring.latest()
+            if latest is not None and timestamp < latest[0]:
+                timestamp = latest[0] # Keep the ring in time order
+            self.ring.append(timestamp, message.angle, message.led)
+        elif isinstance(message, protocol.Status):
+            if not self.monitor.moving: # A status read during a v1.6 move keeps the move's clock mapping
+                self._offset = None
+            self.ring.append(now, message.angle, message.led)
+        if report is not None:
+            self.reports.append(report)
+            if self.on_move:
+                self.on_move(report)
+        return report
+
+
+def decimate(times, values, t0, t1, width):
+    """Reduces a series to at most four points per pixel column (first, min, max, last).
+
+    The line drawn through the result looks the same as one through every
+    sample, but the number of canvas points is bounded by the plot width.
+    """
+    if t1 <= t0 or width <= 0:
+        return []
+    scale = width / (t1 - t0)
+    points = []
+    column = first = low = high = last = None
+    for t, value in zip(times, values):
+        x = int((t - t0) * scale)
+        if x != column:
+            if column is not None:
+                points += _column_points(column, first, low, high, last)
+            column, first, low, high = x, value, value, value
+        elif value < low:
+            low = value
+        elif value > high:
+            high = value
+        last = value
+    if column is not None:
+        points += _column_points(column, first, low, high, last)
+    return points
+
+
+def _column_points(x, first, low, high, last):
+    # Visit the extremes in the direction of travel so the line does not zig-zag inside one column
+    values = (first, low, high, last) if first <= last else (first, high, low, last)
+    points = []
+    for value in values:
+        if not points or value != points[-1][1]:
+            points.append((x, value))
+    return points
+
+
+class TelemetryPlot:
+    """Live angle-vs-time plot of a SampleRing on a tk.Canvas, redrawn at most max_fps times a second.
+
+    Nothing runs on a timer while the plot is static: request() schedules a
+    redraw when samples arrive, and the time axis only keeps scrolling until
+    the last sample has left the window.
+    """
+
+    def __init__(self, canvas, ring, window=PLOT_WINDOW, max_fps=PLOT_MAX_FPS):
+        self.canvas = canvas
+        self.ring = ring
+        self.window = window
+        self.interval = max(1, int(1000 / max_fps))
+        self._drawn_at = 0.0
+        self._after_id = None
+        self._grid = []
+        self._line = canvas.create_line(0, 0, 0, 0, fill="dark orange", width=2, state="hidden")
+        canvas.bind("<Configure>", lambda event: self.redraw(force=True), add="+")
+
+    def request(self):
+        """Schedules one redraw for new samples; requests before it runs share it. Call from the Tk thread."""
+        if self._after_id is not None:
+            return
+        wait = int(self.interval - (time.monotonic() - self._drawn_at) * 1000)
+        self._after_id = self.canvas.after(wait, self._draw) if wait > 0 else self.canvas.after_idle(self._draw)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.canvas.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _draw(self):
+        self._after_id = None
+        self.redraw()
+
+    def _y(self, angle, height):
+        span = protocol.MAX_ANGLE - protocol.MIN_ANGLE
+        return height - 4 - (angle - protocol.MIN_ANGLE) * (height - 8) / span
+
+    def _draw_grid(self, width, height):
+        for item in self._grid:
+            self.canvas.delete(item)
+        self._grid = []
+        for angle in (protocol.MIN_ANGLE, protocol.MAX_ANGLE):
+            y = self._y(angle, height)
+            self._grid.append(self.canvas.create_line(0, y, width, y, fill="grey80", dash=(2, 2)))
+            self._grid.append(self.canvas.create_text(2, y, text=f"{angle}\N{DEGREE SIGN}", anchor="w",
+                                                      fill="grey50", font=("TkDefaultFont", 7)))
+        self.canvas.tag_raise(self._line)
+
+    def redraw(self, force=False):
+        """Redraws the window ending now; force also redraws the grid (after a resize)."""
+        now = time.monotonic()
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width < 10 or height < 10:
+            return
+        if force or not self._grid:
+            self._draw_grid(width, height)
+        self._drawn_at = now
+        t0 = now - self.window
+        times, angles, _ = self.ring.snapshot()
+        if times and times[-1] > t0 and self._after_id is None:
+            # The line still moves left; scroll slowly until its last sample is out of the window
+            self._after_id = self.canvas.after(int(PLOT_IDLE_REDRAW * 1000), self._draw)
+        first = bisect.bisect_left(times, t0)
+        if first:
+            # Hold the angle from before the window at its left edge
+            first -= 1
+            times[first] = t0
+        times, angles = times[first:], angles[first:]
+        if angles:
+            times.append(now) # ...and the last known angle up to "now"
+            angles.append(angles[-1])
+        points = decimate(times, angles, t0, now, width)
+        if len(points) < 2:
+            self.canvas.itemconfigure(self._line, state="hidden")
+            return
+        coords = []
+        for x, angle in points:
+            coords += (x, self._y(angle, height))
+        self.canvas.coords(self._line, *coords)
+        self.canvas.itemconfigure(self._line, state="normal")
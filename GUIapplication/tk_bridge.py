@@ -0,0 +1,137 @@
+"""Wakes the Tk main loop when another thread has something for it.
+
+The GUIs used to poll their message queue with after(100): every reply
+waited up to 100 ms for the next poll, and the timer kept firing while the
+panel was idle. WakeupQueue instead writes one byte to a pipe that Tk
+watches with createfilehandler(), so the queue is drained in the very next
+pass of the event loop and nothing runs while nothing arrives. Consecutive
+puts before that pass share one wakeup. Where Tk has no file handlers
+(Windows) it falls back to polling.
+
+ViewCache remembers what was last applied to each widget and variable, so a
+burst of messages that all say the same thing reconfigures nothing.
+"""
+import os
+import threading
+import tkinter as tk
+
+import metrics
+
+# --- Constants ---
+FALLBACK_POLL_INTERVAL = 100 # Milliseconds between polls where Tk cannot watch a pipe
+# --- End Constants ---
+
+
+class WakeupQueue(metrics.MeteredQueue):
+    """MeteredQueue whose put() (from any thread) makes the Tk thread call callback().
+
+    callback drains the queue with get_nowait(). If it leaves items behind on
+    purpose, wake() schedules another pass after Tk has handled its own events.
+    """
+
+    def __init__(self, widget, callback):
+        super().__init__()
+        self.widget = widget
+        self.callback = callback
+        self.wakeups = 0 # Passes of callback() triggered by puts
+        self._signalled = False # A wakeup is on its way; further puts need not send one
+        self._signal_lock = threading.Lock()
+        self._pipe = None
+        self._poll_id = None
+        try:
+            read_fd, write_fd = os.pipe()
+        except OSError:
+            read_fd = write_fd = None
+        if read_fd is not None:
+            try:
+                widget.tk.createfilehandler(read_fd, tk.READABLE, self._on_readable)
+                os.set_blocking(write_fd, False)
+                self._pipe = (read_fd, write_fd)
+            except (AttributeError, tk.TclError, NotImplementedError):
+                os.close(read_fd)
+                os.close(write_fd)
+        if self._pipe is None:
+            self._poll_id = widget.after(FALLBACK_POLL_INTERVAL, self._poll)
+
+    def _put(self, item):
+        super()._put(item)
+        self.wake()
+
+    def wake(self):
+        """Asks the Tk thread for a pass of callback(). Safe from any thread."""
+        with self._signal_lock:
+            if self._signalled or self._pipe is None:
+                return
+            self._signalled = True
+            try:
+                os.write(self._pipe[1], b"x")
+            except OSError:
+                self._signalled = False # Closed, or the pipe is full of wakeups already
+
+    def _on_readable(self, fd, mask):
+        try:
+            os.read(fd, 4096)
+        except OSError:
+            pass
+        with self._signal_lock:
+            self._signalled = False # Puts from here on send a new wakeup
+        self.wakeups += 1
+        self.callback()
+
+    def _poll(self):
+        self._poll_id = None
+        if self.qsize():
+            self.callback()
+        self._poll_id = self.widget.after(FALLBACK_POLL_INTERVAL, self._poll)
+
+    def close(self):
+        """Stops the wakeups. Call from the Tk thread before the widget is destroyed."""
+        if self._poll_id is not None:
+            self.widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        with self._signal_lock:
+            pipe, self._pipe = self._pipe, None
+        if pipe:
+            try:
+                self.widget.tk.deletefilehandler(pipe[0])
+            except tk.TclError:
+                pass
+            os.close(pipe[0])
+            os.close(pipe[1])
+
+
+class ViewCache:
+    """Applies widget options and variable values only when they differ from the last ones applied.
+
+    Only correct as long as the widgets and variables it manages are not also
+    changed directly; forget() drops the memory of one widget.
+    """
+
+    def __init__(self):
+        self._applied = {} # (widget path, option) -> value
+        self.skipped = 0 # Updates that changed nothing and were not applied
+
+    def configure(self, widget, **options):
+        """widget.configure() with just the options whose value changed; returns True if any did."""
+        key = str(widget)
+        changed = {name: value for name, value in options.items() if self._applied.get((key, name), self) != value}
+        self.skipped += len(options) - len(changed)
+        if not changed:
+            return False
+        widget.configure(**changed)
+        for name, value in changed.items():
+            self._applied[(key, name)] = value
+        return True
+
+    def set(self, variable, value):
+        """variable.set(value) unless it already holds value; returns True if it changed."""
+        if variable.get() == value:
+            self.skipped += 1
+            return False
+        variable.set(value)
+        return True
+
+    def forget(self, widget):
+        key = str(widget)
+        for applied in [applied for applied in self._applied if applied[0] == key]:
+            del self._applied[applied]
@@ -0,0 +1,234 @@
+"""Compact binary recording of the serial traffic, with mmap reading and replay.
+
+TrafficRecorder taps a PanelClient and appends every line written to or read
+from the panel to an append-only file. Each record is a fixed 11-byte header
+(time.monotonic() as a double, a direction byte, the payload length) followed
+by the line without its terminator:
+
+    '>'  line sent to the panel      '<'  line received from the panel
+    'S'  session start: port and wall-clock time, written when a client attaches
+    '!'  event: link lost, client detached
+
+Records go out with one os.write() each on an O_APPEND descriptor, so a crash
+loses at most the line being written and TrafficLog stops cleanly at a torn
+tail. Timestamps are only comparable within one session (monotonic clocks
+restart with the machine); replay re-bases them at every 'S' record.
+
+    python3 traffic_log.py dump night.fptl | less
+    python3 traffic_log.py replay night.fptl --speed 60      # an hour per minute
+    python3 traffic_log.py replay night.fptl --speed 0       # as fast as possible; reports the parse rate
+
+Set TRAFFIC_LOG in either GUI, or pass --record to alpaca_server.py, to record.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import protocol
+from panel_state import PanelState
+
+# --- Constants ---
+MAGIC = b"FPTRAF\x00\x01" # File signature and format version
+RECORD = struct.Struct("<dcH") # monotonic seconds, direction, payload length
+SENT = b">"
+RECEIVED = b"<"
+SESSION = b"S"
+EVENT = b"!"
+# --- End Constants ---
+
+
+class TrafficRecorder:
+    """Appends the traffic of attached PanelClients to one file."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, MAGIC)
+        self.records = 0
+        self.errors = 0 # Writes that failed (disk full, ...); recording never breaks the link
+        self._clients = {} # client -> (traffic listener, disconnect listener)
+
+    def record(self, direction, payload, timestamp=None):
+        if self._fd is None:
+            return
+        payload = payload[:0xFFFF]
+        header = RECORD.pack(time.monotonic() if timestamp is None else timestamp, direction, len(payload))
+        try:
+            os.write(self._fd, header + payload)
+            self.records += 1
+        except OSError:
+            self.errors += 1
+
+    def attach(self, client):
+        """Starts recording `client` (call before it connects, so the boot lines are included)."""
+
+        def on_traffic(data, sent):
+            self.record(SENT if sent else RECEIVED, data.rstrip(b"\r\n"))
+
+        def on_lost(error):
+            self.record(EVENT, f"lost: {error}".encode("utf-8", errors="replace"))
+
+        self._clients[client] = (on_traffic, on_lost)
+        client.add_traffic_listener(on_traffic)
+        client.add_disconnect_listener(on_lost)
+        wall = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.record(SESSION, f"{client.port} {wall} {client.baud_rate}".encode("utf-8", errors="replace"))
+
+    def detach(self, client):
+        listeners = self._clients.pop(client, None)
+        if listeners is not None:
+            client.remove_traffic_listener(listeners[0])
+            client.remove_disconnect_listener(listeners[1])
+            self.record(EVENT, b"detached")
+
+    def close(self):
+        for client in list(self._clients):
+            self.detach(client)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TrafficLog:
+    """Read-only, memory-mapped view of a recording; iterating yields (timestamp, direction, payload)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a traffic recording")
+        self.torn_bytes = 0 # Incomplete record at the end (crash mid-write)
+
+    def __iter__(self):
+        data = self._map
+        offset = len(MAGIC)
+        end = len(data)
+        header_size = RECORD.size
+        unpack = RECORD.unpack_from
+        while offset + header_size <= end:
+            timestamp, direction, length = unpack(data, offset)
+            start = offset + header_size
+            if start + length > end:
+                break
+            yield timestamp, direction, data[start:start + length]
+            offset = start + length
+        self.torn_bytes = end - offset
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay:
+    """Feeds a recording through protocol.parse() and a PanelState as the client would have.
+
+    speed is the time-lapse factor (1 = real time, 0 = no waiting). on_record(
+    timestamp, direction, payload, message) is called for every record;
+    message is the parsed protocol.Message for received lines, else None.
+    """
+
+    def __init__(self, path, speed=1.0, on_record=None):
+        self.path = path
+        self.speed = speed
+        self.on_record = on_record
+        self.state = PanelState()
+        self.counts = {SENT: 0, RECEIVED: 0, SESSION: 0, EVENT: 0}
+        self.rejections = 0
+        self.unknown = 0
+        self.parse_time = 0.0 # Seconds spent in parse() and PanelState.feed()
+        self.elapsed = 0.0
+        self.torn_bytes = 0
+
+    def run(self):
+        start = time.monotonic()
+        base = None # (recorded timestamp, replay clock) of the current session's first record
+        parse = protocol.parse
+        feed = self.state.feed
+        log = TrafficLog(self.path)
+        try:
+            for timestamp, direction, payload in log:
+                self.counts[direction] = self.counts.get(direction, 0) + 1
+                if direction == SESSION or base is None:
+                    base = (timestamp, time.monotonic())
+                    if direction == SESSION:
+                        self.state.invalidate() # New connection; the board may have been reset
+                elif self.speed > 0:
+                    delay = base[1] + (timestamp - base[0]) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                message = None
+                if direction == RECEIVED:
+                    parse_start = time.perf_counter()
+                    message = parse(payload.decode("ascii", errors="replace").strip())
+                    feed(message)
+                    self.parse_time += time.perf_counter() - parse_start
+                    if protocol.is_rejection(message):
+                        self.rejections += 1
+                    elif isinstance(message, protocol.Unknown):
+                        self.unknown += 1
+                elif direction == EVENT:
+                    self.state.invalidate()
+                if self.on_record:
+                    self.on_record(timestamp, direction, payload, message)
+            self.torn_bytes = log.torn_bytes
+        finally:
+            log.close()
+            self.elapsed = time.monotonic() - start
+        return self
+
+    def summary(self):
+        received = self.counts[RECEIVED]
+        rate = received / self.parse_time if self.parse_time else 0.0
+        return (f"{self.counts[SESSION]} sessions, {self.counts[SENT]} lines sent, {received} received "
+                f"({self.rejections} rejections, {self.unknown} unknown), {self.counts[EVENT]} events; "
+                f"replayed in {self.elapsed:.2f} s, parse+state {rate:,.0f} lines/s; final state {self.state}"
+                + (f"; {self.torn_bytes} torn bytes at the end" if self.torn_bytes else ""))
+
+
+def _print_record(timestamp, direction, payload, message=None):
+    text = bytes(payload).decode("ascii", errors="replace")
+    print(f"{timestamp:14.3f} {direction.decode()} {text}")
+
+
+# --- Main Execution ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay a serial traffic recording.")
+    parser.add_argument("action", choices=["dump", "replay"], help="dump: print every record; replay: run it through the parser and state cache")
+    parser.add_argument("path", help="Recording file")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay time-lapse factor (0 = as fast as possible)")
+    parser.add_argument("--verbose", action="store_true", help="Print records and state while replaying")
+    args = parser.parse_args()
+
+    if args.action == "dump":
+        with TrafficLog(args.path) as traffic:
+            for record in traffic:
+                _print_record(*record)
+            if traffic.torn_bytes:
+                print(f"({traffic.torn_bytes} torn bytes at the end)")
+    else:
+        def show(timestamp, direction, payload, message):
+            _print_record(timestamp, direction, payload)
+            if message is not None and message.__class__ in (protocol.Status, protocol.State):
+                print(f"{'':16} -> {replay.state}")
+        replay = Replay(args.path, args.speed, show if args.verbose else None)
+        try:
+            replay.run()
+        except KeyboardInterrupt:
+            pass
+        print(replay.summary())